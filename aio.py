@@ -0,0 +1,614 @@
+# Author: Kun Xi <kunxi@kunxi.org>
+# License: Python Software Foundation License
+
+"""
+Non-blocking versions of the `ecs` operations.
+
+Every operation of `ecs` has its counterpart here, with the same
+arguments, returning a `Future` instead of blocking in `ecs.query`.
+The requests are sent by a `Loop`, an asyncore event loop with
+keep-alive connections, running in its own thread; one loop thread
+serves any number of concurrent requests.
+
+The responses are unmarshalled by the very same `ecs` code: the `ecs`
+function runs until it needs a response that is not fetched yet, the
+loop fetches it, then the function is run again with the response at
+hand. Each response is therefore parsed once, the `buildRequest` part
+is repeated. `forEach` walks a `pagedIterator` the same way. The
+function is run with the `ecs.ECSClient` of the calling thread, so
+``ecs.withClient(client, aio.ItemSearch, 'python')`` signs its requests
+with the keys of `client`.
+
+Classes:
+
+- `Future`, the result of an operation to come
+- `Loop`, the asyncore loop sending the requests
+
+Functions:
+
+- `getLoop`
+- `call`
+- `forEach`
+- one function per `ecs` operation, like `ItemSearch`, `XMLItemSearch`
+
+Example::
+
+    books = aio.ItemSearch('python', SearchIndex='Books').result()
+    aio.forEach(books, lambda book: titles.append(book.Title)).result()
+
+Notice: never wait for a `Future` in a callback, the callbacks run in
+the loop thread.
+"""
+
+import asyncore, socket, errno, threading, time, sys, urlparse, traceback, Queue, heapq
+import ecs
+
+
+class Future:
+    """The result of an operation to come"""
+
+    def __init__(self):
+        self.__event = threading.Event()
+        self.__lock = threading.Lock()
+        self.__callbacks = []
+        self.__result = None
+        self.__excinfo = None
+
+    def set(self, result):
+        """Complete the future with `result`"""
+        self.__result = result
+        self.__complete()
+
+    def fail(self, excinfo=None):
+        """Complete the future with the exception `excinfo`, default to
+        sys.exc_info()"""
+        self.__excinfo = excinfo or sys.exc_info()
+        self.__complete()
+
+    def done(self):
+        return self.__event.isSet()
+
+    def result(self, timeout=None):
+        """Wait for the future and return its result, or raise its
+        exception. socket.timeout is raised after `timeout` seconds."""
+        self.__event.wait(timeout)
+        if not self.__event.isSet():
+            raise socket.timeout('the operation is not done')
+        if self.__excinfo:
+            raise self.__excinfo[0], self.__excinfo[1], self.__excinfo[2]
+        return self.__result
+
+    def exception(self):
+        """Return the exception of a failed future, or None"""
+        return self.__excinfo and self.__excinfo[1]
+
+    def addCallback(self, callback):
+        """Call `callback(future)` once the future is done, the exception
+        raised by `callback` is printed"""
+        self.__lock.acquire()
+        try:
+            if not self.__event.isSet():
+                self.__callbacks.append(callback)
+                return
+        finally:
+            self.__lock.release()
+        callback(self)
+
+    def __complete(self):
+        self.__lock.acquire()
+        try:
+            self.__event.set()
+            callbacks, self.__callbacks = self.__callbacks, []
+        finally:
+            self.__lock.release()
+        for callback in callbacks:
+            try:
+                callback(self)
+            except:
+                traceback.print_exc()
+
+
+class PendingResponse(BaseException):
+    """Raised by the transport of `call` when the response is not
+    fetched yet. It is not an `Exception`, so no handler in between
+    swallows it."""
+
+    def __init__(self, url):
+        BaseException.__init__(self, url)
+        self.url = url
+
+
+class _Trigger(asyncore.dispatcher):
+    """Wake the loop up from another thread"""
+
+    def __init__(self, map):
+        reader, self.writer = socket.socketpair()
+        asyncore.dispatcher.__init__(self, reader, map)
+
+    def pull(self):
+        try:
+            self.writer.send('x')
+        except socket.error:
+            pass
+
+    def writable(self):
+        return False
+
+    def handle_read(self):
+        try:
+            self.recv(4096)
+        except socket.error:
+            pass
+
+
+class _Channel(asyncore.dispatcher):
+    """A keep-alive HTTP/1.1 connection, one request at a time"""
+
+    def __init__(self, loop, key, address):
+        asyncore.dispatcher.__init__(self, map=loop.map)
+        self.loop = loop
+        self.key = key
+        self.reused = False
+        self.request = None
+        self.deadline = None
+        self.released = time.time()
+        self.outgoing = ''
+        self.create_socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.connect(address)
+
+    def send_request(self, request):
+        """request: [url, host, path, future]"""
+        url, host, path, future = request
+        self.request = request
+        self.incoming = ''
+        self.status = None
+        self.length = None
+        self.chunked = False
+        self.closing = False
+        self.body = []
+        self.deadline = time.time() + self.loop.timeout
+        self.outgoing = ('GET %s HTTP/1.1\r\nHost: %s\r\nAccept-Encoding: identity\r\n'
+            'User-Agent: pyaws\r\n\r\n' % (path, host))
+
+    def handle_connect(self):
+        pass
+
+    def writable(self):
+        return not self.connected or bool(self.outgoing)
+
+    def handle_write(self):
+        sent = self.send(self.outgoing)
+        self.outgoing = self.outgoing[sent:]
+
+    def handle_read(self):
+        data = self.recv(65536)
+        if self.request is None:
+            # an idle connection must be quiet
+            self.close()
+            return
+        if not data:
+            return
+        self.incoming = self.incoming + data
+        self.parse()
+
+    def parse(self):
+        if self.status is None:
+            end = self.incoming.find('\r\n\r\n')
+            if end < 0:
+                return
+            lines = self.incoming[:end].split('\r\n')
+            self.incoming = self.incoming[end + 4:]
+            self.version, self.status = lines[0].split(' ', 2)[:2]
+            self.status = int(self.status)
+            headers = {}
+            for line in lines[1:]:
+                name, value = line.split(':', 1)
+                headers[name.strip().lower()] = value.strip()
+            self.closing = (headers.get('connection', '').lower() == 'close'
+                or (self.version == 'HTTP/1.0' and headers.get('connection', '').lower() != 'keep-alive'))
+            self.chunked = headers.get('transfer-encoding', '').lower() == 'chunked'
+            if headers.has_key('content-length'):
+                self.length = int(headers['content-length'])
+            elif not self.chunked:
+                self.closing = True
+
+        if self.chunked:
+            while True:
+                end = self.incoming.find('\r\n')
+                if end < 0:
+                    return
+                size = int(self.incoming[:end].split(';')[0], 16)
+                if size == 0:
+                    if self.incoming.find('\r\n\r\n', end) < 0:
+                        return
+                    self.finish()
+                    return
+                if len(self.incoming) < end + 2 + size + 2:
+                    return
+                self.body.append(self.incoming[end + 2:end + 2 + size])
+                self.incoming = self.incoming[end + 2 + size + 2:]
+        elif self.length is not None and len(self.incoming) >= self.length:
+            self.body.append(self.incoming[:self.length])
+            self.finish()
+
+    def finish(self):
+        url, host, path, future = self.request
+        status, body = self.status, ''.join(self.body)
+        self.request = None
+        self.deadline = None
+        self.reused = True
+        if self.closing:
+            self.close()
+        else:
+            self.loop.release(self)
+        future.set((status, body))
+
+    def handle_close(self):
+        request = self.request
+        if request and self.status is not None and self.length is None and not self.chunked:
+            # the body is delimited by the end of the connection
+            self.body.append(self.incoming)
+            self.finish()
+            return
+        self.close()
+        if request:
+            self.request = None
+            if self.reused and self.status is None:
+                # the server dropped a reused connection, try a fresh one
+                self.loop.dispatch(request)
+            else:
+                request[3].fail((socket.error, socket.error(errno.ECONNRESET, 'connection closed'), None))
+
+    def handle_error(self):
+        request = self.request
+        self.request = None
+        self.close()
+        if request:
+            request[3].fail()
+
+    def close(self):
+        asyncore.dispatcher.close(self)
+        self.loop.forget(self)
+
+
+class Loop:
+    """
+    An asyncore loop sending the ECS requests, in its own thread.
+
+    Like `ecs.ConnectionPool`, the connections are kept alive per host,
+    at most `maxsize` per host; the requests above are queued. An idle
+    connection closed by the server is dropped as soon as it happens.
+    The requests are held back by the `ecs.RateLimiter`, if any, without
+    blocking the loop. The identical requests in flight share one if
+    `ecs.setCoalescing` is on.
+    """
+
+    def __init__(self, maxsize=4, idle=60, timeout=30, addresses=None):
+        """
+        Initialize a `Loop` object.
+        Parameters:
+
+        - `maxsize`: integer, the number of connections per host
+        - `idle`: seconds, an idle connection older than this is closed
+        - `timeout`: seconds, a request without response is failed with
+          socket.timeout
+        - `addresses`: a dictionary, host => (address, port) to connect
+          to instead of resolving host, e.g. a local stand-in server
+        """
+        self.maxsize = maxsize
+        self.idle = idle
+        self.timeout = timeout
+        self.addresses = addresses or {}
+
+        self.map = {}
+        self.__requests = Queue.Queue()
+        self.__trigger = _Trigger(self.map)
+        self.__channels = {}
+        """host => [channel, ...], busy or idle"""
+        self.__idle = {}
+        """host => [channel, ...], most recently released last"""
+        self.__pending = {}
+        """host => [request, ...], waiting for a connection"""
+        self.__delayed = []
+        """heap of (time, request), waiting for the `ecs.RateLimiter`"""
+        self.__lock = threading.Lock()
+        self.__flights = {}
+        """`ecs.canonicalRequest` key => `Future`, the requests in flight"""
+        self.__running = False
+        self.__thread = None
+
+    def start(self):
+        """Run the loop in a daemon thread"""
+        if self.__thread is None:
+            self.__running = True
+            self.__thread = threading.Thread(target=self.run)
+            self.__thread.setDaemon(True)
+            self.__thread.start()
+
+    def stop(self):
+        """Stop the loop thread and close the connections"""
+        self.__running = False
+        self.__trigger.pull()
+        if self.__thread is not None and self.__thread is not threading.currentThread():
+            self.__thread.join()
+        self.__thread = None
+        for channels in self.__channels.values():
+            for channel in list(channels):
+                channel.close()
+
+    def run(self):
+        while self.__running:
+            timeout = 0.5
+            if self.__delayed:
+                timeout = max(0, min(timeout, self.__delayed[0][0] - time.time()))
+            asyncore.loop(timeout=timeout, map=self.map, count=1)
+            self.__dispatchRequests()
+            self.__expire()
+
+    def request(self, url):
+        """Send a GET request for `url` and return the `Future` of
+        (status, body), the one of the same request in flight if
+        `ecs.setCoalescing` is on and `url` is not a Cart mutation. This
+        method may be called from any thread."""
+        key = ecs.getCoalescing() is not None and ecs.coalescingKey(url)
+        if not key:
+            return self.__send(url)
+        self.__lock.acquire()
+        try:
+            future = self.__flights.get(key)
+            if future is not None:
+                return future
+            future = self.__flights[key] = self.__send(url)
+        finally:
+            self.__lock.release()
+        future.addCallback(lambda future: self.__land(key))
+        return future
+
+    def __send(self, url):
+        future = Future()
+        self.__requests.put([url, None, None, future])
+        self.start()
+        self.__trigger.pull()
+        return future
+
+    def __land(self, key):
+        self.__lock.acquire()
+        try:
+            del self.__flights[key]
+        finally:
+            self.__lock.release()
+
+    def call(self, function, *args, **kwargs):
+        """Run the blocking `ecs` function without blocking, return the
+        `Future` of its result. See the module documentation."""
+        future = Future()
+        bodies = {}
+        client = ecs.getClient()
+
+        def transport(url):
+            key = ecs.canonicalRequest(url)[0]
+            if not bodies.has_key(key):
+                raise PendingResponse(url)
+            # kept: the function runs again from the start
+            return bodies[key]
+
+        def attempt():
+            try:
+                rc = ecs.withClient(client, ecs.withTransport, transport, function, *args, **kwargs)
+            except PendingResponse, e:
+                self.request(e.url).addCallback(lambda response: received(e.url, response))
+            except:
+                future.fail()
+            else:
+                future.set(rc)
+
+        def received(url, response):
+            try:
+                bodies[ecs.canonicalRequest(url)[0]] = response.result()
+            except:
+                future.fail()
+            else:
+                attempt()
+
+        attempt()
+        return future
+
+    def dispatch(self, request):
+        """Send the request on an idle connection, a new one, or queue
+        it. Called in the loop thread."""
+        url, host, path, future = request
+        if host is None:
+            scheme, host, path, params, qs, fragment = urlparse.urlparse(url)
+            if qs:
+                path = path + '?' + qs
+            request[1:3] = [host, path]
+            limiter = ecs.getRateLimiter()
+            if limiter is not None:
+                delay = limiter.reserve(url)
+                if delay:
+                    heapq.heappush(self.__delayed, (time.time() + delay, request))
+                    return
+
+        idle = self.__idle.get(host)
+        if idle:
+            channel = idle.pop()
+        elif len(self.__channels.get(host, [])) < self.maxsize:
+            try:
+                channel = _Channel(self, host, self.addresses.get(host, (host, 80)))
+            except:
+                future.fail()
+                return
+            self.__channels.setdefault(host, []).append(channel)
+        else:
+            self.__pending.setdefault(host, []).append(request)
+            return
+        channel.send_request(request)
+
+    def release(self, channel):
+        """Give back the connection of a finished request"""
+        pending = self.__pending.get(channel.key)
+        if pending:
+            channel.send_request(pending.pop(0))
+        else:
+            channel.released = time.time()
+            self.__idle.setdefault(channel.key, []).append(channel)
+
+    def forget(self, channel):
+        """Remove a closed connection"""
+        for channels in (self.__channels.get(channel.key, []), self.__idle.get(channel.key, [])):
+            if channel in channels:
+                channels.remove(channel)
+        pending = self.__pending.get(channel.key)
+        if pending and self.__running:
+            self.dispatch(pending.pop(0))
+
+    def __dispatchRequests(self):
+        now = time.time()
+        while self.__delayed and self.__delayed[0][0] <= now:
+            self.dispatch(heapq.heappop(self.__delayed)[1])
+        while True:
+            try:
+                request = self.__requests.get_nowait()
+            except Queue.Empty:
+                return
+            self.dispatch(request)
+
+    def __expire(self):
+        now = time.time()
+        for channels in self.__channels.values():
+            for channel in list(channels):
+                if channel.request is not None and channel.deadline < now:
+                    request = channel.request
+                    channel.request = None
+                    channel.close()
+                    request[3].fail((socket.timeout, socket.timeout('timed out'), None))
+                elif channel.request is None and now - channel.released > self.idle:
+                    channel.close()
+
+
+__loop = None
+__lock = threading.Lock()
+
+def getLoop():
+    """Get the default `Loop`, started on first use"""
+    global __loop
+    __lock.acquire()
+    try:
+        if __loop is None:
+            __loop = Loop()
+        return __loop
+    finally:
+        __lock.release()
+
+
+def setLoop(loop=None):
+    """Set the default `Loop`, None for a new default one"""
+    global __loop
+    __lock.acquire()
+    try:
+        if __loop is not None and __loop is not loop:
+            __loop.stop()
+        __loop = loop
+    finally:
+        __lock.release()
+
+
+def call(function, *args, **kwargs):
+    """Run the blocking `ecs` function on the default `Loop`, return the
+    `Future` of its result"""
+    return getLoop().call(function, *args, **kwargs)
+
+
+def forEach(iterator, callback, start=0):
+    """Call `callback(item)` for the items of the `ecs.pagedIterator`
+    from `start`, fetching the pages without blocking. Return the
+    `Future` of the number of items visited."""
+    future = Future()
+
+    def step(index):
+        try:
+            while index < len(iterator):
+                item = call(iterator.__getitem__, index)
+                if not item.done():
+                    item.addCallback(lambda item: resume(index, item))
+                    return
+                callback(item.result())
+                index = index + 1
+        except:
+            future.fail()
+        else:
+            future.set(index - start)
+
+    def resume(index, item):
+        try:
+            callback(item.result())
+        except:
+            future.fail()
+        else:
+            step(index + 1)
+
+    step(start)
+    return future
+
+
+OPERATIONS = (
+    'ItemLookup', 'ItemSearch', 'SimilarityLookup',
+    'ListLookup', 'ListSearch',
+    'CartCreate', 'CartAdd', 'CartGet', 'CartModify', 'CartClear',
+    'SellerLookup', 'SellerListingLookup', 'SellerListingSearch',
+    'CustomerContentSearch', 'CustomerContentLookup',
+    'BrowseNodeLookup', 'Help', 'TransactionLookup')
+"""The `ecs` operations wrapped by this module, with their XMLfoo"""
+
+def __wrap(function):
+    def operation(*args, **kwargs):
+        return call(function, *args, **kwargs)
+    operation.__name__ = function.__name__
+    operation.__doc__ = "%s, returning a `Future`" % (function.__doc__ or function.__name__).split('\n')[0].strip()
+    return operation
+
+for __name in OPERATIONS:
+    globals()[__name] = __wrap(getattr(ecs, __name))
+    if hasattr(ecs, 'XML' + __name):
+        globals()['XML' + __name] = __wrap(getattr(ecs, 'XML' + __name))
+del __name
+
+
+def ItemLookupMany(ASINs, workers=1, **kwargs):
+    """ItemLookupMany, returning a `Future`: the requests of 10 ASINs
+    are sent by the loop at the same time, `workers` is ignored"""
+    unique = []
+    seen = set()
+    for asin in ASINs:
+        if asin not in seen:
+            seen.add(asin)
+            unique.append(asin)
+    chunks = [unique[i:i + 10] for i in range(0, len(unique), 10)]
+
+    future = Future()
+    results = {}
+    pending = [len(chunks)]
+    lock = threading.Lock()
+
+    def received(chunk, done):
+        lock.acquire()
+        try:
+            if future.done():
+                return
+            try:
+                results.update(zip(chunk, done.result()))
+            except:
+                future.fail()
+                return
+            pending[0] -= 1
+            if not pending[0]:
+                future.set(ecs.listIterator([results[asin] for asin in ASINs]))
+        finally:
+            lock.release()
+
+    if not chunks:
+        future.set(ecs.listIterator())
+    for chunk in chunks:
+        call(ecs.ItemLookupMany, chunk, **kwargs).addCallback(
+            lambda done, chunk=chunk: received(chunk, done))
+    return future
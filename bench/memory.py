@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+"""
+The memory held by the unmarshalled responses, `Bag` vs `Record`.
+
+The recorded responses of tests/fixtures are unmarshalled by both
+parsers, in both modes, and the size of every object reachable from
+the result is summed up with sys.getsizeof.
+
+    python bench/memory.py
+"""
+
+import os, sys, types
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import ecs
+from tests.standin import fixture
+
+CALLS = (
+    ('ItemSearch', ecs.ItemSearch, ('python',), {'SearchIndex': 'Books', 'ResponseGroup': 'Large'}),
+    ('ItemLookup', ecs.ItemLookup, ('0596009259',), {}),
+    ('BrowseNodeLookup', ecs.BrowseNodeLookup, ('3952',), {}),
+)
+
+def sizeof(o, seen):
+    """The size of `o` and of the objects it references"""
+    if id(o) in seen or isinstance(o, (types.ModuleType, types.FunctionType, types.MethodType, type, types.ClassType)):
+        return 0
+    seen.add(id(o))
+    size = sys.getsizeof(o)
+    if isinstance(o, dict):
+        for k, v in o.items():
+            size += sizeof(k, seen) + sizeof(v, seen)
+    elif isinstance(o, (list, tuple)):
+        for x in o:
+            size += sizeof(x, seen)
+    elif isinstance(o, ecs.Record):
+        for key in o.__slots__:
+            size += sizeof(getattr(o, key, None), seen)
+    if hasattr(o, '__dict__') and not isinstance(o, ecs.Record):
+        size += sizeof(o.__dict__, seen)
+    return size
+
+def measure(operation, function, args, kwargs):
+    body = fixture(operation + '.xml')
+    result = ecs.withTransport(lambda url: (200, body), function, *args, **kwargs)
+    if isinstance(result, ecs.pagedIterator):
+        # the first page only, pagedIterator keeps the arguments too
+        result = result._pagedIterator__pages.values()
+    return sizeof(result, set())
+
+def main():
+    ecs.setLicenseKey('00000000000000000000')
+    ecs.setSecretAccessKey('1234567890')
+    print '%-18s %-8s %10s %10s %7s' % ('response', 'parser', 'Bag', 'Record', 'saved')
+    for parser in ('minidom', 'expat'):
+        ecs.setParser(parser)
+        for operation, function, args, kwargs in CALLS:
+            sizes = []
+            for flag in (False, True):
+                ecs.setCompact(flag)
+                sizes.append(measure(operation, function, args, kwargs))
+            print '%-18s %-8s %10d %10d %6.1f%%' % (operation, parser, sizes[0], sizes[1],
+                100.0 * (sizes[0] - sizes[1]) / sizes[0])
+    ecs.setCompact(False)
+
+if __name__ == '__main__':
+    main()
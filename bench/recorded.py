@@ -0,0 +1,137 @@
+"""
+A stand-in ECS service built from the recorded responses.
+
+`RecordedService` is a responder of tests.standin.StandInServer: it
+checks the signature of every request like ECS does, then answers from
+tests/fixtures, generating as many pages of ItemSearch (ItemPage),
+offers (OfferPage) and lists (ListPage) as asked for.
+"""
+
+import os, sys, re, time, calendar, hmac, base64, urllib
+from hashlib import sha256
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from tests.standin import fixture
+
+NS = 'http://webservices.amazon.com/AWSECommerceService/2009-06-01'
+
+
+def element(tag, *children):
+    return '<%s>%s</%s>' % (tag, ''.join(children), tag)
+
+
+def response(operation, *children):
+    return ('<?xml version="1.0" encoding="UTF-8"?>\n<%sResponse xmlns="%s">%s</%sResponse>'
+        % (operation, NS, ''.join(children), operation))
+
+
+def request(operation, arguments):
+    return element('Request', element('IsValid', 'True'),
+        element(operation + 'Request', *[element(k, v) for k, v in sorted(arguments.items())
+            if k not in ('AWSAccessKeyId', 'Operation', 'Service', 'Signature', 'Timestamp', 'Version')]))
+
+
+class RecordedService:
+    """
+    (path, arguments) => (status, body) of a recorded ECS.
+
+    - `secret`: the secret access key the requests are signed with
+    - `host`: the Host the requests are signed for
+    - `results`: TotalResults of ItemSearch, 10 items per page
+    - `offers`: TotalOffers of each item, 10 offers per page
+    - `lists`: TotalResults of ListSearch, 10 lists per page
+    - `rejected`: the number of requests with a bad signature
+    """
+
+    def __init__(self, secret, host='ecs.amazonaws.com', results=400, offers=50, lists=60):
+        self.secret = secret
+        self.host = host
+        self.results = results
+        self.offers = offers
+        self.lists = lists
+        self.rejected = 0
+
+        body = fixture('ItemSearch.xml')
+        self.items = re.findall(r'<Item>.*?</Item>(?=<Item>|</Items>)', body)
+        self.asins = [re.search(r'<ASIN>(.*?)</ASIN>', x).group(1) for x in self.items]
+        self.offer = re.search(r'<Offer>.*?</Offer>', self.items[0]).group(0)
+        self.cart = re.search(r'<Cart>.*</Cart>', fixture('CartCreate.xml')).group(0)
+        self.error = fixture('Error.xml')
+
+    def __call__(self, path, arguments):
+        if not self.valid(path, arguments):
+            self.rejected += 1
+            return 403, self.error.replace('XXXXXXXXXX is not a valid value for ItemId',
+                'The request signature does not match')
+        operation = arguments['Operation']
+        if operation.startswith('Cart'):
+            return 200, response(operation, self.cart)
+        return 200, getattr(self, operation)(arguments)
+
+    def valid(self, path, arguments):
+        """Check the signature and the timestamp of the request"""
+        arguments = arguments.copy()
+        signature = arguments.pop('Signature', None)
+        if not signature or not arguments.get('AWSAccessKeyId'):
+            return False
+        try:
+            timestamp = calendar.timegm(time.strptime(arguments['Timestamp'], '%Y-%m-%dT%H:%M:%SZ'))
+        except (KeyError, ValueError):
+            return False
+        if abs(timestamp - time.time()) > 900:
+            return False
+
+        query = '&'.join(['%s=%s' % (k, urllib.quote(arguments[k], safe='~'))
+            for k in sorted(arguments.keys())])
+        digest = hmac.new(self.secret, 'GET\n%s\n%s\n%s' % (self.host, path, query), sha256).digest()
+        return base64.b64encode(digest) == signature
+
+    def item(self, index, large=True, offers=None):
+        """The index-th item of the catalog, with its offers page"""
+        body = self.items[index % len(self.items)].replace(self.asins[index % len(self.items)], 'B%09d' % index)
+        if not large:
+            body = ''.join(re.findall(r'<ASIN>.*?</ASIN>|<DetailPageURL>.*?</DetailPageURL>|<ItemAttributes>.*?</ItemAttributes>', body))
+            return element('Item', body)
+        if offers is not None:
+            count = min(10, max(0, self.offers - (offers - 1) * 10))
+            body = re.sub(r'<Offers>.*?</Offers>', element('Offers',
+                element('TotalOffers', str(self.offers)),
+                element('TotalOfferPages', str((self.offers + 9) / 10)),
+                self.offer * count), body)
+        return body
+
+    def ItemSearch(self, arguments):
+        page = int(arguments.get('ItemPage', 1))
+        large = 'Large' in arguments.get('ResponseGroup', '')
+        first = (page - 1) * 10
+        return response('ItemSearch', element('Items', request('ItemSearch', arguments),
+            element('TotalResults', str(self.results)),
+            element('TotalPages', str((self.results + 9) / 10)),
+            *[self.item(i, large) for i in range(first, min(first + 10, self.results))]))
+
+    def ItemLookup(self, arguments):
+        large = 'Large' in arguments.get('ResponseGroup', '') or 'Offer' in arguments.get('ResponseGroup', '')
+        offers = int(arguments.get('OfferPage', 1))
+        items = []
+        for asin in arguments['ItemId'].split(','):
+            if asin.startswith('B') and asin[1:].isdigit():
+                index = int(asin[1:])
+            else:
+                index = (self.asins + [asin]).index(asin)
+            items.append(self.item(index, large, offers))
+        return response('ItemLookup', element('Items', request('ItemLookup', arguments), *items))
+
+    def ListSearch(self, arguments):
+        page = int(arguments.get('ListPage', 1))
+        first = (page - 1) * 10
+        return response('ListSearch', element('Lists', request('ListSearch', arguments),
+            element('TotalResults', str(self.lists)),
+            element('TotalPages', str((self.lists + 9) / 10)),
+            *[element('List', element('ListId', 'R%09d' % i),
+                element('ListURL', 'http://www.amazon.com/gp/registry/R%09d' % i),
+                element('ListName', 'Wish list %d' % i),
+                element('ListType', arguments.get('ListType', 'WishList')),
+                element('TotalItems', str(i % 40)), element('TotalPages', str(i % 40 / 10 + 1)),
+                element('DateCreated', '2008-09-15'),
+                element('CustomerName', arguments.get('Name', 'Reader')))
+                for i in range(first, min(first + 10, self.lists))]))
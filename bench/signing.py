@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+"""
+The time spent building and signing the request urls.
+
+`ecs.buildRequest` is called for an ItemLookup and an ItemSearch, like
+the operations do, with every argument of the operation signature.
+
+    python bench/signing.py [requests]
+"""
+
+import os, sys, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import ecs
+
+def arguments(function, **kwargs):
+    """The vars() of the XMLfoo `function` called with kwargs"""
+    code = function.func_code
+    names = code.co_varnames[:code.co_argcount]
+    rc = dict(zip(names[-len(function.func_defaults):], function.func_defaults))
+    rc.update(kwargs)
+    return rc
+
+def run(name, argv, requests):
+    start = time.time()
+    for i in xrange(requests):
+        ecs.buildRequest(argv.copy())
+    elapsed = time.time() - start
+    print '%-12s %8d requests %8.2f s %8.2f us/request' % (name, requests, elapsed, elapsed / requests * 1e6)
+
+def main(requests=100000):
+    ecs.setLicenseKey('00000000000000000000')
+    ecs.setSecretAccessKey('1234567890')
+    ecs.setOptions({'AssociateTag': 'mytag-20'})
+    lookup = arguments(ecs.XMLItemLookup, ItemId='0596009259', ResponseGroup='Medium,Offers')
+    lookup['Operation'] = 'ItemLookup'
+    search = arguments(ecs.XMLItemSearch, Keywords='python', SearchIndex='Books', ItemPage=3)
+    search['Operation'] = 'ItemSearch'
+    run('ItemLookup', lookup, requests)
+    run('ItemSearch', search, requests)
+
+if __name__ == '__main__':
+    main(*[int(x) for x in sys.argv[1:]])
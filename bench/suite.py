@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+"""
+The offline benchmark suite.
+
+Every scenario runs against `RecordedService` on a local stand-in
+server, so the whole request path is measured: signing, the keep-alive
+connection pool, the HTTP exchange, the parse and the unmarshal. Each
+scenario runs in a child process so that its peak memory is its own.
+
+    python bench/suite.py [-p minidom|expat] [-n rounds] [-c] [scenario ...]
+
+Scenarios:
+
+- `lookup`: single item ItemLookup, Small response group
+- `pagination`: ItemSearch, OfferPage and ListPage walked to the last page
+- `large`: ItemSearch and ItemLookup with the Large response group
+- `cart`: CartCreate, CartAdd, CartModify, CartGet and CartClear
+
+For each scenario the latency percentiles of the calls, the calls per
+second and the peak resident memory are reported.
+"""
+
+import os, sys, time, gc, optparse, cPickle
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import ecs
+from tests.standin import StandInServer
+from recorded import RecordedService
+
+SECRET = '1234567890'
+
+
+def lookup(rounds, timer):
+    for i in range(rounds):
+        timer(ecs.ItemLookup, 'B%09d' % i)
+
+
+def pagination(rounds, timer):
+    # a call is a page, each page is reached through its first item
+    for i in range(max(1, rounds / 40)):
+        items = timer(ecs.ItemSearch, 'python', SearchIndex='Books')
+        for page in range(1, (len(items) + 9) / 10):
+            timer(items.__getitem__, page * 10)
+        offers = timer(ecs.ItemLookup, 'B%09d' % i, ResponseGroup='OfferFull')[0].Offers
+        for page in range(1, (len(offers) + 9) / 10):
+            timer(offers.__getitem__, page * 10)
+        lists = timer(ecs.ListSearch, 'WishList', Name='Reader')
+        for page in range(1, (len(lists) + 9) / 10):
+            timer(lists.__getitem__, page * 10)
+
+
+def large(rounds, timer):
+    for i in range(rounds / 2):
+        timer(ecs.ItemSearch, 'python', SearchIndex='Books', ResponseGroup='Large', ItemPage=i % 40 + 1)
+        timer(ecs.ItemLookup, 'B%09d' % i, ResponseGroup='Large')
+
+
+def cart(rounds, timer):
+    book, other = ecs.Bag(), ecs.Bag()
+    book.ASIN, other.ASIN = 'B000000001', 'B000000002'
+    for i in range(max(1, rounds / 5)):
+        c = timer(ecs.CartCreate, [book], [1])
+        timer(ecs.CartAdd, c, [other], [2])
+        timer(ecs.CartModify, c, [c.CartItems[0]], [3])
+        timer(ecs.CartGet, c)
+        timer(ecs.CartClear, c)
+
+
+SCENARIOS = (
+    ('lookup', lookup),
+    ('pagination', pagination),
+    ('large', large),
+    ('cart', cart),
+)
+
+
+def percentile(values, p):
+    """The p-th percentile of the sorted values, nearest rank"""
+    return values[min(len(values) - 1, int(p / 100.0 * len(values)))]
+
+
+def peakMemory():
+    """The peak resident memory of the process in KB, None if unknown"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        peak /= 1024
+    return peak
+
+
+def measure(scenario, rounds, address, options):
+    """Run the scenario, return (latencies, elapsed, peak memory)"""
+    ecs.setLicenseKey('00000000000000000000')
+    ecs.setSecretAccessKey(SECRET)
+    ecs.setParser(options.parser)
+    ecs.setCompact(options.compact)
+    pool = ecs.ConnectionPool(addresses={'ecs.amazonaws.com': address})
+    ecs.setConnectionPool(pool)
+
+    latencies = []
+    def timer(function, *args, **kwargs):
+        start = time.time()
+        rc = function(*args, **kwargs)
+        latencies.append(time.time() - start)
+        return rc
+
+    gc.collect()
+    start = time.time()
+    scenario(rounds, timer)
+    elapsed = time.time() - start
+    pool.clear()
+    return latencies, elapsed, peakMemory()
+
+
+def run(scenario, rounds, address, options):
+    """`measure` in a child process if possible"""
+    if not hasattr(os, 'fork'):
+        return measure(scenario, rounds, address, options)
+    r, w = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(r)
+        try:
+            os.write(w, cPickle.dumps(measure(scenario, rounds, address, options), 2))
+        finally:
+            os._exit(0)
+    os.close(w)
+    data = []
+    while True:
+        chunk = os.read(r, 65536)
+        if not chunk:
+            break
+        data.append(chunk)
+    os.close(r)
+    os.waitpid(pid, 0)
+    if not data:
+        raise RuntimeError('the scenario failed')
+    return cPickle.loads(''.join(data))
+
+
+def main():
+    parser = optparse.OptionParser(usage='%prog [options] [scenario ...]')
+    parser.add_option('-p', '--parser', default='minidom', help='minidom or expat')
+    parser.add_option('-n', '--rounds', type='int', default=200, help='calls per scenario')
+    parser.add_option('-c', '--compact', action='store_true', default=False, help='unmarshal to compact records')
+    options, names = parser.parse_args()
+    scenarios = [x for x in SCENARIOS if not names or x[0] in names]
+
+    service = RecordedService(SECRET)
+    server = StandInServer(service)
+    try:
+        print 'parser: %s%s, rounds: %d' % (options.parser, options.compact and ', compact' or '', options.rounds)
+        print '%-12s %6s %8s %8s %8s %8s %9s %10s' % ('scenario', 'calls', 'p50 ms', 'p90 ms', 'p99 ms',
+            'max ms', 'calls/s', 'peak KB')
+        for name, scenario in scenarios:
+            latencies, elapsed, peak = run(scenario, options.rounds, server.address(), options)
+            latencies.sort()
+            ms = [1000 * percentile(latencies, p) for p in (50, 90, 99, 100)]
+            print '%-12s %6d %8.2f %8.2f %8.2f %8.2f %9.1f %10s' % tuple([name, len(latencies)] + ms +
+                [len(latencies) / elapsed, peak or '-'])
+    finally:
+        server.stop()
+    if service.rejected:
+        print '%d requests with a bad signature' % service.rejected
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+"""
+The time spent turning a response into python objects.
+
+The recorded ItemSearch response of tests/fixtures is inflated to a
+full page of 10 Large items, then unmarshalled from the DOM (the parse
+is done once, outside of the timing) and by the expat parser. The lazy
+DOM unmarshal is timed reading the ASIN and the Title of each item, the
+projections unmarshal the ASIN, the SalesRank and the lowest new price.
+
+    python bench/unmarshal.py [rounds]
+
+The best of 5 batches of `rounds` calls is reported.
+"""
+
+import os, re, sys, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import ecs
+from tests.standin import fixture
+
+def page():
+    """The ItemSearch response with 10 items"""
+    body = fixture('ItemSearch.xml')
+    items = re.findall(r'<Item>.*?</Item>(?=<Item>|</Items>)', body)
+    return body.replace(''.join(items), ''.join((items * 4)[:10]))
+
+def run(name, function, rounds, repeat=5):
+    """Print the best time of `repeat` batches of `rounds` calls"""
+    function()
+    best = None
+    for i in range(repeat):
+        start = time.time()
+        for j in range(rounds):
+            function()
+        elapsed = (time.time() - start) / rounds
+        if best is None or elapsed < best:
+            best = elapsed
+    print '%-26s %8.3f ms/page' % (name, best * 1000)
+
+def main(rounds=200):
+    plugins = getattr(ecs, '__plugins')['ItemSearch']
+    body = page()
+    element = ecs.minidom.parseString(body).getElementsByTagName('Items').item(0)
+    cart = fixture('CartCreate.xml')
+    handle = ecs.Bag()
+    handle.CartId, handle.HMAC = '1', 'H'
+
+    run('unmarshal (DOM)', lambda: ecs.unmarshal(ecs.XMLItemSearch, {}, element, plugins, ecs.listIterator()), rounds)
+    def lazy():
+        for item in ecs.unmarshal(ecs.XMLItemSearch, {}, element, plugins, ecs.listIterator()):
+            item.ASIN, item.Title
+    ecs.setLazy()
+    run('unmarshal (lazy, 2 attrs)', lazy, rounds)
+    ecs.setLazy(False)
+    run('streamUnmarshal', lambda: ecs.streamUnmarshal(ecs.XMLItemSearch, {}, body, 'Items', plugins, ecs.listIterator()), rounds)
+    projected = ecs.getPlugins('ItemSearch', ['ASIN', 'SalesRank', 'OfferSummary.LowestNewPrice.Amount'])
+    run('unmarshal (projection)', lambda: ecs.unmarshal(ecs.XMLItemSearch, {}, element, projected, ecs.listIterator()), rounds)
+    run('streamUnmarshal (proj.)', lambda: ecs.streamUnmarshal(ecs.XMLItemSearch, {}, body, 'Items', projected, ecs.listIterator()), rounds)
+    for parser in ('minidom', 'expat'):
+        ecs.setParser(parser)
+        run('CartGet (%s)' % parser, lambda: ecs.withTransport(lambda url: (200, cart), ecs.CartGet, handle), rounds)
+    ecs.setParser('minidom')
+
+if __name__ == '__main__':
+    ecs.setLicenseKey('00000000000000000000')
+    ecs.setSecretAccessKey('1234567890')
+    main(*[int(x) for x in sys.argv[1:]])
@@ -0,0 +1,215 @@
+# Author: Kun Xi <kunxi@kunxi.org>
+# License: Python Software Foundation License
+
+"""
+Bulk crawls of `ecs.ItemSearch`.
+
+A category is crawled by many searches, one per SearchIndex, BrowseNode
+or price band, each walked to its last page. `crawl` spreads the page
+fetches and the parsing over a pool of processes, and yields each item
+once, whatever the number of searches it is found by.
+
+A search spec is a dictionary of the `ecs.ItemSearch` arguments, like
+``{'SearchIndex': 'Books', 'BrowseNode': '3952', 'MinimumPrice': 1000}``.
+The first page of each spec tells the number of pages, the others are
+fetched as soon as a process is free.
+
+The items are unmarshalled without `pagedIterator`: the paged elements,
+like Offers and CustomerReviews, are plain lists of the items of the
+response, so that the items can be sent between the processes.
+
+Functions:
+
+- `crawl`
+
+Classes:
+
+- `Checkpoint`, the progress of a crawl, saved to resume it
+
+Example::
+
+    specs = [{'SearchIndex': 'Books', 'BrowseNode': x} for x in nodes]
+    for item in bulk.crawl(specs, processes=4, checkpoint='books.crawl'):
+        store(item)
+
+The processes are forked with the `ecs` settings of the caller: the
+license key, the secret key, the locale, the options, the parser and the
+connection pool. Give the `ecs.RateLimiter` a path to share the request
+quota among the processes.
+"""
+
+import os, sys, Queue, cPickle
+import ecs
+
+try:
+    import multiprocessing
+except ImportError:
+    multiprocessing = None
+
+
+class Checkpoint:
+    """
+    The progress of a crawl: the ASINs yielded, the pages done and the
+    number of pages of each spec, saved to `path` to resume the crawl.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.seen = set()
+        """ASINs already yielded"""
+        self.done = set()
+        """(spec key, page) whose items were all yielded"""
+        self.pages = {}
+        """spec key => number of pages"""
+        if path is not None and os.path.exists(path):
+            f = open(path, 'rb')
+            try:
+                self.seen, self.done, self.pages = cPickle.load(f)
+            finally:
+                f.close()
+
+    def save(self):
+        if self.path is None:
+            return
+        temp = '%s.%d' % (self.path, os.getpid())
+        f = open(temp, 'wb')
+        try:
+            cPickle.dump((self.seen, self.done, self.pages), f, 2)
+        finally:
+            f.close()
+        os.rename(temp, self.path)
+
+
+def __flatten(plugins):
+    """The plugins with the paged elements unmarshalled to lists"""
+    rc = dict(plugins)
+    rc['isCollective'] = set(plugins['isCollective']) | set(plugins['isPaged'].keys())
+    rc['isPaged'] = {}
+    return rc
+
+__plugins = __flatten(ecs.getPlugins('ItemSearch'))
+
+
+def __settings():
+    """The `ecs` settings of the caller, for the processes"""
+    pool = ecs.getConnectionPool()
+    return {
+        'license': ecs.getLicenseKey(),
+        'secret': ecs.getSecretAccessKey(),
+        'locale': ecs.getLocale(),
+        'options': ecs.getOptions(),
+        'parser': ecs.getParser(),
+        'compact': ecs.getCompact(),
+        'retry': ecs.getRetry() is not None,
+        'pool': (pool.maxsize, pool.idle, pool.timeout, pool.addresses),
+    }
+
+
+def __initialize(settings):
+    """Set up a process of the pool"""
+    ecs.setLicenseKey(settings['license'])
+    ecs.setSecretAccessKey(settings['secret'])
+    ecs.setLocale(settings['locale'])
+    ecs.setOptions(settings['options'])
+    ecs.setParser(settings['parser'])
+    ecs.setCompact(settings['compact'])
+    if settings['retry'] and ecs.getRetry() is None:
+        ecs.setRetry()
+    # never share the connections of the parent
+    ecs.setConnectionPool(ecs.ConnectionPool(*settings['pool']))
+
+
+def __fetch(spec, page):
+    """Return (number of pages, items, None) of the page of the spec, or
+    (None, None, exception)"""
+    arguments = {'Keywords': None}
+    arguments.update(spec)
+    arguments['ItemPage'] = page
+    try:
+        items = ecs.rawIterator(ecs.XMLItemSearch, arguments, 'Items', __plugins)
+        return int(getattr(items, 'TotalPages', 1)), list(items), None
+    except Exception, e:
+        return None, None, e
+
+
+def crawl(specs, processes=None, checkpoint=None, every=10, maxPages=None, window=None):
+    """
+    Yield the items found by the ItemSearch `specs`, each ASIN once.
+
+    - `specs`: a list of dictionaries, the arguments of `ecs.ItemSearch`
+    - `processes`: integer, the size of the process pool, default to
+      the number of CPUs; 0 to fetch the pages in the calling thread
+    - `checkpoint`: string, the file the progress is saved to, and
+      resumed from if it exists
+    - `every`: integer, the progress is saved every `every` pages
+    - `maxPages`: integer, the last page fetched of each spec
+    - `window`: integer, the pages fetched at a time, default to twice
+      the number of processes
+
+    The pages are yielded in the order they are fetched. A page is done
+    once all its items were yielded, so a resumed crawl yields again the
+    items of the pages not done when the progress was last saved. The
+    first exception raised by a page stops the crawl.
+    """
+    if processes is None:
+        processes = multiprocessing and multiprocessing.cpu_count() or 0
+    if processes and multiprocessing is None:
+        raise ecs.BadOption, ('the process pool needs multiprocessing')
+    window = window or 2 * max(1, processes)
+    state = Checkpoint(checkpoint)
+
+    pending = []
+    for spec in specs:
+        key = repr(sorted(spec.items()))
+        last = state.pages.get(key)
+        if last is None:
+            pending.append((key, spec, 1))
+        else:
+            if maxPages is not None:
+                last = min(last, maxPages)
+            pending.extend([(key, spec, x) for x in range(1, last + 1) if (key, x) not in state.done])
+
+    pool = None
+    if processes:
+        pool = multiprocessing.Pool(processes, __initialize, (__settings(),))
+    results = Queue.Queue()
+    running = 0
+    unsaved = 0
+    try:
+        while pending or running:
+            while pending and running < window:
+                task = pending.pop(0)
+                if pool is None:
+                    results.put((task, __fetch(task[1], task[2])))
+                else:
+                    pool.apply_async(__fetch, task[1:],
+                        callback=lambda result, task=task: results.put((task, result)))
+                running += 1
+
+            (key, spec, page), (last, items, error) = results.get()
+            running -= 1
+            if error is not None:
+                raise error
+            if page == 1 and not state.pages.has_key(key):
+                state.pages[key] = last
+                if maxPages is not None:
+                    last = min(last, maxPages)
+                pending.extend([(key, spec, x) for x in range(2, last + 1) if (key, x) not in state.done])
+
+            for item in items:
+                asin = getattr(item, 'ASIN', None)
+                if asin is not None:
+                    if asin in state.seen:
+                        continue
+                    state.seen.add(asin)
+                yield item
+            state.done.add((key, page))
+            unsaved += 1
+            if unsaved >= every:
+                state.save()
+                unsaved = 0
+        state.save()
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
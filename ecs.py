@@ -9,8 +9,25 @@ to meet the latest AWS specification(http://www.amazon.com/webservices).
 This module defines the following classes:
 
 - `Bag`, a generic container for the python objects
+- `Record`, a compact `Bag` with __slots__
+- `LazyBag`, a `Bag` unmarshalled on demand
+- `Projection`, the attribute paths the items are unmarshalled to
 - `listIterator`, a derived class of list
 - `pagedIterator`, a page-based iterator using lazy evaluation
+- `pagePrefetcher`, the background read-ahead of a `pagedIterator`
+- `ConnectionPool`, a keep-alive HTTP connection pool used by `query`
+- `ResponseCache`, the base class of the response caches used by `query`
+- `MemoryCache`, an in-memory LRU response cache
+- `DiskCache`, an on-disk response cache
+- `ResponseArchive`, the responses recorded on disk, to replay them
+- `RateLimiter`, the token buckets keeping the requests within the quota
+- `RetryPolicy`, how the transient failures are retried
+- `RetryBudget`, the retries allowed to the retry policies
+- `MetricsSink`, the base class of the sinks of the request metrics
+- `MetricsRecorder`, the percentiles of the request metrics
+- `SingleFlight`, the concurrent identical requests sharing one
+- `RequestSigner`, the signed request urls of a secret key to a locale
+- `ECSClient`, the settings of the requests, shared by threads
 
 Exception classes:
 
@@ -19,6 +36,7 @@ Exception classes:
 - `NoSecretAccessKey`
 - `BadLocale`
 - `BadOption`
+- `LocaleTimeout`
 - `ExactParameterRequirement`
 - `ExceededMaximumParameterValues`
 - `InsufficientParameterValues`
@@ -49,20 +67,57 @@ Functions:
 
 - `setLocale`
 - `getLocale`
+- `getLocales`
 - `setLicenseKey`
 - `getLicenseKey`
 - `getVersion`
 - `setOptions` 
 - `getOptions`
+- `setConnectionPool`
+- `getConnectionPool`
+- `setCache`
+- `getCache`
+- `setArchive`
+- `getArchive`
+- `setRateLimiter`
+- `getRateLimiter`
+- `setRetry`
+- `getRetry`
+- `setMetrics`
+- `getMetrics`
+- `setCoalescing`
+- `getCoalescing`
+- `coalescingKey`
 - `buildRequest`
+- `getPlugins`
+- `setParser`
+- `getParser`
+- `setCompact`
+- `getCompact`
+- `setLazy`
+- `getLazy`
+- `record`
+- `bag`
+- `compact`
 - `buildException`
+- `getClient`
+- `withClient`
+- `withTransport`
+- `idempotent`
+- `canonicalRequest`
+- `fetch`
+- `fetchResponse`
 - `query`
 - `rawObject`
 - `rawIterator`
+- `rawBody`
 - `pagedWrapper`
 - `unmarshal`
+- `streamUnmarshal`
 - `ItemLookup`
 - `XMLItemLookup`
+- `ItemLookupMany`
+- `fanOut`
 - `ItemSearch`
 - `XMLItemSearch`
 - `SimilarityLookup`
@@ -99,6 +154,7 @@ Functions:
 - `XMLTransactionLookup`
 
 Accroding to the ECS specification, there are two implementation foo and XMLfoo, for example, `ItemLookup` and `XMLItemLookup`. foo returns a Python object, XMLfoo returns the raw XML file.
+`rawBody` returns the response of XMLfoo as is, without the DOM.
 
 How To Use This Module
 ======================
@@ -116,6 +172,20 @@ How To Use This Module
    a) setup other options, like AssociateTag, MerchantID, Validate
    b) export the http_proxy environment variable if you want to use proxy
    c) setup the locale if your locale is not ``us``
+   d) tune the connection pool with ``ecs.setConnectionPool(ecs.ConnectionPool(...))``
+   e) unmarshal large responses without the DOM: ``ecs.setParser('expat')``
+   f) cache the responses: ``ecs.setCache(ecs.MemoryCache())``
+   g) keep less memory for the results: ``ecs.setCompact()``
+   h) stay within the request quota: ``ecs.setRateLimiter(ecs.RateLimiter(1.0))``
+   i) retry the transient failures: ``ecs.setRetry()``
+   j) use other keys or locales at the same time:
+      ``ecs.ECSClient('KEY', 'SECRET', locale='uk').ItemLookup('0596009259')``
+   k) unmarshal only the attributes read: ``ecs.setLazy()``
+   l) time the requests: ``ecs.setMetrics(ecs.MetricsRecorder())``, then
+      ``ecs.getMetrics().report()``
+   m) record the responses: ``ecs.setArchive(ecs.ResponseArchive('responses'))``,
+      then replay them offline: ``ecs.setArchive(archive, replay=True)``
+   n) share the identical requests in flight: ``ecs.setCoalescing()``
 
 4. Send query to the AWS, and manupilate the returned python object.
 
@@ -127,9 +197,16 @@ __license__ = "Python Software Foundation"
 __docformat__ = 'restructuredtext'
 
 
-import os, urllib, string, hmac, hashlib, sys
-from datetime import datetime
+import os, urllib, string, hmac, hashlib, base64, sys, re, errno
+import httplib, urlparse, socket, select, threading, thread, time, weakref, Queue, heapq, random, types, math, mmap, collections
 from xml.dom import minidom
+from xml.parsers import expat
+from xml.sax import saxutils
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
 
 # python 2.4 compat for hashes
 try:
@@ -160,6 +237,80 @@ SECRET_ACCESS_KEY = None
 LOCALE = "us"
 VERSION = "2009-06-01"
 OPTIONS = {}
+CONNECTION_POOL = None
+PARSER = "minidom"
+COMPACT = False
+LAZY = False
+CACHE = None
+ARCHIVE = None
+REPLAY = False
+RATE_LIMITER = None
+RETRY = None
+METRICS = None
+COALESCING = None
+
+"""
+Time to live in seconds of the cached responses, see `ResponseCache`.
+Operation => ttl, ResponseGroup => ttl, the shortest ttl applies. The
+operations not listed here, like the Cart operations, are not cached.
+"""
+CACHE_TTLS = {
+    'BrowseNodeLookup': 6 * 3600,
+    'CustomerContentLookup': 3600,
+    'CustomerContentSearch': 3600,
+    'Help': 24 * 3600,
+    'ItemLookup': 3600,
+    'ItemSearch': 3600,
+    'ListLookup': 3600,
+    'ListSearch': 3600,
+    'SellerListingLookup': 600,
+    'SellerListingSearch': 600,
+    'SellerLookup': 3600,
+    'SimilarityLookup': 3600,
+    'TransactionLookup': 3600,
+    # prices and availability
+    'Large': 300,
+    'Medium': 300,
+    'OfferFull': 300,
+    'OfferListings': 300,
+    'Offers': 300,
+    'OfferSummary': 300,
+}
+
+"""
+Priority classes of the requests waiting for the `RateLimiter`, lower
+first: Operation => priority, the operations not listed here are 1.
+"""
+RATE_PRIORITIES = {
+    'CartAdd': 0,
+    'CartClear': 0,
+    'CartCreate': 0,
+    'CartGet': 0,
+    'CartModify': 0,
+    # bulk
+    'CustomerContentSearch': 2,
+    'ItemSearch': 2,
+    'ListSearch': 2,
+    'SellerListingSearch': 2,
+}
+
+"""
+Operation classes of the `RetryPolicy` table, see `setRetry`: Operation
+=> class, the operations not listed here are 'lookup'. The Cart
+mutations are not idempotent, they are never retried unless called by
+`idempotent`.
+"""
+OPERATION_CLASSES = {
+    'CartAdd': 'mutation',
+    'CartClear': 'mutation',
+    'CartCreate': 'mutation',
+    'CartGet': 'cart',
+    'CartModify': 'mutation',
+    'CustomerContentSearch': 'search',
+    'ItemSearch': 'search',
+    'ListSearch': 'search',
+    'SellerListingSearch': 'search',
+}
 
 
 __supportedLocales = {
@@ -172,18 +323,7 @@ __supportedLocales = {
         "ca" : "ecs.amazonaws.ca", 
     }
 
-__licenseKeys = (
-    (lambda key: key),
-    (lambda key: LICENSE_KEY), 
-    (lambda key: os.environ.get('AWS_LICENSE_KEY', None)),
-    (lambda key: os.environ.get('AWS_ACCESS_KEY_ID', None))
-   )
-
-__secretAccessKeys = (
-    (lambda key: key),
-    (lambda key: SECRET_ACCESS_KEY), 
-    (lambda key: os.environ.get('AWS_SECRET_ACCESS_KEY', None))
-   )
+__supportedParsers = ('minidom', 'expat')
 
 
 
@@ -346,23 +486,358 @@ def __buildPlugins():
 
 __plugins = __buildPlugins()
 
+# The operations whose plugins do not follow their ResponseGroups
+__plugins.update({
+    'SimilarityLookup': {
+        'isBypassed': (), 
+        'isPivoted': ('ItemAttributes',),
+        'isCollective': ('Items',),
+        'isCollected': ('Item',),
+        'isPaged': {}
+    },
+    'ListLookup': {
+        'isBypassed': (), 
+        'isPivoted': ('ItemAttributes',),
+        'isCollective': ('Lists',), 
+        'isCollected': ('List',),
+        'isPaged' : { 'Lists': ('ProductPage', 'TotalResults', 10) }
+    },
+    'ListSearch': {
+        'isBypassed': (), 
+        'isPivoted': ('ItemAttributes',),
+        'isCollective': ('Lists',), 
+        'isCollected': ('List',),
+        'isPaged' : { 'Lists': ('ListPage', 'TotalResults', 10) }
+    },
+    'Cart': {
+        'isBypassed': ('Request',),
+        'isPivoted': (), 
+        'isCollective': ('CartItems', 'SavedForLaterItems'),
+        'isCollected': ('CartItem', 'SavedForLaterItem'),
+        'isPaged': {}
+    },
+    'SellerLookup': {
+        'isBypassed': ('Request',),
+        'isPivoted': (), 
+        'isCollective': ('Sellers',),
+        'isCollected': ('Seller',),
+        'isPaged': {}
+    },
+    'SellerListingLookup': {
+        'isBypassed': ('Request',),
+        'isPivoted': (), 
+        'isCollective': ('SellerListings',), 
+        'isCollected': ('SellerListing',),
+        'isPaged': {}
+    },
+    'SellerListingSearch': {
+        'isBypassed': ('Request',),
+        'isPivoted': (), 
+        'isCollective': ('SellerListings',), 
+        'isCollected': ('SellerListing',),
+        'isPaged' : { 'SellerListings': ('ListingPage', 'TotalResults', 10) }
+    },
+})
+
+
+__tables = {}
+
+def __dispatchTable(plugins):
+    """
+    Return the dispatch table of the plugins: tagname => action, one of
+    'collected', 'collective', 'paged', 'pivot' and 'bypass', checked in
+    this order by `unmarshal`. The plain elements are not in the table.
+
+    The table is compiled on the first use of the plugins dict, which
+    must not be modified afterwards.
+    """
+    entry = __tables.get(id(plugins))
+    if entry is not None and entry[0] is plugins:
+        return entry[1]
+
+    table = {}
+    if plugins:
+        # the last one wins
+        for key, action in (('isBypassed', 'bypass'), ('isPivoted', 'pivot'), 
+            ('isPaged', 'paged'), ('isCollective', 'collective'), ('isCollected', 'collected')):
+            for tag in plugins.get(key, ()):
+                table[tag] = action
+    if len(__tables) > 256:
+        __tables.clear()
+    # plugins is kept so that its id is not reused
+    __tables[id(plugins)] = (plugins, table)
+    return table
+
+for x in __plugins.values():
+    __dispatchTable(x)
+
+__local = threading.local()
+
+__ELEMENT_NODE = minidom.Node.ELEMENT_NODE
+__TEXT_NODES = (minidom.Node.TEXT_NODE, minidom.Node.CDATA_SECTION_NODE)
+
 # Wrapper class for ECS
 class Bag : 
     """A generic container for the python objects"""
     def __repr__(self):
         return '<Bag instance: ' + self.__dict__.__repr__() + '>'
-    
 
 
-def rawObject(XMLSearch, arguments, kwItem, plugins=None):
-    """Return simple object from `unmarshal`"""
-    dom = XMLSearch(** arguments)
-    return unmarshal(XMLSearch, arguments, dom.getElementsByTagName(kwItem).item(0), plugins) 
+class Record(object):
+    """
+    A compact `Bag`, see `setCompact`.
+
+    The attributes are stored in `__slots__`, one generated subclass per
+    set of attribute names, shared by all the records of that schema.
+    A record reads like a `Bag`, but no attribute can be added to it.
+    """
+    __slots__ = ()
+
+    def __getDict(self):
+        rc = {}
+        for key in self.__slots__:
+            try:
+                rc[key] = getattr(self, key)
+            except AttributeError:
+                pass
+        return rc
+    __dict__ = property(__getDict)
+
+    def __repr__(self):
+        return '<Bag instance: ' + self.__dict__.__repr__() + '>'
+
+    def __reduce__(self):
+        fields = self.__slots__
+        return (record, (fields, tuple([getattr(self, x) for x in fields])))
+
+
+__recordClasses = {}
+__sharedValues = {}
+
+def record(fields, values):
+    """Return the `Record` of the attributes `fields` set to `values`"""
+    cls = __recordClasses.get(fields)
+    if cls is None:
+        cls = type('Record', (Record,), {'__slots__': fields})
+        __recordClasses[fields] = cls
+    rc = cls.__new__(cls)
+    for key, value in zip(fields, values):
+        setattr(rc, key, value)
+    return rc
+
+
+def bag(attributes):
+    """Return the `Bag` of the `attributes` dictionary"""
+    rc = Bag()
+    rc.__dict__.update(attributes)
+    return rc
+
+
+def compact(value):
+    """Return the `Record` of a `Bag`. The short strings are shared
+    among the records, the other values are returned as is."""
+    if value.__class__ is Bag:
+        items = value.__dict__.items()
+        items.sort()
+        fields = tuple([k for k, v in items])
+        try:
+            return record(fields, [v for k, v in items])
+        except (TypeError, ValueError):
+            # not a valid identifier, keep the Bag
+            return value
+    if isinstance(value, basestring) and len(value) <= 16:
+        if len(__sharedValues) > 65536:
+            __sharedValues.clear()
+        return __sharedValues.setdefault(value, value)
+    return value
+
+
+class LazyBag(object):
+    """
+    A `Bag` unmarshalled on demand, see `setLazy`.
+
+    The bag keeps its DOM element, each attribute is unmarshalled on its
+    first access and kept. `__dict__`, as `vars` and pickle use it,
+    unmarshals the remaining attributes and releases the element. The
+    attributes of a lazy bag are lazy bags in turn.
+    """
+    __slots__ = ('__element', '__load', '__values')
+
+    def __init__(self, element, load):
+        """
+        - `element`: a DOM element, the bag
+        - `load`: a function, (element, bag, name) => None, unmarshal the
+          `name` attributes of the element to the bag, all if name is None
+        """
+        self.__element = element
+        self.__load = load
+        self.__values = {}
+
+    def __getattr__(self, name):
+        values = self.__values
+        if values.has_key(name):
+            return values[name]
+        element = self.__element
+        if element is None or name[:2] == '__':
+            raise AttributeError, name
+        bag = Bag()
+        self.__load(element, bag, name)
+        if not bag.__dict__.has_key(name):
+            raise AttributeError, name
+        return values.setdefault(name, bag.__dict__[name])
+
+    def __setattr__(self, name, value):
+        if name.startswith('_LazyBag__'):
+            object.__setattr__(self, name, value)
+        else:
+            self.__values[name] = value
+
+    def __delattr__(self, name):
+        try:
+            del self.__dict__[name]
+        except KeyError:
+            raise AttributeError, name
+
+    def __getDict(self):
+        if self.__element is not None:
+            bag = Bag()
+            self.__load(self.__element, bag, None)
+            bag.__dict__.update(self.__values)
+            self.__values = bag.__dict__
+            self.__element = None
+        return self.__values
+    __dict__ = property(__getDict)
+
+    def __repr__(self):
+        return '<Bag instance: ' + self.__dict__.__repr__() + '>'
+
+    def __reduce__(self):
+        return (bag, (self.__dict__,))
+
+
+class Projection:
+    """
+    The dotted attribute paths the items are unmarshalled to, like
+    ``['ASIN', 'SalesRank', 'OfferSummary.LowestNewPrice.Amount']``, see
+    `getPlugins`.
+
+    The paths name the attributes of the unmarshalled items: a pivoted
+    element, like ItemAttributes, is not part of the path, a collective
+    one, like EditorialReviews, is followed into each of its items.
+    The elements out of the paths are skipped by both parsers, each item
+    is a flat `Record` whose fields are the paths with '.' replaced by
+    '_': the value, the list of the values if the path meets several of
+    them, None if none.
+    """
+
+    def __init__(self, paths):
+        self.paths = tuple(paths)
+        self.fields = tuple([x.replace('.', '_') for x in self.paths])
+        self.tree = {}
+        """name => subtree, None for the whole element"""
+        for path in self.paths:
+            names = path.split('.')
+            node = self.tree
+            for name in names[:-1]:
+                if node.has_key(name) and node[name] is None:
+                    break
+                node = node.setdefault(name, {})
+            else:
+                node[names[-1]] = None
+        try:
+            record(self.fields, ())
+        except (TypeError, ValueError):
+            raise BadOption, ('Invalid projection: %s' % ', '.join(self.paths))
+
+    def value(self, item, path):
+        """Return the value of the dotted `path` of `item`"""
+        values = [item]
+        for name in path.split('.'):
+            found = []
+            for value in values:
+                attr = getattr(value, name, None)
+                if attr is None and isinstance(value, list):
+                    # a collective element, look into its items
+                    attr = [getattr(x, name, None) for x in value if not isinstance(x, basestring)]
+                elif type(attr) is not list:
+                    attr = [attr]
+                for x in attr:
+                    if type(x) is list:
+                        found.extend(x)
+                    elif x is not None and not callable(x):
+                        found.append(x)
+            values = found
+        if not values:
+            return None
+        if len(values) == 1:
+            return values[0]
+        return values
+
+    def record(self, item):
+        """Return the flat `Record` of the unmarshalled `item`"""
+        return record(self.fields, [self.value(item, x) for x in self.paths])
+
+
+
+def rawObject(XMLSearch, arguments, kwItem, plugins=None, rc=None, errors=None):
+    """Return simple object from `unmarshal`, or from `streamUnmarshal`
+    if the expat parser is set.
+    If `errors` is a list, the exceptions of the Error elements are
+    appended to it instead of being raised."""
+    if PARSER == 'expat':
+        return __queryWith(lambda url: __timed(XMLSearch, streamUnmarshal, XMLSearch, arguments, fetch(url),
+            kwItem, plugins, rc, errors), XMLSearch, arguments)
+
+    if errors is None:
+        dom = XMLSearch(** arguments)
+    else:
+        dom = __queryWith(lambda url: __parse(url, fetch(url)), XMLSearch, arguments)
+        errors.extend([buildException([e]) for e in dom.getElementsByTagName('Error')])
+    return __timed(XMLSearch, unmarshal, XMLSearch, arguments, dom.getElementsByTagName(kwItem).item(0), plugins, rc)
+
+def __timed(XMLSearch, function, *args):
+    """Return `function(*args)`, timed as the unmarshal phase of the
+    operation of `XMLSearch` if the metrics are set"""
+    metrics = METRICS
+    if metrics is None:
+        return function(*args)
+    start = time.time()
+    rc = function(*args)
+    metrics.timing(XMLSearch.__name__[3:], 'unmarshal', time.time() - start)
+    return rc
 
 def rawIterator(XMLSearch, arguments, kwItems, plugins=None):
     """Return list of objects from `unmarshal`"""
-    dom = XMLSearch(** arguments)
-    return unmarshal(XMLSearch, arguments, dom.getElementsByTagName(kwItems).item(0), plugins, listIterator())
+    return rawObject(XMLSearch, arguments, kwItems, plugins, listIterator())
+
+__errorElement = re.compile(r'<Error>\s*<Code>(.*?)</Code>\s*<Message>(.*?)</Message>', re.S)
+
+def rawBody(XMLSearch, arguments, sink=None, errors=None, chunkSize=65536):
+    """Return the response body of `XMLSearch`, the XML as sent by AWS,
+    without building its DOM; or write it to the file-like `sink` by
+    chunks of `chunkSize` bytes, sliced without copies, and return its
+    length.
+    The Error elements are found by a scan of the body, the first one is
+    raised like `query` does. If `errors` is a list, the exceptions are
+    appended to it instead. A response other than 200 is never returned:
+    its first Error, or an `AWSException` if it has none, is raised."""
+    status, body = __queryWith(fetchResponse, XMLSearch, arguments)
+    found = []
+    if body.find('<Error>') >= 0:
+        found = [__exception(code, saxutils.unescape(msg)) for code, msg in __errorElement.findall(body)]
+    if status != 200:
+        if found:
+            raise found[0]
+        raise AWSException, ('HTTP status %d: %s' % (status, body[:200]))
+    if errors is not None:
+        errors.extend(found)
+    elif found:
+        raise found[0]
+    if sink is None:
+        return body
+    for offset in range(0, len(body), chunkSize):
+        sink.write(buffer(body, offset, chunkSize))
+    return len(body)
 
 
 class listIterator(list):
@@ -385,8 +860,7 @@ def pagedWrapper(XMLSearch, arguments, keywords, plugins):
     """
 
     return pagedIterator(XMLSearch, arguments, keywords,
-        XMLSearch(** arguments).getElementsByTagName(keywords[0]).item(0),
-        plugins)
+        rawIterator(XMLSearch, arguments, keywords[0], plugins), plugins)
     
 class pagedIterator:
     """
@@ -395,11 +869,15 @@ class pagedIterator:
     pages, the pagedIterator keeps track of the current page, and send
     the request only if necessary.
 
-    Bugs: 
-
-    - list slicing is still missing.
+    The most recently used pages are cached, up to `cacheSize` pages,
+    so random access does not refetch them. A slice fetches each page
+    it spans exactly once. The number of pages fetched, the first one
+    included, is kept in `fetches`.
     """
 
+    cacheSize = 4
+    """The default number of cached pages, see `cache`"""
+
     def __init__(self, XMLSearch, arguments, keywords, element, plugins):
         """
         Initialize a `pagedIterator` object.
@@ -408,7 +886,8 @@ class pagedIterator:
         - `XMLSearch`: a function, the query to get the DOM
         - `arguments`: a dictionary, `XMLSearch`'s arguments
         - `keywords`: a tuple, (kwItems, (kwPage, kwTotalResults, pageSize) )
-        - `element`: a DOM element, the root of the collection
+        - `element`: a DOM element, the root of the collection, or the
+          `listIterator` already unmarshalled from it
         - `plugins`: a dictionary, collection of plugged objects
         """
         kwItems, (kwPage, kwTotalResults, pageSize) = keywords
@@ -416,20 +895,54 @@ class pagedIterator:
         self.__search = XMLSearch 
         self.__arguments = arguments 
         self.__plugins = plugins
+        self.__client = getClient()
+        """The `ECSClient` the pages are fetched with"""
         self.__keywords ={'Items':kwItems, 'Page':kwPage}
-        self.__page = arguments[kwPage] or 1
+        self.__page = int(arguments.get(kwPage) or 1)
             
         """Current page"""
         self.__index = 0
         """Current index"""
         self.__pageSize = pageSize
 
-        self.__items = unmarshal(XMLSearch, arguments, element, plugins, listIterator())
-        """Cached items"""
+        if not isinstance(element, (listIterator, basestring)):
+            element = unmarshal(XMLSearch, arguments, element, plugins, listIterator())
+        if not isinstance(element, listIterator):
+            # the collection is empty, unmarshalled as a text node
+            element = listIterator()
+        self.__pages = {self.__page: element}
+        """Cached pages, page => items"""
+        self.__recent = [self.__page]
+        """Cached pages, least recently used first"""
+        self.__capacity = self.cacheSize
         try:
-            self.__len = int(element.getElementsByTagName(kwTotalResults).item(0).firstChild.data)
-        except AttributeError, e:
-            self.__len = len(self.__items)
+            self.__len = int(getattr(element, kwTotalResults))
+        except (AttributeError, ValueError), e:
+            self.__len = len(element)
+        self.__prefetcher = None
+        self.fetches = 1
+
+    def cache(self, pages):
+        """Keep the `pages` most recently used pages, at least 1"""
+        self.__capacity = max(1, pages)
+        self.__evict()
+
+    def prefetch(self, pages):
+        """
+        Fetch the next `pages` pages in background threads while the
+        current page is consumed. The pages already requested are
+        dropped along with the iterator. 0 turns the read-ahead off.
+        """
+        if self.__prefetcher:
+            self.__prefetcher.cancel()
+            self.__prefetcher = None
+        if pages > 0:
+            self.__prefetcher = pagePrefetcher(self, self.__search, self.__arguments,
+                self.__keywords['Items'], self.__keywords['Page'], self.__plugins, pages, self.__client)
+            self.__prefetcher.schedule(self.__page + 1, self.__lastPage(), self.__pages)
+
+    def __lastPage(self):
+        return (self.__len - 1) / self.__pageSize + 1
 
     def __len__(self):
         return self.__len
@@ -445,19 +958,1261 @@ class pagedIterator:
             raise StopIteration
 
     def __getitem__(self, key):
+        if isinstance(key, slice):
+            rc = listIterator()
+            pages = {}
+            for num in range(* key.indices(self.__len)):
+                page = num / self.__pageSize + 1
+                if not pages.has_key(page):
+                    pages[page] = self.__getpage(page)
+                rc.append(pages[page][num % self.__pageSize])
+            return rc
+
         num = int(key)
-        if num >= self.__len:
+        if num < 0:
+            num = num + self.__len
+        if num < 0 or num >= self.__len:
             raise IndexError
 
         page = num / self.__pageSize + 1
         index = num % self.__pageSize
-        if page != self.__page:
+        return self.__getpage(page)[index]
+
+    def __getpage(self, page):
+        """Return the items of `page`, from the cache if possible"""
+        items = self.__pages.get(page)
+        if items is not None:
+            self.__recent.remove(page)
+            self.__recent.append(page)
+        else:
             self.__arguments[self.__keywords['Page']] = page
-            dom = self.__search(** self.__arguments)
-            self.__items = unmarshal(self.__search, self.__arguments, dom.getElementsByTagName(self.__keywords['Items']).item(0), self.__plugins, listIterator())
+            if self.__prefetcher:
+                items = self.__prefetcher.get(page)
+            if items is None:
+                items = withClient(self.__client, rawIterator, self.__search, self.__arguments,
+                    self.__keywords['Items'], self.__plugins)
+            self.fetches += 1
+            if METRICS is not None:
+                METRICS.count(self.__search.__name__[3:], 'pages')
+            self.__pages[page] = items
+            self.__recent.append(page)
+            self.__evict()
+
+        if page != self.__page:
             self.__page = page
+            if self.__prefetcher:
+                self.__prefetcher.schedule(page + 1, self.__lastPage(), self.__pages)
+        return items
+
+    def __evict(self):
+        while len(self.__recent) > self.__capacity:
+            del self.__pages[self.__recent.pop(0)]
+
+
+class pagePrefetcher:
+    """
+    The read-ahead of a `pagedIterator`, see `pagedIterator.prefetch`.
+
+    At most `window` pages are fetched at the same time, by at most
+    `window` threads reading the queue of the pages scheduled; a page
+    forgotten before its turn is not fetched. The threads never refer to
+    the iterator, once the iterator is garbage collected the pages not
+    requested yet are cancelled.
+    """
+
+    def __init__(self, iterator, XMLSearch, arguments, kwItems, kwPage, plugins, window, client=None):
+        self.__search = XMLSearch
+        self.__arguments = dict(arguments)
+        self.__kwItems = kwItems
+        self.__kwPage = kwPage
+        self.__plugins = plugins
+        self.window = window
+        self.__client = client or getClient()
+
+        self.__lock = threading.Lock()
+        self.__queue = []
+        """(page, entry) to fetch, in order"""
+        self.__workers = 0
+        self.__pages = {}
+        """page => [done event, items, exception, forgotten]"""
+        self.cancelled = threading.Event()
+        cancelled = self.cancelled
+        self.__iterator = weakref.ref(iterator, lambda ref: cancelled.set())
+
+    def schedule(self, first, last, cached=()):
+        """Fetch the pages [first, first + window) up to `last` but the
+        `cached` ones, forget the pages out of this window"""
+        wanted = [page for page in range(first, min(first + self.window, last + 1))
+            if page not in cached]
+        self.__lock.acquire()
+        try:
+            for page in self.__pages.keys():
+                if page not in wanted:
+                    self.__pages.pop(page)[3] = True
+            for page in wanted:
+                if not self.__pages.has_key(page):
+                    entry = [threading.Event(), None, None, False]
+                    self.__pages[page] = entry
+                    self.__queue.append((page, entry))
+            while self.__workers < min(self.window, len(self.__queue)):
+                thread = threading.Thread(target=self.__work)
+                thread.setDaemon(True)
+                thread.start()
+                self.__workers += 1
+        finally:
+            self.__lock.release()
+
+    def get(self, page):
+        """Wait for `page` and return its items, None if it was not
+        scheduled or was cancelled. The exception raised by the fetch
+        is raised here."""
+        self.__lock.acquire()
+        try:
+            entry = self.__pages.pop(page, None)
+        finally:
+            self.__lock.release()
+        if entry is None:
+            return None
+        entry[0].wait()
+        if entry[2] is not None:
+            raise entry[2]
+        return entry[1]
+
+    def cancel(self):
+        self.cancelled.set()
+        self.__lock.acquire()
+        try:
+            self.__pages.clear()
+        finally:
+            self.__lock.release()
+
+    def __work(self):
+        while True:
+            self.__lock.acquire()
+            try:
+                if self.cancelled.isSet():
+                    # nothing is fetched any more, release the waiters
+                    for page, entry in self.__queue:
+                        entry[0].set()
+                    del self.__queue[:]
+                if not self.__queue:
+                    self.__workers -= 1
+                    return
+                page, entry = self.__queue.pop(0)
+            finally:
+                self.__lock.release()
+            if not entry[3]:
+                self.__fetch(page, entry)
+            entry[0].set()
+
+    def __fetch(self, page, entry):
+        arguments = dict(self.__arguments)
+        arguments[self.__kwPage] = page
+        try:
+            entry[1] = withClient(self.__client, rawIterator, self.__search, arguments,
+                self.__kwItems, self.__plugins)
+        except Exception, e:
+            entry[2] = e
+
+
+class ConnectionPool:
+    """
+    A keep-alive HTTP connection pool, keyed per host.
+
+    Every `query` borrows a connection to the locale host, sends the
+    request and gives the connection back once the response is read,
+    so consecutive requests to the same host share one TCP connection.
+    The http_proxy environment variable is honored as `urllib` does.
+    """
+
+    def __init__(self, maxsize=4, idle=60, timeout=None, addresses=None):
+        """
+        Initialize a `ConnectionPool` object.
+        Parameters:
+
+        - `maxsize`: integer, the number of idle connections kept per host
+        - `idle`: seconds, an idle connection older than this is discarded
+        - `timeout`: seconds, the socket timeout, default to
+          socket.getdefaulttimeout()
+        - `addresses`: a dictionary, host => (address, port) to connect
+          to instead of resolving host, e.g. a local stand-in server
+        """
+        self.maxsize = maxsize
+        self.idle = idle
+        self.timeout = timeout
+        self.addresses = addresses or {}
+
+        self.__lock = threading.Lock()
+        self.__connections = {}
+        """host => [(connection, released), ...], most recent last"""
+
+    def urlopen(self, url, resend=None):
+        """Send a GET request for `url`, return (status, body).
+        A request on a reused connection the server dropped before
+        reading it is sent again on a fresh connection if `resend` is
+        true, by default unless it is a Cart mutation. A request the
+        server may have received, like one timed out, is never sent
+        again."""
+        scheme, host, path, params, qs, fragment = urlparse.urlparse(url)
+        if qs:
+            path = path + '?' + qs
+
+        key = host
+        proxy = urllib.getproxies().get('http')
+        if proxy and not self.addresses.has_key(host) and not urllib.proxy_bypass(host):
+            key = urlparse.urlparse(proxy)[1] or proxy
+            path = url
+
+        if resend is None:
+            resend = OPERATION_CLASSES.get(canonicalRequest(url)[1].get('Operation')) != 'mutation'
+        conn = self.__acquire(key)
+        written = False
+        try:
+            conn.request('GET', path, headers={'Host': host})
+            written = True
+            response = conn.getresponse()
+        except (socket.error, httplib.HTTPException), e:
+            conn.close()
+            if not (resend and conn.sock_reused and self.__unread(e, written)):
+                raise
+            # the server dropped a reused connection, try a fresh one
+            conn = self.__connect(key)
+            try:
+                response = self.__send(conn, host, path)
+            except:
+                conn.close()
+                raise
+
+        try:
+            body = response.read()
+        except:
+            conn.close()
+            raise
+
+        if response.will_close:
+            conn.close()
+        else:
+            self.__release(key, conn)
+        return response.status, body
+
+    def clear(self):
+        """Close all the idle connections"""
+        self.__lock.acquire()
+        try:
+            connections, self.__connections = self.__connections, {}
+        finally:
+            self.__lock.release()
+        for idle in connections.values():
+            for conn, released in idle:
+                conn.close()
+
+    def __send(self, conn, host, path):
+        conn.request('GET', path, headers={'Host': host})
+        return conn.getresponse()
+
+    def __unread(self, e, written):
+        """Whether the request failed with `e` was not read by the server:
+        it could not be written, or the connection was closed or reset
+        without a byte of response"""
+        if isinstance(e, socket.timeout):
+            return False
+        if not written:
+            return True
+        if isinstance(e, httplib.BadStatusLine):
+            return not e.line or e.line.startswith('No status line')
+        return isinstance(e, socket.error) and e.args and e.args[0] == errno.ECONNRESET
+
+    def __connect(self, key):
+        address, port = self.addresses.get(key, (key, None))
+        if self.timeout is None:
+            conn = httplib.HTTPConnection(address, port, timeout=socket.getdefaulttimeout())
+        else:
+            conn = httplib.HTTPConnection(address, port, timeout=self.timeout)
+        conn.sock_reused = False
+        return conn
+
+    def __acquire(self, key):
+        """Return a healthy idle connection to `key`, or a new one"""
+        now = time.time()
+        self.__lock.acquire()
+        try:
+            idle = self.__connections.get(key, [])
+            while idle:
+                conn, released = idle.pop()
+                if now - released < self.idle and self.__isHealthy(conn):
+                    conn.sock_reused = True
+                    return conn
+                conn.close()
+        finally:
+            self.__lock.release()
+        return self.__connect(key)
+
+    def __release(self, key, conn):
+        self.__lock.acquire()
+        try:
+            idle = self.__connections.setdefault(key, [])
+            idle.append((conn, time.time()))
+            while len(idle) > self.maxsize:
+                conn, released = idle.pop(0)
+                conn.close()
+        finally:
+            self.__lock.release()
+
+    def __isHealthy(self, conn):
+        """An idle connection must not be readable: readable means the
+        server has closed it or sent something unexpected."""
+        if conn.sock is None:
+            return False
+        try:
+            readable, writable, errors = select.select([conn.sock], [], [conn.sock], 0)
+        except (socket.error, select.error, ValueError):
+            return False
+        return not readable and not errors
+
+
+class ResponseCache:
+    """
+    The base class of the response caches used by `fetch`.
+
+    The responses are keyed by `canonicalRequest`, so the same request
+    signed at another time is a hit. Error responses and the Cart
+    operations are never cached. The hit/miss statistics are kept in
+    `hits`, `misses`, `stores` and `evictions`.
+
+    Subclasses implement `load(key)` => (expires, body) or None,
+    `store(key, expires, body)` and `remove(key)`.
+    """
+
+    def __init__(self, ttls=None):
+        """
+        - `ttls`: a dictionary, Operation or ResponseGroup => seconds,
+          default to `CACHE_TTLS`
+        """
+        self.ttls = ttls or CACHE_TTLS
+        self.hits = self.misses = self.stores = self.evictions = 0
+
+    def ttl(self, arguments):
+        """Return the time to live of the request `arguments`, 0 if the
+        response must not be cached"""
+        operation = arguments.get('Operation', '')
+        if operation.startswith('Cart') or not self.ttls.has_key(operation):
+            return 0
+        groups = arguments.get('ResponseGroup', '').split(',')
+        return min([self.ttls[operation]] + [self.ttls[x] for x in groups if self.ttls.has_key(x)])
+
+    def get(self, url):
+        """Return the cached body of `url`, None if it is missed"""
+        key, arguments = canonicalRequest(url)
+        if not self.ttl(arguments):
+            return None
+        entry = self.load(key)
+        if entry is not None:
+            expires, body = entry
+            if expires > time.time():
+                self.hits += 1
+                return body
+            self.remove(key)
+            self.evictions += 1
+        self.misses += 1
+        return None
+
+    def put(self, url, body, status=200):
+        """Cache the response `body` of `url`, sent with the HTTP
+        `status`, if it is cacheable: a 200 response without Error"""
+        if status != 200:
+            return
+        key, arguments = canonicalRequest(url)
+        ttl = self.ttl(arguments)
+        if ttl and body.find('<Error>') < 0:
+            self.store(key, time.time() + ttl, body)
+            self.stores += 1
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses,
+            'stores': self.stores, 'evictions': self.evictions}
+
+
+class MemoryCache(ResponseCache):
+    """An in-memory LRU `ResponseCache` of `capacity` responses"""
+
+    def __init__(self, capacity=1024, ttls=None):
+        ResponseCache.__init__(self, ttls)
+        self.capacity = capacity
+        self.__lock = threading.Lock()
+        self.__entries = collections.OrderedDict()
+        """key => (expires, body), least recently used first"""
+
+    def load(self, key):
+        self.__lock.acquire()
+        try:
+            entry = self.__entries.pop(key, None)
+            if entry is not None:
+                self.__entries[key] = entry
+            return entry
+        finally:
+            self.__lock.release()
+
+    def store(self, key, expires, body):
+        self.__lock.acquire()
+        try:
+            self.__entries.pop(key, None)
+            self.__entries[key] = (expires, body)
+            while len(self.__entries) > self.capacity:
+                self.__entries.popitem(last=False)
+                self.evictions += 1
+        finally:
+            self.__lock.release()
+
+    def remove(self, key):
+        self.__lock.acquire()
+        try:
+            self.__entries.pop(key, None)
+        finally:
+            self.__lock.release()
+
+
+class DiskCache(ResponseCache):
+    """
+    An on-disk `ResponseCache`, one file per response in `directory`.
+    Each file holds the expiry time on the first line, then the body.
+    """
+
+    def __init__(self, directory, ttls=None):
+        ResponseCache.__init__(self, ttls)
+        self.directory = directory
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key).hexdigest())
+
+    def load(self, key):
+        try:
+            f = open(self.path(key), 'rb')
+        except IOError:
+            return None
+        try:
+            expires = float(f.readline())
+            return expires, f.read()
+        finally:
+            f.close()
+
+    def store(self, key, expires, body):
+        path = self.path(key)
+        temp = '%s.%d.%d' % (path, os.getpid(), thread.get_ident())
+        f = open(temp, 'wb')
+        try:
+            f.write('%f\n' % expires)
+            f.write(body)
+        finally:
+            f.close()
+        os.rename(temp, path)
+
+    def remove(self, key):
+        try:
+            os.remove(self.path(key))
+        except OSError:
+            pass
+
+    def purge(self):
+        """Remove the expired responses"""
+        now = time.time()
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                f = open(path, 'rb')
+                try:
+                    expires = float(f.readline())
+                finally:
+                    f.close()
+            except (IOError, ValueError):
+                continue
+            if expires <= now:
+                try:
+                    os.remove(path)
+                    self.evictions += 1
+                except OSError:
+                    pass
+
+
+class ResponseArchive:
+    """
+    An append-only on-disk archive of the responses, see `setArchive`,
+    one response per request, keyed by `canonicalRequest` but the
+    access key, so that it can be replayed with any key.
+
+    The bodies are appended back to back to the segment files of
+    `directory`, a new segment once `segmentSize` bytes are written,
+    and their place to the `index` file, loaded when the archive is
+    opened. The replay reads the segments through mmap, so the
+    responses are not read from the files one by one and `view` returns
+    them without a copy.
+    """
+
+    def __init__(self, directory, segmentSize=64 << 20):
+        self.directory = directory
+        self.segmentSize = segmentSize
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.__lock = threading.Lock()
+        self.__entries = {}
+        """key => (segment, offset, length, status)"""
+        self.__maps = {}
+        """segment => mmap"""
+        self.__segment = 0
+        for name in os.listdir(directory):
+            if name.startswith('segment.'):
+                self.__segment = max(self.__segment, int(name[8:]))
+        self.__writer = None
+
+        path = os.path.join(directory, 'index')
+        if os.path.exists(path):
+            f = open(path, 'r+b')
+            try:
+                size = 0
+                for line in f:
+                    if not line.endswith('\n'):
+                        # the last record was cut short
+                        f.truncate(size)
+                        break
+                    size += len(line)
+                    fields = line.split(' ', 4)
+                    self.__entries[fields[4][:-1]] = tuple([int(x) for x in fields[:4]])
+            finally:
+                f.close()
+        self.__index = open(path, 'ab')
+
+    def key(self, url):
+        """Return the key of the request url"""
+        location, qs = canonicalRequest(url)[0].split('?', 1)
+        return location + '?' + '&'.join([x for x in qs.split('&') if not x.startswith('AWSAccessKeyId=')])
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def __contains__(self, url):
+        return self.__entries.has_key(self.key(url))
+
+    def record(self, url, status, body):
+        """Append the response of `url`, unless there is one already"""
+        key = self.key(url)
+        self.__lock.acquire()
+        try:
+            if self.__entries.has_key(key):
+                return
+            writer = self.__writer
+            while writer is None or writer.tell() >= self.segmentSize:
+                if writer is not None:
+                    writer.close()
+                    self.__segment += 1
+                writer = self.__writer = open(self.__path(self.__segment), 'ab')
+                writer.seek(0, 2)
+            offset = writer.tell()
+            writer.write(body)
+            writer.flush()
+            entry = (self.__segment, offset, len(body), status)
+            # the index is written once the body is, never ahead of it
+            self.__index.write('%d %d %d %d %s\n' % (entry + (key,)))
+            self.__index.flush()
+            self.__entries[key] = entry
+        finally:
+            self.__lock.release()
+
+    def view(self, url):
+        """Return (status, buffer) of the response of `url`, the buffer
+        over the mapped segment; None if it is not archived"""
+        entry = self.__entries.get(self.key(url))
+        if entry is None:
+            return None
+        segment, offset, length, status = entry
+        if not length:
+            return status, ''
+        mapped = self.__maps.get(segment)
+        if mapped is None or len(mapped) < offset + length:
+            self.__lock.acquire()
+            try:
+                mapped = self.__maps.get(segment)
+                if mapped is None or len(mapped) < offset + length:
+                    f = open(self.__path(segment), 'rb')
+                    try:
+                        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                    finally:
+                        f.close()
+                    self.__maps[segment] = mapped
+            finally:
+                self.__lock.release()
+        return status, buffer(mapped, offset, length)
+
+    def replay(self, url):
+        """The `withTransport` transport of the archived responses:
+        return (status, body) of `url`, raise KeyError if it is not
+        archived"""
+        response = self.view(url)
+        if response is None:
+            raise KeyError, self.key(url)
+        return response[0], str(response[1])
+
+    def close(self):
+        self.__lock.acquire()
+        try:
+            if self.__writer is not None:
+                self.__writer.close()
+                self.__writer = None
+            self.__index.close()
+            for mapped in self.__maps.values():
+                mapped.close()
+            self.__maps.clear()
+        finally:
+            self.__lock.release()
+
+    def __path(self, segment):
+        return os.path.join(self.directory, 'segment.%05d' % segment)
+
+
+class RateLimiter:
+    """
+    A token bucket per access key and locale in front of the network,
+    to stay within the ECS quota instead of being throttled.
+
+    Each bucket holds up to `burst` tokens, refilled at `rate` tokens
+    per second; a request takes a token, or waits for one. The waiting
+    requests of a bucket are served by priority class, see
+    `RATE_PRIORITIES`, then in order of arrival.
+
+    The buckets are shared by the threads, and by the processes given
+    the same `path`: the bucket state is then kept in that file, locked
+    with fcntl, and the priorities apply within each process.
+
+    The queueing statistics are kept in `requests`, `delayed`, `delay`
+    and `maxDelay`, in seconds, per priority class in `priorities`.
+    """
+
+    def __init__(self, rate=1.0, burst=1, budgets=None, priorities=None, path=None):
+        """
+        - `rate`: float, requests per second of each bucket
+        - `burst`: integer, the size of each bucket
+        - `budgets`: a dictionary, access key, locale host like
+          ecs.amazonaws.co.uk, or (access key, locale host) => (rate,
+          burst), overriding `rate` and `burst`
+        - `priorities`: a dictionary, Operation => priority class,
+          default to `RATE_PRIORITIES`
+        - `path`: string, the file shared by the processes
+        """
+        if path is not None and fcntl is None:
+            raise BadOption, ('the rate limiter file needs fcntl')
+        self.rate = rate
+        self.burst = burst
+        self.budgets = budgets or {}
+        self.priorities = priorities or RATE_PRIORITIES
+        self.path = path
+
+        self.__lock = threading.Condition()
+        self.__buckets = {}
+        """bucket => [tokens, time]"""
+        self.__waiters = {}
+        """bucket => heap of (priority, sequence)"""
+        self.__sequence = 0
+        self.requests = self.delayed = 0
+        self.delay = self.maxDelay = 0.0
+        self.__priorities = {}
+        """priority => [requests, delay, maxDelay]"""
+
+    def budget(self, key, host):
+        """Return (rate, burst) of the access `key` in the locale `host`"""
+        for x in ((key, host), key, host):
+            if self.budgets.has_key(x):
+                return self.budgets[x]
+        return self.rate, self.burst
+
+    def acquire(self, url):
+        """Wait for a token to send the request `url`, return the delay"""
+        bucket, budget, priority = self.__classify(url)
+        start = time.time()
+        self.__lock.acquire()
+        try:
+            self.__sequence += 1
+            me = (priority, self.__sequence)
+            waiters = self.__waiters.setdefault(bucket, [])
+            heapq.heappush(waiters, me)
+            while True:
+                if waiters[0] == me:
+                    wait = self.__take(bucket, budget, time.time(), False)
+                    if not wait:
+                        heapq.heappop(waiters)
+                        if not waiters:
+                            del self.__waiters[bucket]
+                        self.__lock.notifyAll()
+                        break
+                    self.__lock.wait(wait)
+                else:
+                    self.__lock.wait()
+            delay = time.time() - start
+            self.__account(priority, delay)
+        finally:
+            self.__lock.release()
+        return delay
+
+    def reserve(self, url):
+        """Take a token to send the request `url`, even one to come, and
+        return the delay before sending it. It does not wait, for the
+        event loops; the priorities do not apply."""
+        bucket, budget, priority = self.__classify(url)
+        self.__lock.acquire()
+        try:
+            delay = self.__take(bucket, budget, time.time(), True)
+            self.__account(priority, delay)
+        finally:
+            self.__lock.release()
+        return delay
+
+    def stats(self):
+        priorities = {}
+        self.__lock.acquire()
+        try:
+            for priority, (requests, delay, maxDelay) in self.__priorities.items():
+                priorities[priority] = {'requests': requests, 'delay': delay, 'maxDelay': maxDelay}
+            return {'requests': self.requests, 'delayed': self.delayed,
+                'delay': self.delay, 'maxDelay': self.maxDelay, 'priorities': priorities}
+        finally:
+            self.__lock.release()
+
+    def __classify(self, url):
+        host = urlparse.urlparse(url)[1]
+        arguments = canonicalRequest(url)[1]
+        key = arguments.get('AWSAccessKeyId', '')
+        priority = self.priorities.get(arguments.get('Operation'), 1)
+        return key + '@' + host, self.budget(key, host), priority
+
+    def __account(self, priority, delay):
+        self.requests += 1
+        if delay > 0.001:
+            self.delayed += 1
+        self.delay += delay
+        self.maxDelay = max(self.maxDelay, delay)
+        entry = self.__priorities.setdefault(priority, [0, 0.0, 0.0])
+        entry[0] += 1
+        entry[1] += delay
+        entry[2] = max(entry[2], delay)
+
+    def __take(self, bucket, budget, now, reserve):
+        """Take a token of the bucket, return 0 or the seconds before
+        one is available. A reserved token is taken anyway."""
+        rate, burst = budget
+        if self.path is None:
+            return self.__takeFrom(self.__buckets, bucket, rate, burst, now, reserve)
+
+        f = open(self.path, 'a+')
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            f.seek(0)
+            buckets = {}
+            for line in f.read().splitlines():
+                fields = line.split()
+                if len(fields) == 3:
+                    buckets[fields[0]] = [float(fields[1]), float(fields[2])]
+            wait = self.__takeFrom(buckets, bucket, rate, burst, now, reserve)
+            f.seek(0)
+            f.truncate()
+            f.write(''.join(['%s %r %r\n' % (k, v[0], v[1]) for k, v in buckets.items()]))
+            f.flush()
+            return wait
+        finally:
+            f.close()
+
+    def __takeFrom(self, buckets, bucket, rate, burst, now, reserve):
+        state = buckets.get(bucket)
+        if state is None:
+            state = buckets[bucket] = [float(burst), now]
+        state[0] = min(float(burst), state[0] + (now - state[1]) * rate)
+        state[1] = now
+        if state[0] >= 1:
+            state[0] -= 1
+            return 0
+        wait = (1 - state[0]) / rate
+        if reserve:
+            state[0] -= 1
+        return wait
+
+
+class RetryBudget:
+    """
+    The retries allowed to a set of `RetryPolicy`, so that a failing
+    service is not hammered with retries: every request adds `ratio`
+    retry, up to `maximum`, every retry takes one.
+    """
+
+    def __init__(self, ratio=0.2, maximum=10):
+        self.ratio = ratio
+        self.maximum = maximum
+        self.balance = float(maximum)
+        self.__lock = threading.Lock()
+
+    def deposit(self):
+        self.__lock.acquire()
+        try:
+            self.balance = min(self.maximum, self.balance + self.ratio)
+        finally:
+            self.__lock.release()
+
+    def withdraw(self):
+        """Take a retry, return False if there is none left"""
+        self.__lock.acquire()
+        try:
+            if self.balance < 1:
+                return False
+            self.balance -= 1
+            return True
+        finally:
+            self.__lock.release()
+
+
+class RetryPolicy:
+    """
+    How the transient failures of a request are retried: socket errors,
+    HTTP 503 and the AWS.InternalError responses.
+
+    The n-th retry waits `delay` * `factor` ** (n - 1) seconds, at most
+    `maxDelay`, shortened by up to `jitter` of it at random so that the
+    clients do not retry in step. The request is given up after `tries`
+    attempts, when the next retry would end after `maxElapsed` seconds,
+    or when the `budget` is exhausted. The number of retries and of the
+    requests given up are kept in `retries` and `failures`.
+    """
+
+    def __init__(self, tries=4, delay=0.5, factor=2.0, maxDelay=20.0, jitter=0.5, maxElapsed=60.0, budget=None):
+        """
+        - `tries`: integer, the attempts of a request, the first included
+        - `delay`: seconds, before the first retry
+        - `factor`: float, the growth of the delay
+        - `maxDelay`: seconds, the longest delay
+        - `jitter`: float between 0 and 1, the random part of the delay
+        - `maxElapsed`: seconds, the longest time spent on a request
+        - `budget`: a `RetryBudget`, shared by the policies, or None
+        """
+        self.tries = tries
+        self.delay = delay
+        self.factor = factor
+        self.maxDelay = maxDelay
+        self.jitter = jitter
+        self.maxElapsed = maxElapsed
+        self.budget = budget
+        self.retries = self.failures = 0
+
+    def backoff(self, attempt):
+        """Return the seconds to wait before the retry `attempt`"""
+        delay = min(self.maxDelay, self.delay * self.factor ** (attempt - 1))
+        return delay * (1 - self.jitter * random.random())
+
+    def retry(self, attempt, elapsed):
+        """Return the seconds to wait before the retry `attempt`, None to
+        give up after `elapsed` seconds"""
+        if attempt < self.tries:
+            delay = self.backoff(attempt)
+            if elapsed + delay <= self.maxElapsed and (self.budget is None or self.budget.withdraw()):
+                self.retries += 1
+                return delay
+        self.failures += 1
+        return None
+
+    def stats(self):
+        return {'retries': self.retries, 'failures': self.failures}
+
+
+"""
+The default retry policies, see `setRetry`: operation class => policy,
+the operation classes without policy are not retried. The bulk
+searches are patient, the cart is quick to give up, and all of them
+share one `RetryBudget`.
+"""
+RETRY_BUDGET = RetryBudget()
+RETRY_POLICIES = {
+    'cart': RetryPolicy(tries=3, delay=0.2, maxElapsed=5.0, budget=RETRY_BUDGET),
+    'lookup': RetryPolicy(tries=4, delay=0.5, maxElapsed=30.0, budget=RETRY_BUDGET),
+    'search': RetryPolicy(tries=6, delay=1.0, maxElapsed=120.0, budget=RETRY_BUDGET),
+}
+
+
+class MetricsSink:
+    """
+    The base class of the metrics sinks, see `setMetrics`.
+
+    The requests report the seconds spent in each phase to `timing`:
+
+    - 'build': the request url, `buildRequest`
+    - 'network': the request and the response, retries and waits for
+      the `RateLimiter` included, `fetch`
+    - 'parse': the DOM of the response, `query`
+    - 'unmarshal': the objects of the DOM, or of the response with the
+      expat parser, which parses as it unmarshals
+
+    and their events to `count`: 'requests' and 'bytes' of the
+    responses received, 'coalesced' requests sharing the response of
+    another, see `setCoalescing`, 'cache.hits' and 'cache.misses',
+    'retries' and 'failures' of the `RetryPolicy`, and 'pages' fetched
+    by the `pagedIterator` after the first one. The sink is called by
+    the threads sending the requests.
+    """
+
+    def timing(self, operation, phase, seconds):
+        pass
+
+    def count(self, operation, name, value=1):
+        pass
+
+
+class MetricsRecorder(MetricsSink):
+    """
+    A `MetricsSink` keeping the timings and the counters per operation,
+    to print their percentiles with `report`.
+
+    Up to `samples` timings are kept per operation and phase, a uniform
+    sample of them once there are more.
+    """
+
+    def __init__(self, samples=10000):
+        self.samples = samples
+        self.__lock = threading.Lock()
+        self.__timings = {}
+        """(operation, phase) => [count, total seconds, samples]"""
+        self.counters = {}
+        """(operation, name) => total"""
+
+    def timing(self, operation, phase, seconds):
+        self.__lock.acquire()
+        try:
+            entry = self.__timings.get((operation, phase))
+            if entry is None:
+                entry = self.__timings[(operation, phase)] = [0, 0.0, []]
+            entry[0] += 1
+            entry[1] += seconds
+            if len(entry[2]) < self.samples:
+                entry[2].append(seconds)
+            else:
+                index = random.randrange(entry[0])
+                if index < self.samples:
+                    entry[2][index] = seconds
+        finally:
+            self.__lock.release()
+
+    def count(self, operation, name, value=1):
+        self.__lock.acquire()
+        try:
+            key = (operation, name)
+            self.counters[key] = self.counters.get(key, 0) + value
+        finally:
+            self.__lock.release()
+
+    def reset(self):
+        self.__lock.acquire()
+        try:
+            self.__timings.clear()
+            self.counters.clear()
+        finally:
+            self.__lock.release()
+
+    def stats(self, percentiles=(50, 90, 99)):
+        """Return (operation, phase) => {'count', 'mean', 'p50', ...},
+        in seconds"""
+        self.__lock.acquire()
+        try:
+            timings = [(k, v[0], v[1], sorted(v[2])) for k, v in self.__timings.items()]
+        finally:
+            self.__lock.release()
+        rc = {}
+        for key, count, total, samples in timings:
+            entry = rc[key] = {'count': count, 'mean': total / count}
+            for p in percentiles:
+                # nearest rank
+                index = max(0, int(math.ceil(p / 100.0 * len(samples))) - 1)
+                entry['p%s' % p] = samples[index]
+        return rc
+
+    def report(self, f=None, percentiles=(50, 90, 99)):
+        """Print the timings, in milliseconds, and the counters to the
+        file `f`, default to sys.stdout"""
+        f = f or sys.stdout
+        names = ['p%s' % p for p in percentiles]
+        f.write('%-24s %-10s %8s %9s' % ('operation', 'phase', 'count', 'mean') +
+            ''.join([' %9s' % x for x in names]) + '\n')
+        stats = self.stats(percentiles)
+        phases = ['build', 'network', 'parse', 'unmarshal']
+        keys = [(operation, (phases + [phase]).index(phase), phase)
+            for operation, phase in stats.keys()]
+        keys.sort()
+        for operation, rank, phase in keys:
+            key = (operation, phase)
+            entry = stats[key]
+            f.write('%-24s %-10s %8d %9.3f' % (key[0], key[1], entry['count'], entry['mean'] * 1000) +
+                ''.join([' %9.3f' % (entry[x] * 1000) for x in names]) + '\n')
+        self.__lock.acquire()
+        try:
+            counters = self.counters.items()
+        finally:
+            self.__lock.release()
+        counters.sort()
+        for (operation, name), value in counters:
+            f.write('%-24s %-10s %8d\n' % (operation, name, value))
+
+
+class SingleFlight:
+    """
+    The concurrent calls of the same key share one call, see
+    `setCoalescing`: the first one runs it, the others wait for its
+    result, or its exception. The number of calls run and of the calls
+    that shared them are kept in `calls` and `shared`.
+    """
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__flights = {}
+        """key => [done event, result, exc_info]"""
+        self.calls = self.shared = 0
+
+    def call(self, key, function, *args):
+        """Return `function(*args)`, or the result of the call of `key`
+        in flight"""
+        self.__lock.acquire()
+        try:
+            flight = self.__flights.get(key)
+            if flight is None:
+                flight = self.__flights[key] = [threading.Event(), None, None]
+                self.calls += 1
+                leader = True
+            else:
+                self.shared += 1
+                leader = False
+        finally:
+            self.__lock.release()
+
+        if leader:
+            try:
+                flight[1] = function(*args)
+            except:
+                flight[2] = sys.exc_info()
+            self.__lock.acquire()
+            try:
+                del self.__flights[key]
+            finally:
+                self.__lock.release()
+            flight[0].set()
+        else:
+            flight[0].wait()
+        if flight[2] is not None:
+            raise flight[2][0], flight[2][1], flight[2][2]
+        return flight[1]
+
+    def stats(self):
+        return {'calls': self.calls, 'shared': self.shared}
+
 
-        return self.__items[index]
+class RequestSigner:
+    """
+    Build the signed request urls of a secret key to a locale host.
+
+    The HMAC-SHA256 state, keyed by the secret and fed with the head of
+    the string to sign, is computed once and copied for each request.
+    The `constants` arguments, like Service, Version and the options,
+    are encoded once too: the arguments of each request are encoded,
+    sorted and merged with them, the constants win.
+    """
+
+    def __init__(self, secret, netloc, constants=None, timestamp=False):
+        """
+        - `secret`: string, the secret access key
+        - `netloc`: string, the locale host, like ecs.amazonaws.co.uk
+        - `constants`: a dictionary, the arguments of every request
+        - `timestamp`: boolean, add the Timestamp of the request
+        """
+        self.netloc = netloc
+        self.constants = constants or {}
+        self.timestamp = timestamp
+        self.__head = hmac.new(secret, 'GET\n%s\n/onca/xml\n' % netloc, sha256)
+        self.__prefix = 'http://%s/onca/xml?' % netloc
+        self.__constants = [(k, self.encode(k, v)) for k, v in self.constants.items() if v]
+        self.__encoded = {}
+        """(key, value) => key=value encoded"""
+        self.__clock = (None, None)
+        """(second, encoded Timestamp)"""
+
+    def encode(self, key, value):
+        """Return key=value, the value percent-encoded as ECS signs it"""
+        return key + '=' + urllib.quote(str(value), safe='~')
+
+    def sign(self, query_string):
+        """Return the encoded signature of the sorted `query_string`"""
+        digest = self.__head.copy()
+        digest.update(query_string)
+        return urllib.quote_plus(base64.b64encode(digest.digest()))
+
+    def url(self, arguments):
+        """Return the signed url of the request `arguments`"""
+        encoded = self.__encoded
+        if len(encoded) > 4096:
+            encoded.clear()
+        constants = self.constants
+        pairs = []
+        for k, v in arguments.iteritems():
+            if not v or constants.has_key(k):
+                continue
+            try:
+                pair = encoded.get((k, v))
+                if pair is None:
+                    pair = encoded[(k, v)] = self.encode(k, v)
+            except TypeError:
+                pair = self.encode(k, v)
+            pairs.append((k, pair))
+        if self.timestamp:
+            now = int(time.time())
+            second, pair = self.__clock
+            if second <> now:
+                pair = self.encode('Timestamp', time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(now)))
+                self.__clock = (now, pair)
+            pairs.append(('Timestamp', pair))
+        # the constants are sorted once, sort() merges the two runs
+        pairs.sort()
+        pairs.extend(self.__constants)
+        pairs.sort()
+
+        query_string = '&'.join([x[1] for x in pairs])
+        return self.__prefix + query_string + '&Signature=' + self.sign(query_string)
+
+
+class ECSClient(object):
+    """
+    The settings of the requests: the license key, the secret key, the
+    locale, the options, the connection pool and the cache.
+
+    A client may be shared by many threads. Its operations, like
+    ``client.ItemSearch('python', SearchIndex='Books')``, are the
+    module functions of the same names called with its settings, see
+    `withClient`; so are the requests of the objects they return, like
+    the pages of a `pagedIterator`.
+
+    The module functions, like `setLocale` and `ItemSearch`, use the
+    default client, whose settings are the module variables, unless
+    they are called by another client.
+    """
+
+    def __init__(self, licenseKey=None, secretAccessKey=None, locale='us', options=None, pool=None, cache=None):
+        """
+        - `licenseKey`: string, see `setLicenseKey`
+        - `secretAccessKey`: string, see `setSecretAccessKey`
+        - `locale`: string, see `setLocale`
+        - `options`: a dictionary, see `setOptions`
+        - `pool`: a `ConnectionPool`, one of its own by default
+        - `cache`: a `ResponseCache`, None to turn the cache off
+        """
+        self.__lock = threading.Lock()
+        self.settings = Bag()
+        """The settings, as the module variables: LICENSE_KEY, LOCALE..."""
+        self.settings.LICENSE_KEY = None
+        self.settings.SECRET_ACCESS_KEY = None
+        self.settings.LOCALE = 'us'
+        self.settings.OPTIONS = {}
+        self.settings.CONNECTION_POOL = pool
+        self.settings.CACHE = cache
+        if licenseKey:
+            self.setLicenseKey(licenseKey)
+        if secretAccessKey:
+            self.setSecretAccessKey(secretAccessKey)
+        if locale <> 'us':
+            self.setLocale(locale)
+        if options:
+            self.setOptions(options)
+
+    def setLocale(self, locale):
+        if not globals()['__supportedLocales'].has_key(locale):
+            raise BadLocale, ("Unsupported locale. Locale must be one of: %s" %
+                ', '.join(getLocales()))
+        self.settings.LOCALE = locale
+
+    def getLocale(self):
+        return self.settings.LOCALE
+
+    def setLicenseKey(self, license_key=None):
+        for rc in (license_key, self.settings.LICENSE_KEY,
+                os.environ.get('AWS_LICENSE_KEY', None), os.environ.get('AWS_ACCESS_KEY_ID', None)):
+            if rc:
+                self.settings.LICENSE_KEY = rc
+                return
+        raise NoLicenseKey, ("Please get the license key from  http://www.amazon.com/webservices")
+
+    def getLicenseKey(self):
+        if not self.settings.LICENSE_KEY:
+            self.setLicenseKey()
+        return self.settings.LICENSE_KEY
+
+    def setSecretAccessKey(self, secret_access_key=None):
+        for rc in (secret_access_key, self.settings.SECRET_ACCESS_KEY,
+                os.environ.get('AWS_SECRET_ACCESS_KEY', None)):
+            if rc:
+                self.settings.SECRET_ACCESS_KEY = rc
+                return
+        raise NoSecretAccessKey, ("Please get your secret key from  http://www.amazon.com/webservices")
+
+    def getSecretAccessKey(self):
+        if not self.settings.SECRET_ACCESS_KEY:
+            self.setSecretAccessKey()
+        return self.settings.SECRET_ACCESS_KEY
+
+    def setOptions(self, options):
+        if not set(options.keys()).issubset(set(['AssociateTag', 'MerchantID', 'Validate'])):
+            raise BadOption, ('Unsupported option')
+        self.__lock.acquire()
+        try:
+            # never changed in place, the readers see a whole dictionary
+            rc = dict(self.settings.OPTIONS)
+            rc.update(options)
+            self.settings.OPTIONS = rc
+        finally:
+            self.__lock.release()
+
+    def getOptions(self):
+        return self.settings.OPTIONS
+
+    def setConnectionPool(self, pool=None):
+        self.settings.CONNECTION_POOL = pool or ConnectionPool()
+
+    def getConnectionPool(self):
+        pool = self.settings.CONNECTION_POOL
+        if not pool:
+            self.__lock.acquire()
+            try:
+                pool = self.settings.CONNECTION_POOL
+                if not pool:
+                    pool = self.settings.CONNECTION_POOL = ConnectionPool()
+            finally:
+                self.__lock.release()
+        return pool
+
+    def setCache(self, cache=None):
+        self.settings.CACHE = cache
+
+    def getCache(self):
+        return self.settings.CACHE
+
+    def __reduce__(self):
+        """The keys, the locale and the options are pickled; the default
+        client is unpickled as the default client"""
+        if isinstance(self.settings, types.ModuleType):
+            return (getClient, (True,))
+        settings = self.settings
+        return (ECSClient, (settings.LICENSE_KEY, settings.SECRET_ACCESS_KEY, settings.LOCALE, settings.OPTIONS))
+
+    def call(self, function, *args, **kwargs):
+        """Call `function` with the settings of the client, see `withClient`"""
+        return withClient(self, function, *args, **kwargs)
+
+    def __getattr__(self, name):
+        """The operations, like ItemSearch and XMLItemSearch"""
+        function = globals().get(name)
+        if not name[:1].isupper() or not isinstance(function, types.FunctionType):
+            raise AttributeError, name
+        def operation(*args, **kwargs):
+            return withClient(self, function, *args, **kwargs)
+        operation.__name__ = name
+        operation.__doc__ = function.__doc__
+        return operation
 
 
 # Exception classes
@@ -466,6 +2221,7 @@ class NoLicenseKey(AWSException) : pass
 class NoSecretAccessKey(AWSException) : pass
 class BadLocale(AWSException) : pass
 class BadOption(AWSException): pass
+class LocaleTimeout(AWSException): pass
 # Runtime exception
 class ExactParameterRequirement(AWSException): pass
 class ExceededMaximumParameterValues(AWSException): pass
@@ -498,16 +2254,17 @@ class XSLTTransformationError(AWSException): pass
 def setLocale(locale):
     """Set the locale
     if unsupported locale is set, BadLocale is raised."""
-    global LOCALE
-    if not __supportedLocales.has_key(locale):
-        raise BadLocale, ("Unsupported locale. Locale must be one of: %s" %
-            ', '.join([x for x in __supportedLocales.keys() if x]))
-    LOCALE = locale
+    getClient().setLocale(locale)
 
 
 def getLocale():
     """Get the locale"""
-    return LOCALE
+    return getClient().getLocale()
+
+
+def getLocales():
+    """Get the supported locales, like 'us' and 'uk'"""
+    return sorted([x for x in __supportedLocales.keys() if x])
 
 
 def setLicenseKey(license_key=None):
@@ -516,22 +2273,14 @@ def setLicenseKey(license_key=None):
     environment variable: AMAZON_LICENSE_KEY; if no license key is 
     set, NoLicenseKey exception is raised."""
     
-    global LICENSE_KEY
-    for get in __licenseKeys:
-        rc = get(license_key)
-        if rc: 
-            LICENSE_KEY = rc;
-            return;
-    raise NoLicenseKey, ("Please get the license key from  http://www.amazon.com/webservices")
+    getClient().setLicenseKey(license_key)
 
 
 def getLicenseKey():
     """Get license key.
     If no license key is specified,  NoLicenseKey is raised."""
 
-    if not LICENSE_KEY:
-        setLicenseKey()
-    return LICENSE_KEY
+    return getClient().getLicenseKey()
 
 def setSecretAccessKey(secret_access_key=None):
     """Sets your secret AWS key.
@@ -539,21 +2288,13 @@ def setSecretAccessKey(secret_access_key=None):
     environment variable: AMAZON_SECRET_ACCESS_KEY.  
     Raises NoSecretAccessKey if we can't get it to work."""
     
-    global SECRET_ACCESS_KEY
-    for get in __secretAccessKeys:
-        rc = get(secret_access_key)
-        if rc: 
-            SECRET_ACCESS_KEY = rc;
-            return;
-    raise NoSecretAccessKey, ("Please get your secret key from  http://www.amazon.com/webservices")
+    getClient().setSecretAccessKey(secret_access_key)
 
 def getSecretAccessKey():
     """Get the secret access key.
     If no key is specified,  NoSecretAccessKey is raised."""
 
-    if not SECRET_ACCESS_KEY:
-        setSecretAccessKey()
-    return SECRET_ACCESS_KEY
+    return getClient().getSecretAccessKey()
 
 def getVersion():
     """Get the version of ECS specification"""
@@ -569,65 +2310,462 @@ def setOptions(options):
     - Validate
     """
     
-    if set(options.keys()).issubset( set(['AssociateTag', 'MerchantID', 'Validate']) ):
-        global OPTIONS
-        OPTIONS.update(options)
-    else:
-        raise BadOption, ('Unsupported option')
+    getClient().setOptions(options)
 
         
 def getOptions():
     """Get options"""
-    return OPTIONS 
+    return getClient().getOptions()
+
+
+def getPlugins(operation, projection=None):
+    """Get the plugins of `operation`, see `unmarshal`. The dictionary
+    is shared, copy it to make changes. With a `projection`, a list of
+    dotted attribute paths, the plugins unmarshal the items to flat
+    records, see `Projection`."""
+    if projection:
+        return __projected(__plugins[operation], projection)
+    return __plugins[operation]
+
+
+__projections = {}
+
+def __projected(plugins, paths):
+    """Return the plugins with the `Projection` of the paths"""
+    key = (id(plugins), tuple(paths))
+    entry = __projections.get(key)
+    if entry is not None and entry[0] is plugins:
+        return entry[1]
+    rc = dict(plugins or {})
+    rc['projection'] = Projection(paths)
+    # the paged elements of the items are unmarshalled to lists, the
+    # collective action wins in the dispatch table
+    rc['isCollective'] = set(rc.get('isCollective', ())) | set(rc.get('isPaged', {}).keys())
+    if len(__projections) > 256:
+        __projections.clear()
+    # plugins is kept so that its id is not reused
+    __projections[key] = (plugins, rc)
+    return rc
+
+
+def setParser(parser):
+    """
+    Set the parsing engine used to unmarshal the responses:
+    - minidom: `query` builds the DOM, `unmarshal` walks it
+    - expat: `streamUnmarshal` builds the objects from the parse events,
+      no DOM is built
+    if unsupported parser is set, BadOption is raised.
+    """
+    global PARSER
+    if parser not in __supportedParsers:
+        raise BadOption, ("Unsupported parser. Parser must be one of: %s" %
+            ', '.join(__supportedParsers))
+    PARSER = parser
+
+
+def getParser():
+    """Get the parsing engine"""
+    return PARSER
+
+
+def setRetry(policies=RETRY_POLICIES):
+    """Retry the transient failures of the requests: `policies` is a
+    dictionary, operation class => `RetryPolicy`, see
+    `OPERATION_CLASSES`; None to disable the retries. The requests sent
+    by a `withTransport` transport are not retried."""
+    global RETRY
+    RETRY = policies
+
+
+def getRetry():
+    """Get the retry policies, None if disabled"""
+    return RETRY
+
+
+def setRateLimiter(limiter=None):
+    """Set the `RateLimiter` the requests wait for, None to disable it.
+    The requests sent by a `withTransport` transport are not limited."""
+    global RATE_LIMITER
+    RATE_LIMITER = limiter
+
+
+def getRateLimiter():
+    """Get the `RateLimiter`, None if disabled"""
+    return RATE_LIMITER
+
+
+def setMetrics(sink=None):
+    """Report the phase timings and the counters of the requests to the
+    `MetricsSink` `sink`, like a `MetricsRecorder`; None to disable it."""
+    global METRICS
+    METRICS = sink
+
+
+def getMetrics():
+    """Get the `MetricsSink`, None if disabled"""
+    return METRICS
+
+
+def setCoalescing(flag=True):
+    """Let the concurrent identical requests, the same `canonicalRequest`,
+    share one HTTP request, and one DOM for `query`, instead of sending
+    one each. The requests sent by a `withTransport` transport are not
+    shared, see `aio` for its own requests, nor are the Cart mutations,
+    see `coalescingKey`."""
+    global COALESCING
+    COALESCING = flag and SingleFlight() or None
+
+
+def getCoalescing():
+    """Get the `SingleFlight` of the requests, None if disabled"""
+    return COALESCING
+
+
+def coalescingKey(url):
+    """Return the key of the request url shared by the identical requests
+    in flight, see `setCoalescing`; None for a Cart mutation, as two
+    identical mutations are still two changes of the cart."""
+    key, arguments = canonicalRequest(url)
+    if OPERATION_CLASSES.get(arguments.get('Operation')) == 'mutation':
+        return None
+    return key
+
+
+def setArchive(archive=None, replay=False):
+    """Append the responses received to the `ResponseArchive` `archive`,
+    but the server errors; or if `replay` is True, answer the requests
+    from the archive instead of the network, see
+    `ResponseArchive.replay`. None to disable it. A `withTransport`
+    transport still applies."""
+    global ARCHIVE, REPLAY
+    ARCHIVE = archive
+    REPLAY = bool(replay)
+
+
+def getArchive():
+    """Get the `ResponseArchive`, None if disabled"""
+    return ARCHIVE
+
+
+def setCompact(flag=True):
+    """Unmarshal the responses to `Record` instead of `Bag` objects,
+    the records take far less memory than the bags, but no attribute
+    can be added to them."""
+    global COMPACT
+    COMPACT = bool(flag)
+
+
+def getCompact():
+    """Get whether the responses are unmarshalled to `Record`"""
+    return COMPACT
+
+
+def setLazy(flag=True):
+    """Unmarshal the items of the DOM to `LazyBag`, whose attributes are
+    unmarshalled on their first access: the attributes never read cost
+    nothing but the DOM they keep. The expat parser ignores it, see
+    `setParser`."""
+    global LAZY
+    LAZY = bool(flag)
+
+
+def getLazy():
+    """Get whether the items are unmarshalled to `LazyBag`"""
+    return LAZY
+
+
+def setConnectionPool(pool=None):
+    """Set the `ConnectionPool` used by `query`.
+    If pool is not specified, a default `ConnectionPool` is used."""
+
+    getClient().setConnectionPool(pool)
+
+
+def getConnectionPool():
+    """Get the `ConnectionPool` used by `query`"""
+
+    return getClient().getConnectionPool()
+
+
+def setCache(cache=None):
+    """Set the `ResponseCache` used by `query`, like `MemoryCache` or
+    `DiskCache`. None turns the cache off, which is the default."""
+
+    getClient().setCache(cache)
+
+
+def getCache():
+    """Get the `ResponseCache` used by `query`, or None"""
+    return getClient().getCache()
+
+
+__defaultClient = ECSClient()
+__defaultClient.settings = sys.modules[__name__]
+
+
+def getClient(default=False):
+    """Get the `ECSClient` of the current thread: the client calling,
+    see `withClient`, or the default client; the default client if
+    `default` is True"""
+    if default:
+        return __defaultClient
+    return getattr(__local, 'client', None) or __defaultClient
+
+
+def withClient(client, function, *args, **kwargs):
+    """Call `function` with the settings of the `ECSClient` `client` in
+    the current thread, and return what `function` returns. The objects
+    returned keep the client for their own requests."""
+    previous = getattr(__local, 'client', None)
+    __local.client = client
+    try:
+        return function(*args, **kwargs)
+    finally:
+        __local.client = previous
+
+__signers = {}
+
+def __signer(netloc, license=None):
+    """Return the `RequestSigner` of the secret key to `netloc`, with the
+    standard arguments and the options if `license` is given"""
+    secret = getSecretAccessKey()
+    if license is None:
+        key = (secret, netloc)
+    else:
+        key = (secret, netloc, license, VERSION, tuple(getOptions().items()))
+    signer = __signers.get(key)
+    if signer is None:
+        if license is None:
+            signer = RequestSigner(secret, netloc)
+        else:
+            constants = dict(getOptions())
+            constants.update({'Service': 'AWSECommerceService', 'Version': VERSION})
+            if license:
+                constants['AWSAccessKeyId'] = license
+            signer = RequestSigner(secret, netloc, constants, True)
+        if len(__signers) > 64:
+            __signers.clear()
+        __signers[key] = signer
+    return signer
 
 def buildSignature(netloc,query_string):
-    secret_key = getSecretAccessKey()
-    string_to_sign = 'GET\n%s\n%s\n%s' % (netloc,'/onca/xml',query_string)
-    
-    return urllib.quote_plus(hmac.new(secret_key,string_to_sign,sha256).digest().encode('base64').strip())
+    return __signer(netloc).sign(query_string)
 
 def buildQuery(argv):
     # 1. Filter any key set to 'None'
     # 2. Sort the dict by key
     # 3. Quote everything and build the query string
-    query_string = "&".join("%s=%s" % (k, urllib.quote(str(argv[k]))) for (k) in sorted(argv.keys()) if argv[k])
-
-    netloc = __supportedLocales[getLocale()]
-    signature = buildSignature(netloc, query_string)
-    return 'http://' + netloc + '/onca/xml?' + query_string + '&Signature=' + signature
+    return __signer(__supportedLocales[getLocale()]).url(argv)
 
 def buildRequest(argv):
     """Adds some standard keys (like Timestamp and Version) to the request,
     then builds and returns the request-url."""
 
-    if not argv['AWSAccessKeyId']:
-        argv['AWSAccessKeyId'] = getLicenseKey()
-    argv.update(getOptions())
-    argv.update({'Service':'AWSECommerceService',
-                 'Timestamp':datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ'),
-                 'Version':VERSION})
-
-    return buildQuery(argv)
+    metrics = METRICS
+    if metrics is not None:
+        start = time.time()
+    license = ''
+    if not argv.get('AWSAccessKeyId'):
+        license = getLicenseKey()
+    url = __signer(__supportedLocales[getLocale()], license).url(argv)
+    if metrics is not None:
+        metrics.timing(argv.get('Operation'), 'build', time.time() - start)
+    return url
 
 def buildException(els):
     """Build the exception from the returned DOM node
     Note: only the first exception is raised."""
 
     error = els[0]
-    class_name = error.childNodes[0].firstChild.data[4:]
-    msg = error.childNodes[1].firstChild.data 
+    return __exception(error.childNodes[0].firstChild.data, error.childNodes[1].firstChild.data)
+
 
+def __exception(code, msg):
+    """Build the exception from the error code, like AWS.InternalError"""
+    class_name = code[4:]
     e = globals()[ class_name ](msg)
     return e
 
 
+def __queryWith(handler, XMLSearch, arguments):
+    """Call `XMLSearch` with `query` replaced by `handler` in the current
+    thread, and return what `handler(url)` returns."""
+    previous = getattr(__local, 'query', None)
+    __local.query = handler
+    try:
+        return XMLSearch(** arguments)
+    finally:
+        __local.query = previous
+
+
+def withTransport(transport, function, *args, **kwargs):
+    """Call `function` with the requests of the current thread sent by
+    `transport(url)` => (status, body) instead of the `ConnectionPool`,
+    and return what `function` returns. The cache still applies."""
+    previous = getattr(__local, 'transport', None)
+    __local.transport = transport
+    try:
+        return function(*args, **kwargs)
+    finally:
+        __local.transport = previous
+
+
+def canonicalRequest(url):
+    """Return (key, arguments) of the request url: the key is the
+    location and the sorted arguments but Timestamp and Signature, so
+    it is the same for the same request signed at another time."""
+
+    scheme, netloc, path, params, qs, fragment = urlparse.urlparse(url)
+    pairs = [x for x in qs.split('&')
+        if x and not x.startswith('Timestamp=') and not x.startswith('Signature=')]
+    pairs.sort()
+    arguments = dict([(k, urllib.unquote(v)) for k, v in [(x.split('=', 1) + [''])[:2] for x in pairs]])
+    return netloc + path + '?' + '&'.join(pairs), arguments
+
+
+def fetch(url):
+    """Send the query url and return the raw response body, from the
+    cache set by `setCache` if possible"""
+    return fetchResponse(url)[1]
+
+
+def fetchResponse(url):
+    """Send the query url and return (HTTP status, raw response body),
+    from the cache set by `setCache` if possible"""
+    metrics = METRICS
+    cache = getCache()
+    if cache:
+        body = cache.get(url)
+        if metrics is not None:
+            metrics.count(__operation(url), body is None and 'cache.misses' or 'cache.hits')
+        if body is not None:
+            return 200, body
+
+    if metrics is not None:
+        start = time.time()
+    archive = ARCHIVE
+    transport = getattr(__local, 'transport', None)
+    if transport is None and archive is not None and REPLAY:
+        transport = archive.replay
+    sent = [True]
+    key = transport is None and COALESCING is not None and coalescingKey(url)
+    if transport is not None:
+        status, body = transport(url)
+    elif key:
+        # only the function of the call run is called
+        sent = []
+        status, body = COALESCING.call(('fetch', key), lambda: sent.append(True) or __send(url))
+    else:
+        status, body = __send(url)
+    if metrics is not None:
+        operation = __operation(url)
+        metrics.timing(operation, 'network', time.time() - start)
+        if sent:
+            metrics.count(operation, 'requests')
+            metrics.count(operation, 'bytes', len(body))
+        else:
+            metrics.count(operation, 'coalesced')
+    if not sent:
+        # the request run stores the response
+        return status, body
+    if archive is not None and not REPLAY and status < 500:
+        archive.record(url, status, body)
+
+    if cache:
+        cache.put(url, body, status)
+    return status, body
+
+
+def __operation(url):
+    """Return the Operation argument of the request url"""
+    start = url.find('Operation=')
+    if start < 0:
+        return None
+    start += len('Operation=')
+    end = url.find('&', start)
+    if end < 0:
+        end = len(url)
+    return url[start:end]
+
+
+def __parse(url, body):
+    """Return the DOM of the response `body` of `url`"""
+    metrics = METRICS
+    if metrics is None:
+        return minidom.parseString(body)
+    start = time.time()
+    dom = minidom.parseString(body)
+    metrics.timing(__operation(url), 'parse', time.time() - start)
+    return dom
+
+
+def __send(url):
+    """Send the query url by the `ConnectionPool`, return (status, body).
+    The request waits for the `RateLimiter`, and its transient failures
+    are retried as the `RetryPolicy` of its operation says."""
+    arguments = canonicalRequest(url)[1]
+    category = OPERATION_CLASSES.get(arguments.get('Operation'), 'lookup')
+    if category == 'mutation' and getattr(__local, 'idempotent', False):
+        category = 'cart'
+    policies = getRetry()
+    policy = None
+    if policies:
+        policy = policies.get(category)
+        if policy is not None and policy.budget is not None:
+            policy.budget.deposit()
+
+    start = time.time()
+    attempt = 0
+    while True:
+        limiter = getRateLimiter()
+        if limiter is not None:
+            limiter.acquire(url)
+        try:
+            status, body = getConnectionPool().urlopen(url, resend=category <> 'mutation')
+        except (socket.error, httplib.HTTPException):
+            failure = sys.exc_info()
+        else:
+            if status <> 503 and body.find('<Code>AWS.InternalError</Code>') < 0:
+                return status, body
+            failure = None
+
+        attempt += 1
+        delay = None
+        if policy is not None:
+            delay = policy.retry(attempt, time.time() - start)
+            if METRICS is not None:
+                METRICS.count(__operation(url), delay is None and 'failures' or 'retries')
+        if delay is None:
+            if failure is not None:
+                raise failure[0], failure[1], failure[2]
+            return status, body
+        time.sleep(delay)
+
+
+def idempotent(function, *args, **kwargs):
+    """Call `function` with its Cart mutations retried like CartGet, and
+    return what `function` returns. Only for the mutations that are
+    safe to repeat, like a CartModify setting a quantity."""
+    previous = getattr(__local, 'idempotent', False)
+    __local.idempotent = True
+    try:
+        return function(*args, **kwargs)
+    finally:
+        __local.idempotent = previous
+
+
 def query(url):
     """Send the query url and return the DOM
     Exception is raised if there are errors"""
-    u = urllib.FancyURLopener()
-    usock = u.open(url)
-    dom = minidom.parse(usock)
-    usock.close()
+    handler = getattr(__local, 'query', None)
+    if handler is not None:
+        return handler(url)
+
+    key = COALESCING is not None and getattr(__local, 'transport', None) is None and coalescingKey(url)
+    if key:
+        dom = COALESCING.call(('query', key), lambda: __parse(url, fetch(url)))
+    else:
+        dom = __parse(url, fetch(url))
 
     errors = dom.getElementsByTagName('Error')
     if errors:
@@ -636,7 +2774,7 @@ def query(url):
     return dom
 
 
-def unmarshal(XMLSearch, arguments, element, plugins=None, rc=None):
+def unmarshal(XMLSearch, arguments, element, plugins=None, rc=None, projection=None):
     """Return the `Bag` / `listIterator` object with attributes 
     populated using DOM element.
     
@@ -648,6 +2786,9 @@ def unmarshal(XMLSearch, arguments, element, plugins=None, rc=None):
     - `plugins`: a dictionary, collection of plugged objects to fine-tune
       the object attributes
     - `rc`: Bag object, parent object
+    - `projection`: a list of dotted attribute paths, the items, or the
+      element if `rc` is None, are unmarshalled to flat records of these
+      attributes only, see `Projection`
 
     This core function is inspired by Mark Pilgrim (f8dy@diveintomark.org)
     with some enhancement. Each node.tagName is evalued by plugins' callback
@@ -666,49 +2807,296 @@ def unmarshal(XMLSearch, arguments, element, plugins=None, rc=None):
     - if tagname in plugins['isPaged'].keys():
         this pagedIterator is constructed for the object
 
-    CODE DEBT:
-    
-    - Use optimal search for optimization if necessary
+    The plugins are compiled once to a dispatch table, so each element
+    costs a single dictionary lookup.
+    """
+
+    if projection:
+        plugins = __projected(plugins, projection)
+    table = __dispatchTable(plugins)
+    projection = plugins and plugins.get('projection') or None
+    if projection is not None:
+        project = lambda element: projection.record(
+            __unmarshal(XMLSearch, arguments, element, plugins, table, None, None, projection.tree))
+        if rc is None:
+            return project(element)
+        return __unmarshal(XMLSearch, arguments, element, plugins, table, rc, None, None, project)
+
+    load = None
+    if LAZY:
+        load = lambda element, bag, name: __unmarshal(XMLSearch, arguments, element, plugins, table, bag, load,
+            name is not None and {name: None} or None)
+    return __unmarshal(XMLSearch, arguments, element, plugins, table, rc, load)
+
+
+def __unmarshal(XMLSearch, arguments, element, plugins, table, rc=None, load=None, tree=None, project=None):
+    """`unmarshal` with the dispatch table of the plugins.
+
+    - `load`: the `LazyBag` loader, the elements with children are
+      unmarshalled to lazy bags if given
+    - `tree`: name => subtree or None, the elements out of the tree are
+      skipped, see `Projection`
+    - `project`: a function, element => the value of a collected child
     """
 
-    if(rc == None):
+    owned = rc is None
+    if owned:
         rc = Bag()
-    
-    childElements = [e for e in element.childNodes if isinstance(e, minidom.Element)]
-
-    if childElements:
-        for child in childElements:
-            key = child.tagName
-            if hasattr(rc, key):
-                attr = getattr(rc, key)
-                if type(attr) <> type([]):
-                    setattr(rc, key, [attr])
-                setattr(rc, key, getattr(rc, key) + [unmarshal(XMLSearch, arguments, child, plugins)])
-            elif isinstance(child, minidom.Element):
-                if child.tagName in plugins['isCollected']:
-                    rc.append(unmarshal(XMLSearch, arguments, child, plugins))
-                elif child.tagName in plugins['isCollective']:
-                    setattr(rc, key, unmarshal(XMLSearch, arguments, child, plugins, listIterator([])))
-                elif child.tagName in plugins['isPaged'].keys():
-                    setattr(rc, key, pagedIterator(XMLSearch, arguments, (child.tagName, plugins['isPaged'][child.tagName]), child, plugins))
-                elif child.tagName in plugins['isPivoted']:
-                    unmarshal(XMLSearch, arguments, child, plugins, rc)
-                elif child.tagName in plugins['isBypassed']:
-                    continue
-                else:
-                    setattr(rc, key, unmarshal(XMLSearch, arguments, child, plugins))
-    else:
-        rc = "".join([e.data for e in element.childNodes if isinstance(e, minidom.Text)])
+    attributes = rc.__dict__
+    text = []
+    leaf = True
+
+    for child in element.childNodes:
+        if child.nodeType <> __ELEMENT_NODE:
+            if child.nodeType in __TEXT_NODES:
+                text.append(child.data)
+            continue
+        leaf = False
+        key = child.tagName
+        action = table.get(key)
+        subtree = tree
+        if tree is not None and action <> 'pivot' and action <> 'collected':
+            if not tree.has_key(key):
+                continue
+            subtree = tree[key]
+        if key in attributes:
+            value = __lazy(XMLSearch, arguments, child, plugins, table, load, subtree)
+            attr = attributes[key]
+            if type(attr) is list:
+                attr.append(value)
+            else:
+                attributes[key] = [attr, value]
+            continue
+
+        if action is None:
+            attributes[key] = __lazy(XMLSearch, arguments, child, plugins, table, load, subtree)
+        elif action == 'collected':
+            if project is None:
+                rc.append(__lazy(XMLSearch, arguments, child, plugins, table, load, subtree))
+            else:
+                rc.append(project(child))
+        elif action == 'collective':
+            attributes[key] = __unmarshal(XMLSearch, arguments, child, plugins, table, listIterator([]), load, subtree)
+        elif action == 'paged':
+            attributes[key] = pagedIterator(XMLSearch, arguments, (key, plugins['isPaged'][key]), child, plugins)
+        elif action == 'pivot':
+            __unmarshal(XMLSearch, arguments, child, plugins, table, rc, load, subtree, project)
+
+    if leaf:
+        rc = "".join(text)
+    if COMPACT and (owned or leaf):
+        # the containers of the caller, as the grandparent of a pivot,
+        # are compacted by their owner
+        rc = compact(rc)
     return rc
 
 
+def __lazy(XMLSearch, arguments, element, plugins, table, load, tree=None):
+    """Unmarshal the element, to a `LazyBag` if `load` is given and the
+    element has children"""
+    if load is not None and tree is None:
+        for child in element.childNodes:
+            if child.nodeType == __ELEMENT_NODE:
+                return LazyBag(element, load)
+    return __unmarshal(XMLSearch, arguments, element, plugins, table, None, load, tree)
+
+
+class __StreamHandler:
+    """The expat callbacks of `streamUnmarshal`
+
+    Each open element of the kwItems subtree is kept on `frames` as
+    [action, tagname, container, parent frame, projection tree]; the
+    container is only created when the first child element starts, an
+    element without children is unmarshalled to its text, as `unmarshal`
+    does. The elements out of the projection tree are skipped."""
+
+    def __init__(self, XMLSearch, arguments, kwItems, plugins, table, rc):
+        self.search = XMLSearch
+        self.arguments = arguments
+        self.kwItems = kwItems
+        self.plugins = plugins
+        self.table = table
+        self.projection = plugins and plugins.get('projection') or None
+        self.rc = rc
+        self.result = rc
+        self.parser = None
+        """the expat parser, set by `streamUnmarshal`"""
+
+        self.frames = None
+        """open elements of the kwItems subtree, None outside of it"""
+        self.done = False
+        self.skip = 0
+        """depth inside a bypassed or skipped element"""
+        self.text = []
+        self.error = None
+        self.errors = []
+        """(code, message) of the Error elements"""
+
+    def container(self, frame):
+        action, key, container, parent, tree = frame
+        if action == 'pivot':
+            return self.container(parent)
+        if container is None:
+            if action in ('collective', 'paged'):
+                container = listIterator([])
+            elif action == 'root' and self.rc is not None:
+                container = self.rc
+            else:
+                container = Bag()
+            frame[2] = container
+        return container
+
+    def start(self, tag, attributes):
+        self.text = []
+        if tag == 'Error':
+            self.error = {}
+        if self.skip:
+            self.skip += 1
+            return
+        if self.frames is None:
+            if tag == self.kwItems and not self.done:
+                tree = None
+                if self.projection is not None and self.rc is None:
+                    tree = self.projection.tree
+                self.frames = [['root', tag, None, None, tree]]
+            return
+
+        parent = self.frames[-1]
+        tree = parent[4]
+        if tag in self.container(parent).__dict__:
+            action = 'repeat'
+        else:
+            action = self.table.get(tag, 'plain')
+            if action == 'bypass':
+                self.skip = 1
+                return
+        if tree is not None and action <> 'pivot' and action <> 'collected':
+            if not tree.has_key(tag):
+                self.prune()
+                return
+            tree = tree[tag]
+        elif action == 'collected' and tree is None and parent[0] == 'root' and self.projection is not None:
+            action, tree = 'record', self.projection.tree
+        self.frames.append([action, tag, None, parent, tree])
+
+    def end(self, tag):
+        text = "".join(self.text)
+        self.text = []
+        if self.error is not None:
+            if tag == 'Error':
+                self.errors.append((self.error.get('Code', ''), self.error.get('Message')))
+                self.error = None
+            else:
+                self.error[tag] = text
+        if self.skip:
+            self.skip -= 1
+            return
+        if self.frames is None:
+            return
+
+        action, key, value, parent, tree = self.frames.pop()
+        if action == 'pivot':
+            return
+        if value is None:
+            value = text
+        if COMPACT:
+            value = compact(value)
+        if action == 'root':
+            if tree is not None:
+                value = self.projection.record(value)
+            self.result = value
+            self.frames = None
+            self.done = True
+            return
+
+        rc = self.container(parent)
+        if action == 'repeat':
+            attr = rc.__dict__[key]
+            if type(attr) is list:
+                attr.append(value)
+            else:
+                rc.__dict__[key] = [attr, value]
+        elif action == 'collected':
+            rc.append(value)
+        elif action == 'record':
+            rc.append(self.projection.record(value))
+        elif action == 'paged':
+            rc.__dict__[key] = pagedIterator(self.search, self.arguments, (key, self.plugins['isPaged'][key]), value, self.plugins)
+        else:
+            rc.__dict__[key] = value
+
+    def characters(self, data):
+        self.text.append(data)
+
+    def prune(self):
+        """Skip the element started, out of the projection tree, with no
+        python callback for its content"""
+        self.skip = 1
+        self.parser.StartElementHandler = self.pruneStart
+        self.parser.EndElementHandler = self.pruneEnd
+        self.parser.CharacterDataHandler = None
+
+    def pruneStart(self, tag, attributes):
+        self.skip += 1
+
+    def pruneEnd(self, tag):
+        self.skip -= 1
+        if not self.skip:
+            self.text = []
+            self.parser.StartElementHandler = self.start
+            self.parser.EndElementHandler = self.end
+            self.parser.CharacterDataHandler = self.characters
+
+
+def streamUnmarshal(XMLSearch, arguments, body, kwItems, plugins=None, rc=None, errors=None):
+    """Return the `Bag` / `listIterator` object with attributes
+    populated from the first `kwItems` element of the XML `body`.
+
+    The result is the same as `unmarshal` over the DOM, but the objects
+    are built directly from the expat parse events, so neither the DOM
+    nor the text outside of `kwItems` is kept in memory. The `Error`
+    elements are collected as the document is parsed, the first one is
+    raised like `query` does.
+
+    Parameters:
+
+    - `XMLSearch`: callback function, used when construct pagedIterator
+    - `arguments`: arguments of `XMLSearch`
+    - `body`: string, the response returned by `fetch`
+    - `kwItems`: string, the tagname of the element interested in
+    - `plugins`: a dictionary, collection of plugged objects to fine-tune
+      the object attributes, see `unmarshal`
+    - `rc`: Bag object, parent object
+    - `errors`: a list, if specified the exceptions are appended to it
+      instead of being raised
+    """
+    handler = __StreamHandler(XMLSearch, arguments, kwItems, plugins, __dispatchTable(plugins), rc)
+    parser = handler.parser = expat.ParserCreate()
+    parser.buffer_text = True
+    parser.StartElementHandler = handler.start
+    parser.EndElementHandler = handler.end
+    parser.CharacterDataHandler = handler.characters
+    parser.Parse(body, True)
+
+    if errors is not None:
+        errors.extend([__exception(code, msg) for code, msg in handler.errors])
+    elif handler.errors:
+        raise __exception(* handler.errors[0])
+    return handler.result
+
+
     
 # User interfaces
 
-def ItemLookup(ItemId, IdType=None, SearchIndex=None, MerchantId=None, Condition=None, DeliveryMethod=None, ISPUPostalCode=None, OfferPage=None, ReviewPage=None, ReviewSort=None, VariationPage=None, ResponseGroup=None, AWSAccessKeyId=None): 
-    '''ItemLookup in ECS'''
-    return pagedWrapper(XMLItemLookup, vars(), 
-        ('Items', __plugins['ItemLookup']['isPaged']['Items']), __plugins['ItemLookup'])
+def ItemLookup(ItemId, IdType=None, SearchIndex=None, MerchantId=None, Condition=None, DeliveryMethod=None, ISPUPostalCode=None, OfferPage=None, ReviewPage=None, ReviewSort=None, VariationPage=None, ResponseGroup=None, AWSAccessKeyId=None, projection=None): 
+    '''ItemLookup in ECS
+
+    The items are flat records of the `projection` attributes if given,
+    see `Projection`.'''
+    argv = dict(vars())
+    del argv['projection']
+    plugins = getPlugins('ItemLookup', projection)
+    return pagedWrapper(XMLItemLookup, argv, ('Items', plugins['isPaged']['Items']), plugins)
 
     
 def XMLItemLookup(ItemId, IdType=None, SearchIndex=None, MerchantId=None, Condition=None, DeliveryMethod=None, ISPUPostalCode=None, OfferPage=None, ReviewPage=None, ReviewSort=None, VariationPage=None, ResponseGroup=None, AWSAccessKeyId=None): 
@@ -718,11 +3106,168 @@ def XMLItemLookup(ItemId, IdType=None, SearchIndex=None, MerchantId=None, Condit
     return query(buildRequest(vars()))
 
 
-def ItemSearch(Keywords, SearchIndex="Blended", Availability=None, Title=None, Power=None, BrowseNode=None, Artist=None, Author=None, Actor=None, Director=None, AudienceRating=None, Manufacturer=None, MusicLabel=None, Composer=None, Publisher=None, Brand=None, Conductor=None, Orchestra=None, TextStream=None, ItemPage=None, OfferPage=None, ReviewPage=None, Sort=None, City=None, Cuisine=None, Neighborhood=None, MinimumPrice=None, MaximumPrice=None, MerchantId=None, Condition=None, DeliveryMethod=None, ResponseGroup=None, AWSAccessKeyId=None):  
-    '''ItemSearch in ECS'''
+def ItemLookupMany(ASINs, MerchantId=None, Condition=None, DeliveryMethod=None, ISPUPostalCode=None, OfferPage=None, ReviewPage=None, ReviewSort=None, VariationPage=None, ResponseGroup=None, AWSAccessKeyId=None, workers=1, projection=None):
+    '''ItemLookup of many ASINs, packing 10 ASINs per request
+
+    The requests are sent by `workers` threads. Return a `listIterator`
+    in the order of ASINs: the item, or the exception raised for that
+    ASIN, e.g. InvalidParameterValue for an unknown ASIN. The items are
+    flat records of the `projection` attributes if given, ASIN
+    included, see `Projection`.'''
+
+    argv = dict(vars())
+    for x in ('ASINs', 'workers', 'projection'):
+        del argv[x]
+    if projection and 'ASIN' not in projection:
+        raise BadOption, ('The projection must include ASIN')
+    plugins = getPlugins('ItemLookup', projection)
+
+    unique = []
+    seen = set()
+    for asin in ASINs:
+        if asin not in seen:
+            seen.add(asin)
+            unique.append(asin)
+    chunks = [unique[i:i + 10] for i in range(0, len(unique), 10)]
+
+    results = {}
+    for found in __parallel(lambda chunk: __lookupChunk(argv, chunk, plugins), chunks, workers):
+        results.update(found)
+    return listIterator([results[asin] for asin in ASINs])
+
+
+def __lookupChunk(argv, chunk, plugins):
+    '''Look up to 10 ASINs, return ASIN => item or exception'''
+
+    arguments = dict(argv)
+    arguments['ItemId'] = ",".join(chunk)
+    errors = []
+    items = rawObject(XMLItemLookup, arguments, 'Items', plugins, listIterator(), errors)
+
+    rc = {}
+    if isinstance(items, listIterator):
+        for item in items:
+            rc[item.ASIN] = item
+    missing = [asin for asin in chunk if not rc.has_key(asin)]
+    for e in errors:
+        # 'XXXXXXXXXX is not a valid value for ItemId. ...'
+        failed = [asin for asin in missing if asin in str(e)] or missing
+        for asin in failed:
+            rc.setdefault(asin, e)
+    for asin in missing:
+        rc.setdefault(asin, AWSException("%s is not returned by ItemLookup" % asin))
+    return rc
 
-    return pagedWrapper(XMLItemSearch, vars(), 
-        ('Items', __plugins['ItemSearch']['isPaged']['Items']), __plugins['ItemSearch'])
+
+def __parallel(function, arguments, workers):
+    '''Return [function(x) for x in arguments], computed by `workers`
+    threads. The first exception raised by function is raised. The
+    requests sent by a transport, see `withTransport`, are sent from
+    the calling thread.'''
+
+    if workers <= 1 or len(arguments) <= 1 or getattr(__local, 'transport', None) is not None:
+        return [function(x) for x in arguments]
+
+    results = [None] * len(arguments)
+    failures = []
+    client = getClient()
+    tasks = Queue.Queue()
+    for task in enumerate(arguments):
+        tasks.put(task)
+
+    def work():
+        while True:
+            try:
+                i, x = tasks.get_nowait()
+            except Queue.Empty:
+                return
+            try:
+                results[i] = withClient(client, function, x)
+            except Exception, e:
+                failures.append(sys.exc_info())
+
+    threads = [threading.Thread(target=work) for i in range(min(workers, len(arguments)))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if failures:
+        raise failures[0][0], failures[0][1], failures[0][2]
+    return results
+
+
+def fanOut(locales, timeout, function, *args, **kwargs):
+    '''Call `function` in each of the `locales` at the same time, and
+    return a dictionary locale => what `function` returns, or the
+    exception it raised. For example::
+
+        prices = fanOut(None, 5, ItemLookup, '0596009259', ResponseGroup='Offers')
+
+    - `locales`: a list of locales, all the supported locales if None
+    - `timeout`: seconds, or a dictionary locale => seconds; the
+      locales that have not answered in time are mapped to
+      `LocaleTimeout`, their threads are left to finish in background.
+      None to wait for every locale.
+
+    Each locale is called in its own thread, with the keys, the options,
+    the connection pool and the cache of the current `ECSClient`.
+    '''
+
+    client = getClient()
+    if locales is None:
+        locales = getLocales()
+    clients = {}
+    for locale in locales:
+        clients[locale] = ECSClient(client.getLicenseKey(), client.getSecretAccessKey(), locale,
+            client.getOptions(), client.getConnectionPool(), client.getCache())
+
+    results = Queue.Queue()
+    def work(locale):
+        try:
+            results.put((locale, withClient(clients[locale], function, *args, **kwargs)))
+        except Exception, e:
+            results.put((locale, e))
+
+    start = time.time()
+    deadlines = {}
+    for locale in clients:
+        seconds = timeout
+        if isinstance(timeout, dict):
+            seconds = timeout.get(locale)
+        if seconds is not None:
+            deadlines[locale] = start + seconds
+        thread = threading.Thread(target=work, args=(locale,))
+        thread.setDaemon(True)
+        thread.start()
+
+    rc = {}
+    while len(rc) < len(clients):
+        pending = [deadlines[x] for x in deadlines if not rc.has_key(x)]
+        try:
+            if pending:
+                locale, result = results.get(True, max(0, min(pending) - time.time()))
+            else:
+                locale, result = results.get()
+        except Queue.Empty:
+            now = time.time()
+            for locale, deadline in deadlines.items():
+                if deadline <= now and not rc.has_key(locale):
+                    rc[locale] = LocaleTimeout("%s has not answered in %.3g seconds" % (locale, deadline - start))
+        else:
+            rc.setdefault(locale, result)
+    return rc
+
+
+def ItemSearch(Keywords, SearchIndex="Blended", Availability=None, Title=None, Power=None, BrowseNode=None, Artist=None, Author=None, Actor=None, Director=None, AudienceRating=None, Manufacturer=None, MusicLabel=None, Composer=None, Publisher=None, Brand=None, Conductor=None, Orchestra=None, TextStream=None, ItemPage=None, OfferPage=None, ReviewPage=None, Sort=None, City=None, Cuisine=None, Neighborhood=None, MinimumPrice=None, MaximumPrice=None, MerchantId=None, Condition=None, DeliveryMethod=None, ResponseGroup=None, AWSAccessKeyId=None, projection=None):  
+    '''ItemSearch in ECS
+
+    The items are flat records of the `projection` attributes if given,
+    see `Projection`.'''
+
+    argv = dict(vars())
+    del argv['projection']
+    plugins = getPlugins('ItemSearch', projection)
+    return pagedWrapper(XMLItemSearch, argv, ('Items', plugins['isPaged']['Items']), plugins)
 
 
 def XMLItemSearch(Keywords, SearchIndex="Blended", Availability=None, Title=None, Power=None, BrowseNode=None, Artist=None, Author=None, Actor=None, Director=None, AudienceRating=None, Manufacturer=None, MusicLabel=None, Composer=None, Publisher=None, Brand=None, Conductor=None, Orchestra=None, TextStream=None, ItemPage=None, OfferPage=None, ReviewPage=None, Sort=None, City=None, Cuisine=None, Neighborhood=None, MinimumPrice=None, MaximumPrice=None, MerchantId=None, Condition=None, DeliveryMethod=None, ResponseGroup=None, AWSAccessKeyId=None):  
@@ -735,15 +3280,7 @@ def XMLItemSearch(Keywords, SearchIndex="Blended", Availability=None, Title=None
 def SimilarityLookup(ItemId, SimilarityType=None, MerchantId=None, Condition=None, DeliveryMethod=None, ResponseGroup=None, AWSAccessKeyId=None):  
     '''SimilarityLookup in ECS'''
 
-    argv = vars()
-    plugins = {
-        'isBypassed': (), 
-        'isPivoted': ('ItemAttributes',),
-        'isCollective': ('Items',),
-        'isCollected': ('Item',),
-        'isPaged': {}
-    }
-    return rawIterator(XMLSimilarityLookup, argv, 'Items', plugins)
+    return rawIterator(XMLSimilarityLookup, vars(), 'Items', __plugins['SimilarityLookup'])
 
 
 def XMLSimilarityLookup(ItemId, SimilarityType=None, MerchantId=None, Condition=None, DeliveryMethod=None, ResponseGroup=None, AWSAccessKeyId=None):  
@@ -758,16 +3295,8 @@ def XMLSimilarityLookup(ItemId, SimilarityType=None, MerchantId=None, Condition=
 def ListLookup(ListType, ListId, ProductPage=None, ProductGroup=None, Sort=None, MerchantId=None, Condition=None, DeliveryMethod=None, ResponseGroup=None, AWSAccessKeyId=None):  
     '''ListLookup in ECS'''
 
-    argv = vars()
-    plugins = {
-        'isBypassed': (), 
-        'isPivoted': ('ItemAttributes',),
-        'isCollective': ('Lists',), 
-        'isCollected': ('List',),
-        'isPaged' : { 'Lists': ('ProductPage', 'TotalResults', 10) }
-    }
-    return pagedWrapper(XMLListLookup, argv, 
-        ('Lists', plugins['isPaged']['Lists']), plugins)
+    return pagedWrapper(XMLListLookup, vars(), 
+        ('Lists', __plugins['ListLookup']['isPaged']['Lists']), __plugins['ListLookup'])
 
 
 def XMLListLookup(ListType, ListId, ProductPage=None, ProductGroup=None, Sort=None, MerchantId=None, Condition=None, DeliveryMethod=None, ResponseGroup=None, AWSAccessKeyId=None):  
@@ -780,16 +3309,8 @@ def XMLListLookup(ListType, ListId, ProductPage=None, ProductGroup=None, Sort=No
 def ListSearch(ListType, Name=None, FirstName=None, LastName=None, Email=None, City=None, State=None, ListPage=None, ResponseGroup=None, AWSAccessKeyId=None):
     '''ListSearch in ECS'''
 
-    argv = vars()
-    plugins = {
-        'isBypassed': (), 
-        'isPivoted': ('ItemAttributes',),
-        'isCollective': ('Lists',), 
-        'isCollected': ('List',),
-        'isPaged' : { 'Lists': ('ListPage', 'TotalResults', 10) }
-    }
-    return pagedWrapper(XMLListSearch, argv, 
-        ('Lists', plugins['isPaged']['Lists']), plugins)
+    return pagedWrapper(XMLListSearch, vars(), 
+        ('Lists', __plugins['ListSearch']['isPaged']['Lists']), __plugins['ListSearch'])
 
 
 def XMLListSearch(ListType, Name=None, FirstName=None, LastName=None, Email=None, City=None, State=None, ListPage=None, ResponseGroup=None, AWSAccessKeyId=None):
@@ -905,29 +3426,14 @@ def __fromListToItems(argv, items, id, actions):
 def __cartOperation(XMLSearch, arguments):
     '''Generic cart operation'''
 
-    plugins = {
-        'isBypassed': ('Request',),
-        'isPivoted': (), 
-        'isCollective': ('CartItems', 'SavedForLaterItems'),
-        'isCollected': ('CartItem', 'SavedForLaterItem'),
-        'isPaged': {}
-    }
-    return rawObject(XMLSearch, arguments, 'Cart', plugins)
+    return rawObject(XMLSearch, arguments, 'Cart', __plugins['Cart'])
 
 
 # Seller Operation
 def SellerLookup(Sellers, FeedbackPage=None, ResponseGroup=None, AWSAccessKeyId=None):
     '''SellerLookup in AWS'''
 
-    argv = vars()
-    plugins = {
-        'isBypassed': ('Request',),
-        'isPivoted': (), 
-        'isCollective': ('Sellers',),
-        'isCollected': ('Seller',),
-        'isPaged': {}
-    }
-    return rawIterator(XMLSellerLookup, argv, 'Sellers', plugins)
+    return rawIterator(XMLSellerLookup, vars(), 'Sellers', __plugins['SellerLookup'])
 
 
 def XMLSellerLookup(Sellers, FeedbackPage=None, ResponseGroup=None, AWSAccessKeyId=None):
@@ -947,15 +3453,7 @@ def SellerListingLookup(SellerId, Id, IdType="Listing", ResponseGroup=None, AWSA
     there is no ListingPage in the request, so we have to use rawIterator
     instead of pagedIterator. Hope Amazaon would fix this inconsistance'''
     
-    argv = vars()
-    plugins = {
-        'isBypassed': ('Request',),
-        'isPivoted': (), 
-        'isCollective': ('SellerListings',), 
-        'isCollected': ('SellerListing',),
-        'isPaged': {}
-    }
-    return rawIterator(XMLSellerListingLookup, argv, "SellerListings", plugins)
+    return rawIterator(XMLSellerListingLookup, vars(), "SellerListings", __plugins['SellerListingLookup'])
 
 
 def XMLSellerListingLookup(SellerId, Id, IdType="Listing", ResponseGroup=None, AWSAccessKeyId=None):
@@ -968,16 +3466,8 @@ def XMLSellerListingLookup(SellerId, Id, IdType="Listing", ResponseGroup=None, A
 def SellerListingSearch(SellerId, Title=None, Sort=None, ListingPage=None, OfferStatus=None, ResponseGroup=None, AWSAccessKeyId=None):
     '''SellerListingSearch in AWS'''
 
-    argv = vars()
-    plugins = {
-        'isBypassed': ('Request',),
-        'isPivoted': (), 
-        'isCollective': ('SellerListings',), 
-        'isCollected': ('SellerListing',),
-        'isPaged' : { 'SellerListings': ('ListingPage', 'TotalResults', 10) }
-    }
-    return pagedWrapper(XMLSellerListingSearch, argv, 
-        ('SellerListings', plugins['isPaged']['SellerListings']), plugins)
+    return pagedWrapper(XMLSellerListingSearch, vars(), 
+        ('SellerListings', __plugins['SellerListingSearch']['isPaged']['SellerListings']), __plugins['SellerListingSearch'])
 
 
 def XMLSellerListingSearch(SellerId, Title=None, Sort=None, ListingPage=None, OfferStatus=None, ResponseGroup=None, AWSAccessKeyId=None):
@@ -1007,15 +3497,7 @@ def XMLCustomerContentSearch(Name=None, Email=None, CustomerPage=1, ResponseGrou
 def CustomerContentLookup(CustomerId, ReviewPage=1, ResponseGroup=None, AWSAccessKeyId=None):
     '''CustomerContentLookup in AWS'''
 
-    argv = vars()
-    plugins = {
-        'isBypassed': ('Request',),
-        'isPivoted': (), 
-        'isCollective': ('Customers',),
-        'isCollected': ('Customer',),
-
-    }
-    return rawIterator(XMLCustomerContentLookup, argv, 'Customers', __plugins['CustomerContentLookup'])
+    return rawIterator(XMLCustomerContentLookup, vars(), 'Customers', __plugins['CustomerContentLookup'])
 
 
 def XMLCustomerContentLookup(CustomerId, ReviewPage=1, ResponseGroup=None, AWSAccessKeyId=None):
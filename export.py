@@ -0,0 +1,283 @@
+# Author: Kun Xi <kunxi@kunxi.org>
+# License: Python Software Foundation License
+
+"""
+Columnar exports of the `ecs` results.
+
+The items of a `ecs.pagedIterator` or a `ecs.listIterator` are turned
+into columns, one per dotted attribute path, like the paths of an
+`ecs.Projection`: ``['ASIN', 'SalesRank', 'OfferSummary.LowestNewPrice.Amount']``.
+The values are converted to the type of their element in the ECS schema,
+see `TYPES`, the other elements are kept as text. A value missing from
+an item, or not of the type of its column, is masked.
+
+The items are read one at a time: `batches`, `writeCSV` and
+`writeColumns` keep at most one batch of rows, and the pages cached by
+the iterator, whatever the number of results. `columns` and `array`
+keep them all.
+
+Functions:
+
+- `columns`
+- `batches`
+- `convert`
+- `array`, needs numpy
+- `writeCSV`
+- `writeColumns`
+- `readColumns`
+
+Classes:
+
+- `Columns`, the column arrays of the items
+
+Example::
+
+    books = ecs.ItemSearch('python', SearchIndex='Books', ResponseGroup='Large')
+    paths = ['ASIN', 'SalesRank', 'OfferSummary.LowestNewPrice.Amount']
+    export.writeCSV(books, paths, open('books.csv', 'wb'))
+
+The items projected to the same paths, see `ecs.getPlugins`, are read
+as well, and faster.
+"""
+
+import csv, cPickle
+import ecs
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+TYPES = {
+    'SalesRank': 'int',
+    'Amount': 'int',
+    'PercentageSaved': 'int',
+    'Quantity': 'int',
+    'TotalResults': 'int',
+    'TotalPages': 'int',
+    'TotalNew': 'int',
+    'TotalUsed': 'int',
+    'TotalCollectible': 'int',
+    'TotalRefurbished': 'int',
+    'TotalOffers': 'int',
+    'TotalOfferPages': 'int',
+    'TotalReviews': 'int',
+    'TotalReviewPages': 'int',
+    'TotalVotes': 'int',
+    'HelpfulVotes': 'int',
+    'Rating': 'int',
+    'NumberOfPages': 'int',
+    'NumberOfItems': 'int',
+    'NumberOfDiscs': 'int',
+    'AverageRating': 'float',
+    'RequestProcessingTime': 'float',
+    'IsEligibleForSuperSaverShipping': 'bool',
+    'IsLinkSuppressed': 'bool',
+    'IsValid': 'bool',
+}
+"""The type of the values of an element, by element name: 'int',
+'float', 'bool', or 'text', the default"""
+
+__DTYPES = {'int': 'i8', 'float': 'f8', 'bool': '?'}
+__BOOLEANS = {'1': True, 'true': True, '0': False, 'false': False}
+
+
+def __bool(value):
+    return __BOOLEANS[value.strip().lower()]
+
+__CONVERTERS = {'int': int, 'float': float, 'bool': __bool}
+
+
+def convert(kind, value):
+    """Return the text `value`, or the list of them, converted to the
+    type `kind`, see `TYPES`. Raise ValueError if it is not one."""
+    function = __CONVERTERS.get(kind)
+    if function is None:
+        return value
+    if isinstance(value, list):
+        return [convert(kind, x) for x in value]
+    if not isinstance(value, basestring):
+        raise ValueError, value
+    try:
+        return function(value)
+    except (KeyError, TypeError):
+        raise ValueError, value
+
+
+class Columns:
+    """
+    The column arrays of the items, see `columns`.
+
+    `values` and `mask` map each field, the path with '.' replaced by
+    '_', to a list with one entry per item. A masked value is set to the
+    zero of its type. A path meeting several values is a list of them.
+    """
+
+    zeros = {'int': 0, 'float': 0.0, 'bool': False, 'text': u''}
+    """type => the value of the masked entries"""
+
+    def __init__(self, paths, types=None):
+        """
+        - `paths`: a list of dotted attribute paths, or an `ecs.Projection`
+        - `types`: a dictionary, path => 'int', 'float', 'bool' or 'text',
+          the types not given are those of `TYPES`
+        """
+        if not isinstance(paths, ecs.Projection):
+            paths = ecs.Projection(paths)
+        types = types or {}
+        self.projection = paths
+        self.fields = paths.fields
+        self.types = {}
+        """field => type"""
+        for path, field in zip(paths.paths, paths.fields):
+            kind = types.get(path) or TYPES.get(path.split('.')[-1], 'text')
+            if not self.zeros.has_key(kind):
+                raise ecs.BadOption, ('Unknown type %s of %s' % (kind, path))
+            self.types[field] = kind
+        self.values = dict([(x, []) for x in self.fields])
+        self.mask = dict([(x, []) for x in self.fields])
+
+    def __len__(self):
+        return len(self.mask[self.fields[0]])
+
+    def append(self, item):
+        """Add the values of the unmarshalled, or projected, `item`"""
+        projection = self.projection
+        for path, field in zip(projection.paths, self.fields):
+            value = getattr(item, field, self)
+            if value is self:
+                value = projection.value(item, path)
+            kind = self.types[field]
+            try:
+                if value is None:
+                    raise ValueError
+                value = convert(kind, value)
+                masked = False
+            except ValueError:
+                value = self.zeros[kind]
+                masked = True
+            self.values[field].append(value)
+            self.mask[field].append(masked)
+
+    def extend(self, items):
+        for item in items:
+            self.append(item)
+
+    def rows(self):
+        """Return the list of the (values, mask) tuples of the items"""
+        fields = self.fields
+        return zip(zip(*[self.values[x] for x in fields]), zip(*[self.mask[x] for x in fields]))
+
+
+def columns(items, paths, types=None):
+    """Return the `Columns` of all the `items`, see `Columns.__init__`"""
+    rc = Columns(paths, types)
+    rc.extend(items)
+    return rc
+
+
+def batches(items, paths, size=1000, types=None):
+    """
+    Yield the `Columns` of each `size` items in turn, see
+    `Columns.__init__`. The pages of a `ecs.pagedIterator` are fetched
+    as the items are read.
+    """
+    if not isinstance(paths, ecs.Projection):
+        paths = ecs.Projection(paths)
+    batch = Columns(paths, types)
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = Columns(paths, types)
+    if len(batch):
+        yield batch
+
+
+def __dtype(kind, values):
+    if kind != 'text':
+        for value in values:
+            if isinstance(value, list):
+                return 'O'
+        return __DTYPES[kind]
+    width = 1
+    for value in values:
+        if not isinstance(value, basestring):
+            return 'O'
+        width = max(width, len(value))
+    return 'U%d' % width
+
+
+def array(columns):
+    """
+    Return the numpy masked array of the `Columns`, one record per item,
+    one field per path. The text fields are unicode strings as wide as
+    their longest value, the fields holding lists or `ecs.Bag` are
+    objects.
+    """
+    if numpy is None:
+        raise ecs.BadOption, ('the arrays need numpy')
+    fields = columns.fields
+    dtype = [(x, __dtype(columns.types[x], columns.values[x])) for x in fields]
+    rows = columns.rows()
+    data = numpy.array([x[0] for x in rows], dtype=dtype)
+    mask = numpy.array([x[1] for x in rows], dtype=[(x, '?') for x in fields])
+    return numpy.ma.array(data, mask=mask)
+
+
+def __text(value, separator):
+    if isinstance(value, list):
+        return separator.join([__text(x, separator) for x in value])
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    if isinstance(value, bool):
+        return value and '1' or '0'
+    return str(value)
+
+
+def writeCSV(items, paths, f, types=None, header=True, separator='|'):
+    """
+    Write the `items` to the file `f`, one CSV row per item, one column
+    per path, and return the number of rows.
+
+    - `header`: boolean, write the paths first
+    - `separator`: string, joins the values of a path meeting several of
+      them
+
+    A masked value is an empty column, the text is utf-8 encoded.
+    """
+    writer = csv.writer(f)
+    count = 0
+    if not isinstance(paths, ecs.Projection):
+        paths = ecs.Projection(paths)
+    if header:
+        writer.writerow(paths.paths)
+    for batch in batches(items, paths, 100, types):
+        for values, mask in batch.rows():
+            writer.writerow([not masked and __text(value, separator) or ''
+                for value, masked in zip(values, mask)])
+        count += len(batch)
+    return count
+
+
+def writeColumns(items, paths, f, size=1000, types=None):
+    """
+    Write the `items` to the file `f` as a stream of pickled `Columns`,
+    each of `size` items, and return the number of items. The file is
+    read back with `readColumns`.
+    """
+    count = 0
+    for batch in batches(items, paths, size, types):
+        cPickle.dump(batch, f, 2)
+        count += len(batch)
+    return count
+
+
+def readColumns(f):
+    """Yield the `Columns` written by `writeColumns` to the file `f`"""
+    while True:
+        try:
+            yield cPickle.load(f)
+        except EOFError:
+            return
@@ -0,0 +1,302 @@
+# Author: Kun Xi <kunxi@kunxi.org>
+# License: Python Software Foundation License
+
+"""
+Incremental sync of a catalog of ASINs with `ecs.ItemLookupMany`.
+
+Instead of looking up every ASIN of a mirror each day, `sync` looks up
+the ASINs that are due, stalest first, 10 per request, and yields only
+the items that changed since they were last fetched. The items are
+flat records of the attribute paths mirrored, see `ecs.Projection`, and
+a change is a change of their digest.
+
+The state of the catalog is saved incrementally: `Catalog.save` appends
+the entries changed since the last save to a journal next to the
+snapshot, and the snapshot is rewritten only once the journal holds
+more entries than the catalog.
+
+Each ASIN is refreshed at its own pace: its interval is halved when its
+item changed, doubled when it did not, between `Catalog.minInterval`
+and `Catalog.maxInterval`. The fast-moving offers are thus looked up
+far more often than the items that never change.
+
+Functions:
+
+- `sync`
+- `digest`
+
+Classes:
+
+- `Catalog`, the sync state of the ASINs, saved to resume the sync
+
+Example::
+
+    catalog = sync.Catalog('books.sync')
+    catalog.add(asins)
+    for asin, item in sync.sync(catalog, forever=True):
+        store(asin, item)
+"""
+
+import os, time, heapq, hashlib, cPickle
+import ecs
+
+
+PATHS = ['ASIN', 'SalesRank', 'OfferSummary.LowestNewPrice.Amount', 'OfferSummary.LowestUsedPrice.Amount',
+    'OfferSummary.TotalNew', 'OfferSummary.TotalUsed', 'ListPrice.Amount']
+"""The default attribute paths mirrored"""
+
+
+class Catalog:
+    """
+    The sync state of the ASINs, saved to `path`: for each ASIN the
+    time it is due, its refresh interval, the time it was last fetched
+    and the digest of its item. The changes since the last snapshot are
+    appended to the journal `path`.log.
+    """
+
+    def __init__(self, path=None, minInterval=3600, maxInterval=7 * 86400):
+        """
+        - `path`: string, the file the state is saved to, and loaded
+          from if it exists
+        - `minInterval`: seconds, the shortest refresh interval, of the
+          ASINs just added
+        - `maxInterval`: seconds, the longest refresh interval
+        """
+        self.path = path
+        self.minInterval = minInterval
+        self.maxInterval = maxInterval
+        self.entries = {}
+        """ASIN => [due, interval, fetched, digest]"""
+        self.__generation = 0
+        """the snapshot the journal applies to"""
+        self.__journaled = 0
+        """the entries written to the journal"""
+        self.__dirty = {}
+        """ASIN => True, the entries changed since the last save"""
+        if path is not None:
+            self.__load()
+        self.__queue = [(entry[0], asin) for asin, entry in self.entries.items()]
+        """(due, ASIN), stale ones included"""
+        heapq.heapify(self.__queue)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, asins, now=None):
+        """Add the `asins`, due `now`; the ASINs already there are kept"""
+        now = now or time.time()
+        for asin in asins:
+            if not self.entries.has_key(asin):
+                self.entries[asin] = [now, self.minInterval, None, None]
+                self.__dirty[asin] = True
+                heapq.heappush(self.__queue, (now, asin))
+
+    def remove(self, asins):
+        for asin in asins:
+            if self.entries.pop(asin, None) is not None:
+                self.__dirty[asin] = True
+
+    def nextDue(self):
+        """Return the time the next ASIN is due, None if there is none"""
+        queue = self.__queue
+        while queue:
+            due, asin = queue[0]
+            entry = self.entries.get(asin)
+            if entry is not None and entry[0] == due:
+                return due
+            heapq.heappop(queue)
+        return None
+
+    def due(self, now=None, limit=None):
+        """Return up to `limit` ASINs due `now`, stalest first. They are
+        due again after their interval unless `update` says otherwise."""
+        now = now or time.time()
+        rc = []
+        while limit is None or len(rc) < limit:
+            due = self.nextDue()
+            if due is None or due > now:
+                break
+            asin = heapq.heappop(self.__queue)[1]
+            entry = self.entries[asin]
+            self.__schedule(asin, entry, now + entry[1])
+            rc.append(asin)
+        return rc
+
+    def update(self, asin, digest, now=None):
+        """Record the `digest` of the item of `asin` fetched `now`,
+        return whether it changed"""
+        entry = self.entries.get(asin)
+        if entry is None:
+            return False
+        now = now or time.time()
+        changed = entry[3] != digest
+        if entry[3] is not None:
+            if changed:
+                entry[1] = max(self.minInterval, entry[1] / 2)
+            else:
+                entry[1] = min(self.maxInterval, entry[1] * 2)
+        entry[2] = now
+        entry[3] = digest
+        self.__schedule(asin, entry, now + entry[1])
+        return changed
+
+    def save(self):
+        """Append the entries changed since the last save to the
+        journal, or write a new snapshot if the journal grew larger
+        than the catalog"""
+        if self.path is None:
+            return
+        if self.__journaled + len(self.__dirty) > max(len(self.entries), 1000):
+            self.compact()
+            return
+        if not self.__dirty:
+            return
+        changes = [(asin, self.entries.get(asin)) for asin in self.__dirty]
+        journal = self.path + '.log'
+        empty = not os.path.exists(journal) or not os.path.getsize(journal)
+        f = open(journal, 'ab')
+        try:
+            if empty:
+                cPickle.dump(self.__generation, f, 2)
+            cPickle.dump(changes, f, 2)
+        finally:
+            f.close()
+        self.__journaled += len(changes)
+        self.__dirty.clear()
+
+    def compact(self):
+        """Write the snapshot of all the entries, and empty the journal"""
+        if self.path is None:
+            return
+        self.__generation += 1
+        temp = '%s.%d' % (self.path, os.getpid())
+        f = open(temp, 'wb')
+        try:
+            cPickle.dump((self.__generation, self.entries), f, 2)
+        finally:
+            f.close()
+        os.rename(temp, self.path)
+        # a journal of another generation is ignored anyway
+        f = open(temp, 'wb')
+        try:
+            cPickle.dump(self.__generation, f, 2)
+        finally:
+            f.close()
+        os.rename(temp, self.path + '.log')
+        self.__journaled = 0
+        self.__dirty.clear()
+
+    def __load(self):
+        """Load the snapshot, then replay the journal of its generation;
+        a change partly written is truncated away"""
+        if os.path.exists(self.path):
+            f = open(self.path, 'rb')
+            try:
+                state = cPickle.load(f)
+            finally:
+                f.close()
+            if isinstance(state, dict):
+                # a snapshot without journal
+                state = (0, state)
+            self.__generation, self.entries = state
+        journal = self.path + '.log'
+        if not os.path.exists(journal):
+            return
+        size = os.path.getsize(journal)
+        f = open(journal, 'r+b')
+        try:
+            try:
+                generation = cPickle.load(f)
+            except Exception:
+                generation = None
+            if generation != self.__generation:
+                # left by a compaction cut short
+                f.truncate(0)
+                return
+            while True:
+                offset = f.tell()
+                if offset >= size:
+                    break
+                try:
+                    changes = cPickle.load(f)
+                except Exception:
+                    f.truncate(offset)
+                    break
+                for asin, entry in changes:
+                    if entry is None:
+                        self.entries.pop(asin, None)
+                    else:
+                        self.entries[asin] = entry
+                self.__journaled += len(changes)
+        finally:
+            f.close()
+
+    def __schedule(self, asin, entry, due):
+        entry[0] = due
+        self.__dirty[asin] = True
+        heapq.heappush(self.__queue, (due, asin))
+
+
+def __canonical(value):
+    """The value with the attributes of the objects sorted by name"""
+    if isinstance(value, list):
+        return [__canonical(x) for x in value]
+    if hasattr(value, '__dict__') and not isinstance(value, basestring):
+        return sorted([(k, __canonical(v)) for k, v in vars(value).items()])
+    return value
+
+
+def digest(item):
+    """Return the digest of the item, or of the exception raised for it"""
+    if isinstance(item, Exception):
+        return hashlib.sha1('%s: %s' % (item.__class__.__name__, item)).hexdigest()
+    return hashlib.sha1(repr(__canonical(item))).hexdigest()
+
+
+def sync(catalog, paths=PATHS, ResponseGroup='Medium', batch=100, workers=4, every=10, forever=False, **kwargs):
+    """
+    Look up the ASINs of the `catalog` that are due, and yield (ASIN,
+    item) of the items that changed: the flat record of the `paths`, or
+    the exception raised for the ASIN, like InvalidParameterValue once
+    it is withdrawn.
+
+    - `paths`: a list of dotted attribute paths, ASIN included
+    - `ResponseGroup`: string, the response groups holding the `paths`
+    - `batch`: integer, the ASINs looked up at a time
+    - `workers`: integer, the threads sending the requests of a batch
+    - `every`: integer, the catalog is saved every `every` batches
+    - `forever`: boolean, wait for the next ASIN due instead of
+      returning when there is none
+
+    The other keyword arguments are those of `ecs.ItemLookupMany`. The
+    first exception raised by a request, not by an ASIN, stops the sync.
+    """
+    if 'ASIN' not in paths:
+        paths = ['ASIN'] + list(paths)
+    unsaved = 0
+    try:
+        while True:
+            asins = catalog.due(limit=batch)
+            if not asins:
+                if not forever:
+                    break
+                if unsaved:
+                    catalog.save()
+                    unsaved = 0
+                due = catalog.nextDue()
+                time.sleep(due is None and 60 or min(60, max(0.1, due - time.time())))
+                continue
+
+            items = ecs.ItemLookupMany(asins, ResponseGroup=ResponseGroup, workers=workers,
+                projection=paths, **kwargs)
+            now = time.time()
+            for asin, item in zip(asins, items):
+                if catalog.update(asin, digest(item), now):
+                    yield asin, item
+            unsaved += 1
+            if unsaved >= every:
+                catalog.save()
+                unsaved = 0
+    finally:
+        if unsaved:
+            catalog.save()
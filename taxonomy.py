@@ -0,0 +1,348 @@
+# Author: Kun Xi <kunxi@kunxi.org>
+# License: Python Software Foundation License
+
+"""
+The BrowseNode trees crawled with `ecs.BrowseNodeLookup`, and kept in a
+local index.
+
+`Taxonomy.crawl` walks the trees breadth-first from their roots. The
+nodes are looked up 10 per request by a bounded pool of threads, and a
+node is looked up once per crawl even if it is listed by several
+parents: it is kept under the first one. The ancestors of the roots,
+given by the lookups, are kept by name and parent only.
+
+The index answers the ancestors, the descendants and the path to a node
+without any request: the parent of each node is kept, and the nodes are
+numbered in preorder, so the descendants of a node are a slice of the
+preorder and `isAncestor` compares two intervals.
+
+A crawl of a taxonomy already crawled refreshes only what changed: each
+node keeps the digest of its name and of its children, and the children
+of a node whose digest did not change are not looked up again, unless
+they were fetched more than `maxAge` seconds ago. The subtrees of the
+children removed are dropped.
+
+Classes:
+
+- `Taxonomy`, the index of the nodes, saved to resume the crawls
+
+Example::
+
+    books = taxonomy.Taxonomy('books.taxonomy')
+    books.crawl(['1000'], workers=4)
+    for node in books.descendants('3952'):
+        print books.pathTo(node)
+"""
+
+import os, sys, time, Queue, hashlib, threading, cPickle
+from collections import deque
+import ecs
+
+
+class Taxonomy:
+    """
+    The BrowseNodes crawled, saved to `path`: for each node its name,
+    its parent, its children, the time it was fetched and the digest of
+    its name and children. The nodes not fetched yet, like the ancestors
+    of the roots, have no fetch time and no digest.
+    """
+
+    def __init__(self, path=None):
+        """
+        - `path`: string, the file the index is saved to, and loaded
+          from if it exists
+        """
+        self.path = path
+        self.nodes = {}
+        """BrowseNodeId => (name, parent, children, fetched, digest)"""
+        if path is not None and os.path.exists(path):
+            f = open(path, 'rb')
+            try:
+                self.nodes = cPickle.load(f)
+            finally:
+                f.close()
+        self.__order = None
+        """BrowseNodeId => (first, last), its slice of the preorder"""
+        self.__preorder = None
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def __contains__(self, node):
+        return self.nodes.has_key(node)
+
+    def name(self, node):
+        return self.nodes[node][0]
+
+    def parent(self, node):
+        """Return the parent of `node`, None for a root"""
+        return self.nodes[node][1]
+
+    def children(self, node):
+        return list(self.nodes[node][2])
+
+    def roots(self):
+        """Return the nodes without parent, in preorder"""
+        self.__index()
+        return [x for x in self.__preorder if self.nodes[x][1] is None]
+
+    def ancestors(self, node):
+        """Return the ancestors of `node`, its parent first"""
+        nodes = self.nodes
+        rc = []
+        parent = nodes[node][1]
+        while parent is not None:
+            rc.append(parent)
+            parent = nodes[parent][1]
+        return rc
+
+    def pathTo(self, node, separator=None):
+        """Return the names from the root to `node`, joined by
+        `separator` if given"""
+        names = [self.nodes[x][0] for x in [node] + self.ancestors(node)]
+        names.reverse()
+        if separator is not None:
+            return separator.join(names)
+        return names
+
+    def descendants(self, node):
+        """Return the descendants of `node`, in preorder"""
+        self.__index()
+        first, last = self.__order[node]
+        return self.__preorder[first + 1:last]
+
+    def isAncestor(self, node, descendant):
+        """Return whether `node` is an ancestor of `descendant`"""
+        self.__index()
+        first, last = self.__order[node]
+        return first < self.__order[descendant][0] < last
+
+    def save(self):
+        if self.path is None:
+            return
+        temp = '%s.%d' % (self.path, os.getpid())
+        f = open(temp, 'wb')
+        try:
+            cPickle.dump(self.nodes, f, 2)
+        finally:
+            f.close()
+        os.rename(temp, self.path)
+
+    def crawl(self, roots, workers=4, maxDepth=None, maxAge=None, ResponseGroup=None):
+        """
+        Crawl the trees of the `roots` breadth-first, save the index and
+        return the nodes added, changed or removed, in the order found.
+
+        - `roots`: a list of BrowseNodeIds, always looked up
+        - `workers`: integer, the threads sending the requests
+        - `maxDepth`: integer, the nodes deeper below the roots are not
+          looked up, None for no limit
+        - `maxAge`: seconds, the nodes under an unchanged parent are
+          looked up again once fetched that long ago; None to keep them,
+          0 to look up every node again
+        - `ResponseGroup`: string, the response groups of the lookups
+
+        The first exception raised by a request stops the crawl; the
+        nodes looked up so far are kept.
+        """
+        now = time.time()
+        seen = set(roots)
+        pending = deque([(x, 0, False) for x in roots])
+        """(BrowseNodeId, depth, whether its parent is unchanged)"""
+        parents = {}
+        gone = []
+        """the nodes no longer found"""
+        removed = []
+        """the nodes no longer listed by their parent"""
+        changed = []
+        client = ecs.getClient()
+        tasks = Queue.Queue()
+        results = Queue.Queue()
+
+        def work():
+            while True:
+                chunk = tasks.get()
+                if chunk is None:
+                    return
+                try:
+                    results.put((chunk, ecs.withClient(client, self.__lookup, chunk, ResponseGroup), None))
+                except Exception, e:
+                    results.put((chunk, None, sys.exc_info()))
+
+        def expand(node, depth, children, kept):
+            if maxDepth is not None and depth >= maxDepth:
+                return
+            for child in children:
+                if child not in seen:
+                    seen.add(child)
+                    parents[child] = node
+                    pending.append((child, depth + 1, kept))
+
+        threads = [threading.Thread(target=work) for i in range(max(1, workers))]
+        for thread in threads:
+            thread.setDaemon(True)
+            thread.start()
+        running = 0
+        try:
+            while pending or running:
+                while pending and running < len(threads):
+                    chunk = []
+                    while pending and len(chunk) < 10:
+                        node, depth, kept = pending.popleft()
+                        entry = self.nodes.get(node)
+                        if kept and entry is not None and entry[3] is not None \
+                                and (maxAge is None or now - entry[3] < maxAge):
+                            expand(node, depth, entry[2], True)
+                        else:
+                            chunk.append((node, depth))
+                    if chunk:
+                        tasks.put(chunk)
+                        running += 1
+                if not running:
+                    continue
+
+                chunk, found, error = results.get()
+                running -= 1
+                if error is not None:
+                    raise error[0], error[1], error[2]
+                for node, depth in chunk:
+                    if not found.has_key(node):
+                        # not answered, the node is kept as it is
+                        continue
+                    browseNode = found[node]
+                    if browseNode is None:
+                        gone.append(node)
+                        continue
+                    if self.__update(browseNode, parents.get(node), removed, now):
+                        changed.append(node)
+                        expand(node, depth, self.nodes[node][2], False)
+                    else:
+                        expand(node, depth, self.nodes[node][2], True)
+        finally:
+            for thread in threads:
+                tasks.put(None)
+            for node in removed:
+                # unless listed by the parent it moved to
+                entry = self.nodes.get(node)
+                if entry is not None and node not in self.nodes.get(entry[1], (None, None, ()))[2]:
+                    gone.append(node)
+            for node in gone:
+                changed.extend(self.__drop(node))
+            self.__order = self.__preorder = None
+            self.save()
+        return changed
+
+    def __lookup(self, chunk, ResponseGroup):
+        """Look up to 10 nodes of the (BrowseNodeId, depth) `chunk`,
+        return BrowseNodeId => BrowseNode of the nodes found, or None for
+        the nodes that do not exist. Any other error is raised."""
+        ids = [x[0] for x in chunk]
+        arguments = {'BrowseNodeId': ",".join(ids), 'ResponseGroup': ResponseGroup}
+        errors = []
+        nodes = ecs.rawObject(ecs.XMLBrowseNodeLookup, arguments, 'BrowseNodes',
+            ecs.getPlugins('BrowseNodeLookup'), ecs.listIterator(), errors)
+        rc = {}
+        for e in errors:
+            # '1234 is not a valid value for BrowseNodeId. ...'
+            unknown = isinstance(e, ecs.InvalidParameterValue) and \
+                [x for x in ids if str(e).startswith('%s is not a valid value' % x)]
+            if not unknown:
+                raise e
+            for node in unknown:
+                rc[node] = None
+        if isinstance(nodes, list):
+            for node in nodes:
+                rc[node.BrowseNodeId] = node
+        return rc
+
+    def __update(self, browseNode, parent, removed, now):
+        """Record the `browseNode` fetched `now`, under `parent` or its
+        ancestor; return whether its name or children changed"""
+        nodes = self.nodes
+        node = browseNode.BrowseNodeId
+        name = getattr(browseNode, 'Name', None)
+        children = [(x.BrowseNodeId, getattr(x, 'Name', None)) for x in getattr(browseNode, 'Children', [])]
+        digest = hashlib.sha1(repr((name, children))).hexdigest()
+
+        if parent is None:
+            parent = self.__ancestors(node, getattr(browseNode, 'Ancestors', None))
+        entry = nodes.get(node)
+        kept = [x[0] for x in children]
+        if entry is not None:
+            removed.extend([x for x in entry[2] if x not in kept and nodes.has_key(x) and nodes[x][1] == node])
+        nodes[node] = (name, parent, tuple(kept), now, digest)
+        for child, childName in children:
+            if not nodes.has_key(child):
+                nodes[child] = (childName, node, (), None, None)
+            elif nodes[child][0] != childName or nodes[child][1] != node:
+                nodes[child] = (childName, node) + nodes[child][2:]
+        return entry is None or entry[4] != digest
+
+    def __ancestors(self, node, ancestors):
+        """Record the chain of `ancestors` of the root `node`, return its
+        parent"""
+        nodes = self.nodes
+        chain = []
+        while ancestors:
+            chain.append(ancestors[0])
+            ancestors = getattr(ancestors[0], 'Ancestors', None)
+        if not chain:
+            return nodes.has_key(node) and nodes[node][1] or None
+
+        ids = [node] + [x.BrowseNodeId for x in chain]
+        for i, ancestor in enumerate(chain):
+            current, child = ids[i + 1], ids[i]
+            entry = nodes.get(current) or (getattr(ancestor, 'Name', None), None, (), None, None)
+            parent = i + 2 < len(ids) and ids[i + 2] or entry[1]
+            children = entry[2]
+            if child not in children:
+                children = children + (child,)
+            nodes[current] = (entry[0], parent, children) + entry[3:]
+        return ids[1]
+
+    def __drop(self, node):
+        """Drop `node` and its descendants, return the nodes dropped"""
+        nodes = self.nodes
+        entry = nodes.get(node)
+        if entry is None:
+            return []
+        parent = nodes.get(entry[1])
+        if parent is not None and node in parent[2]:
+            nodes[entry[1]] = parent[:2] + (tuple([x for x in parent[2] if x != node]),) + parent[3:]
+        rc = []
+        stack = [node]
+        while stack:
+            current = stack.pop()
+            entry = nodes.pop(current, None)
+            if entry is None:
+                continue
+            rc.append(current)
+            stack.extend([x for x in entry[2] if nodes.has_key(x) and nodes[x][1] == current])
+        return rc
+
+    def __index(self):
+        """Number the nodes in preorder"""
+        if self.__order is not None:
+            return
+        nodes = self.nodes
+        order = {}
+        preorder = []
+        roots = [x for x, entry in nodes.items() if entry[1] is None or not nodes.has_key(entry[1])]
+        roots.sort()
+        for root in roots:
+            stack = [(root, False)]
+            while stack:
+                node, done = stack.pop()
+                if done:
+                    order[node] = (order[node], len(preorder))
+                    continue
+                if order.has_key(node):
+                    continue
+                order[node] = len(preorder)
+                preorder.append(node)
+                stack.append((node, True))
+                children = [x for x in nodes[node][2] if nodes.has_key(x) and nodes[x][1] == node]
+                children.reverse()
+                stack.extend([(x, False) for x in children])
+        self.__order = order
+        self.__preorder = preorder
@@ -0,0 +1,105 @@
+import unittest
+import sys, os, shutil, tempfile
+
+# quick-n-dirty for debug only
+sys.path.append('..')
+import ecs
+from tests.standin import StandInServer, fixture
+
+def test_suite():
+    from unittest import defaultTestLoader as loader
+    return loader.loadTestsFromName("tests.archive")
+
+class ArchiveTest(unittest.TestCase):
+
+    def setUp(self):
+        ecs.setLicenseKey('00000000000000000000')
+        ecs.setSecretAccessKey('1234567890')
+        self.server = StandInServer()
+        self.pool = ecs.ConnectionPool(addresses={'ecs.amazonaws.com': self.server.address()})
+        ecs.setConnectionPool(self.pool)
+        self.directory = tempfile.mkdtemp()
+        self.archives = []
+
+    def tearDown(self):
+        ecs.setArchive(None)
+        ecs.setLicenseKey('00000000000000000000')
+        for archive in self.archives:
+            archive.close()
+        shutil.rmtree(self.directory)
+        self.pool.clear()
+        ecs.setConnectionPool(None)
+        self.server.stop()
+
+    def archive(self, **kwargs):
+        archive = ecs.ResponseArchive(self.directory, **kwargs)
+        self.archives.append(archive)
+        return archive
+
+    def record(self, archive):
+        ecs.setArchive(archive)
+        self.assertEqual(ecs.ItemSearch('python', SearchIndex='Books')[10].ASIN, '0596009259')
+        self.assertEqual(ecs.ItemLookup('0596009259')[0].ASIN, '0596009259')
+        ecs.setArchive(None)
+
+    def testReplay(self):
+        archive = self.archive()
+        self.record(archive)
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(len(archive), 3)
+
+        ecs.setArchive(archive, replay=True)
+        ecs.setLicenseKey('11111111111111111111')
+        books = ecs.ItemSearch('python', SearchIndex='Books')
+        self.assertEqual(books[10].ASIN, '0596009259')
+        self.assertEqual(ecs.ItemLookup('0596009259')[0].ASIN, '0596009259')
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertRaises(KeyError, books.__getitem__, 20)
+        self.assertEqual(ecs.rawBody(ecs.XMLItemLookup, {'ItemId': '0596009259'}), fixture('ItemLookup.xml'))
+
+    def testReopen(self):
+        self.record(self.archive())
+        archive = self.archive()
+        self.assertEqual(len(archive), 3)
+        self.record(archive)
+        self.assertEqual(len(archive), 3)
+        self.assertEqual(len(self.server.requests), 6)
+        ecs.setArchive(archive, replay=True)
+        self.assertEqual(ecs.ItemLookup('0596009259')[0].ASIN, '0596009259')
+        self.assertEqual(len(self.server.requests), 6)
+
+    def testSegments(self):
+        archive = self.archive(segmentSize=1000)
+        self.record(archive)
+        segments = [x for x in os.listdir(self.directory) if x.startswith('segment.')]
+        self.assertEqual(sorted(segments), ['segment.00000', 'segment.00001', 'segment.00002'])
+        url = ecs.buildRequest({'Operation': 'ItemLookup', 'ItemId': '0596009259'})
+        self.assert_(url in archive)
+        status, body = archive.view(url)
+        self.assertEqual(status, 200)
+        self.assert_(isinstance(body, buffer))
+        self.assertEqual(str(body), fixture('ItemLookup.xml'))
+        self.assertEqual(archive.view(url.replace('0596009259', '0596009260')), None)
+
+    def testServerError(self):
+        self.server.respond = lambda path, arguments: (503, 'Service Unavailable')
+        ecs.setArchive(self.archive())
+        self.assertRaises(Exception, ecs.ItemLookup, '0596009259')
+        self.assertEqual(len(ecs.getArchive()), 0)
+
+    def testTruncatedIndex(self):
+        archive = self.archive()
+        self.record(archive)
+        archive.close()
+        f = open(os.path.join(self.directory, 'index'), 'ab')
+        f.write('0 123 45')
+        f.close()
+        archive = self.archive()
+        self.assertEqual(len(archive), 3)
+        ecs.setArchive(archive)
+        ecs.ItemLookup('0596009260')
+        self.assertEqual(len(self.archive()), 4)
+
+
+if __name__ == "__main__" :
+    unittest.main()
@@ -0,0 +1,117 @@
+import unittest
+import sys, threading, time
+
+# quick-n-dirty for debug only
+sys.path.append('..')
+import ecs, aio
+from tests.standin import StandInServer, fixtureResponder
+from tests.batch import itemLookupResponder
+
+def test_suite():
+    from unittest import defaultTestLoader as loader
+    return loader.loadTestsFromName("tests.asynchronous")
+
+class AsynchronousTest(unittest.TestCase):
+
+    def setUp(self):
+        ecs.setLicenseKey('00000000000000000000')
+        ecs.setSecretAccessKey('1234567890')
+        self.server = StandInServer()
+        self.loop = aio.Loop(addresses={'ecs.amazonaws.com': self.server.address()}, timeout=2)
+        aio.setLoop(self.loop)
+
+    def tearDown(self):
+        aio.setLoop(None)
+        ecs.setParser('minidom')
+        self.server.stop()
+
+    def testItemLookup(self):
+        future = aio.ItemLookup('0596009259')
+        books = future.result(5)
+        self.assertEqual(books[0].Title, 'Programming Python')
+        self.assertEqual(len(self.server.requests), 1)
+
+    def testXMLItemLookup(self):
+        dom = aio.XMLItemLookup('0596009259').result(5)
+        self.assertEqual(dom.getElementsByTagName('ASIN')[0].firstChild.data, '0596009259')
+
+    def testConcurrentRequests(self):
+        def slow(path, arguments):
+            time.sleep(0.3)
+            return fixtureResponder(path, arguments)
+        self.server.respond = slow
+        self.loop.maxsize = 10
+        started = time.time()
+        futures = [aio.ItemLookup('0596009259') for i in range(10)]
+        for future in futures:
+            self.assertEqual(future.result(5)[0].ASIN, '0596009259')
+        self.assert_(time.time() - started < 2)
+
+    def testConnectionReuse(self):
+        for i in range(5):
+            aio.ItemLookup('0596009259').result(5)
+        self.assertEqual(self.server.connections, 1)
+
+    def testMaxSize(self):
+        self.loop.maxsize = 2
+        futures = [aio.ItemLookup('0596009259') for i in range(6)]
+        for future in futures:
+            future.result(5)
+        self.assert_(self.server.connections <= 2)
+
+    def testStreamParser(self):
+        ecs.setParser('expat')
+        books = aio.ItemSearch('python', SearchIndex='Books', ResponseGroup='Large').result(5)
+        self.assertEqual(books[0].OfferSummary.LowestNewPrice.Amount, '3299')
+
+    def testError(self):
+        self.server.respond = lambda path, arguments: fixtureResponder(path, {'Operation': 'Error'})
+        future = aio.ItemLookup('XXXXXXXXXX')
+        self.assertRaises(ecs.InvalidParameterValue, future.result, 5)
+        self.assert_(isinstance(future.exception(), ecs.InvalidParameterValue))
+
+    def testTimeout(self):
+        def slow(path, arguments):
+            time.sleep(1.5)
+            return fixtureResponder(path, arguments)
+        self.server.respond = slow
+        self.loop.timeout = 0.5
+        self.assertRaises(IOError, aio.ItemLookup('0596009259').result, 5)
+
+    def testForEach(self):
+        books = aio.ItemSearch('python', SearchIndex='Books').result(5)
+        asins = []
+        # the fixture has 3 items per page of 10
+        future = aio.forEach(books, asins.append, 20)
+        self.assertRaises(IndexError, future.result, 5)
+        self.assertEqual(len(asins), 3)
+        self.assertEqual(sorted([int(a.get('ItemPage', 1)) for h, p, a in self.server.requests]), [1, 3])
+
+    def testCallback(self):
+        done = threading.Event()
+        titles = []
+        def callback(future):
+            titles.append(future.result()[0].Title)
+            done.set()
+        aio.ItemLookup('0596009259').addCallback(callback)
+        done.wait(5)
+        self.assertEqual(titles, ['Programming Python'])
+
+    def testItemLookupMany(self):
+        self.server.respond = itemLookupResponder
+        asins = ['B%09d' % i for i in range(50)] + ['XXXXXXXXXX']
+        items = aio.ItemLookupMany(asins + asins[:5], workers=4).result(5)
+        self.assertEqual([x.ASIN for x in items[:50]], asins[:50])
+        self.assert_(isinstance(items[50], ecs.InvalidParameterValue))
+        self.assertEqual(items[51].ASIN, asins[0])
+        self.assertEqual(len(self.server.requests), 6)
+
+        # each response of a call is fetched once, the threads are not
+        # started in the loop thread
+        items = aio.call(ecs.ItemLookupMany, asins[:50], workers=4).result(5)
+        self.assertEqual([x.Title for x in items][-1], 'Title of B000000049')
+        self.assertEqual(len(self.server.requests), 11)
+
+
+if __name__ == "__main__" :
+    unittest.main()
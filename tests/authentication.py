@@ -54,6 +54,37 @@ class AuthenticationTest(unittest.TestCase):
         expepected_url = 'http://ecs.amazonaws.com/onca/xml?AWSAccessKeyId=00000000000000000000&AssociateTag=mytag-20&Item.1.OfferListingId=j8ejq9wxDfSYWf2OCp6XQGDsVrWhl08GSQ9m5j%2Be8MS449BN1XGUC3DfU5Zw4nt%2FFBt87cspLow1QXzfvZpvzg%3D%3D&Item.1.Quantity=3&Operation=CartCreate&Service=AWSECommerceService&Timestamp=2009-01-01T12%3A00%3A00Z&Version=2009-01-01&Signature=cF3UtjbJb1%2BxDh387C%2FEmS1BCtS%2FZ01taykBCGemvUU%3D'
         self.assertEqual(ecs.buildQuery(args),expepected_url)
 
+    def testSignerConstants(self):
+        args = {
+                'Service':'AWSECommerceService',
+                'AWSAccessKeyId':'00000000000000000000',
+                'Timestamp':'2009-01-01T12:00:00Z',
+                'Operation':'CartCreate',
+                'Item.1.OfferListingId':'j8ejq9wxDfSYWf2OCp6XQGDsVrWhl08GSQ9m5j+e8MS449BN1XGUC3DfU5Zw4nt/FBt87cspLow1QXzfvZpvzg==',
+                'Item.1.Quantity':'3',
+                'AssociateTag':'mytag-20',
+                'Version':'2009-01-01'
+        }
+        constants = {}
+        for key in ('Service', 'AWSAccessKeyId', 'AssociateTag', 'Version'):
+            constants[key] = args.pop(key)
+        signer = ecs.RequestSigner('1234567890', 'ecs.amazonaws.com', constants)
+        self.assert_(signer.url(args).endswith('&Signature=cF3UtjbJb1%2BxDh387C%2FEmS1BCtS%2FZ01taykBCGemvUU%3D'))
+        self.assertEqual(signer.encode('Keywords', 'a~b c/d'), 'Keywords=a~b%20c%2Fd')
+
+    def testBuildRequest(self):
+        ecs.setLicenseKey('00000000000000000000')
+        ecs.setSecretAccessKey('1234567890')
+        argv = {'Operation': 'ItemLookup', 'ItemId': '0596009259', 'AWSAccessKeyId': None, 'IdType': None}
+        url = ecs.buildRequest(argv)
+        self.assertEqual(argv, {'Operation': 'ItemLookup', 'ItemId': '0596009259', 'AWSAccessKeyId': None, 'IdType': None})
+        key, arguments = ecs.canonicalRequest(url)
+        self.assertEqual(key, 'ecs.amazonaws.com/onca/xml?AWSAccessKeyId=00000000000000000000&ItemId=0596009259'
+            '&Operation=ItemLookup&Service=AWSECommerceService&Version=' + ecs.getVersion())
+        self.assert_('Timestamp=' in url)
+        argv['AWSAccessKeyId'] = 'ANOTHERKEY'
+        self.assertEqual(ecs.canonicalRequest(ecs.buildRequest(argv))[1]['AWSAccessKeyId'], 'ANOTHERKEY')
+
 if __name__ == "__main__" :
     unittest.main()
 
@@ -0,0 +1,83 @@
+import unittest
+import sys, threading
+
+# quick-n-dirty for debug only
+sys.path.append('..')
+import ecs
+from tests.standin import StandInServer
+
+def test_suite():
+    from unittest import defaultTestLoader as loader
+    return loader.loadTestsFromName("tests.batch")
+
+def itemLookupResponder(path, arguments):
+    """ItemLookup response for ItemId, ids starting with X are unknown"""
+    ids = arguments['ItemId'].split(',')
+    errors = ''.join(['<Error><Code>AWS.InvalidParameterValue</Code><Message>%s is not a valid value for ItemId. Please change this value and retry your request.</Message></Error>' % x
+        for x in ids if x.startswith('X')])
+    if errors:
+        errors = '<Errors>%s</Errors>' % errors
+    items = ''.join(['<Item><ASIN>%s</ASIN><ItemAttributes><Title>Title of %s</Title></ItemAttributes></Item>' % (x, x)
+        for x in ids if not x.startswith('X')])
+    return 200, ('<?xml version="1.0" encoding="UTF-8"?><ItemLookupResponse xmlns="http://webservices.amazon.com/AWSECommerceService/2009-06-01">'
+        '<Items><Request><IsValid>True</IsValid><ItemLookupRequest><ItemId>%s</ItemId></ItemLookupRequest>%s</Request>%s</Items></ItemLookupResponse>'
+        % (arguments['ItemId'], errors, items))
+
+class ItemLookupManyTest(unittest.TestCase):
+
+    def setUp(self):
+        ecs.setLicenseKey('00000000000000000000')
+        ecs.setSecretAccessKey('1234567890')
+        self.server = StandInServer(itemLookupResponder)
+        self.pool = ecs.ConnectionPool(addresses={'ecs.amazonaws.com': self.server.address()})
+        ecs.setConnectionPool(self.pool)
+        self.asins = ['B%09d' % i for i in range(25)]
+
+    def tearDown(self):
+        ecs.setParser('minidom')
+        self.pool.clear()
+        ecs.setConnectionPool(None)
+        self.server.stop()
+
+    def testChunks(self):
+        items = ecs.ItemLookupMany(self.asins)
+        self.assertEqual([x.ASIN for x in items], self.asins)
+        self.assertEqual(items[24].Title, 'Title of B000000024')
+        self.assertEqual([len(arguments['ItemId'].split(',')) for host, path, arguments in self.server.requests], [10, 10, 5])
+
+    def testUnknown(self):
+        for parser in ('minidom', 'expat'):
+            ecs.setParser(parser)
+            asins = self.asins[:3] + ['XUNKNOWN01'] + self.asins[3:5]
+            items = ecs.ItemLookupMany(asins)
+            self.assertEqual(len(items), 6)
+            self.assert_(isinstance(items[3], ecs.InvalidParameterValue))
+            self.assertEqual([x.ASIN for x in items[:3] + items[4:]], self.asins[:5])
+
+    def testDuplicates(self):
+        items = ecs.ItemLookupMany(self.asins[:2] * 2)
+        self.assertEqual([x.ASIN for x in items], self.asins[:2] * 2)
+        self.assertEqual(len(self.server.requests), 1)
+
+    def testWorkers(self):
+        items = ecs.ItemLookupMany(self.asins * 4, workers=3)
+        self.assertEqual([x.ASIN for x in items], self.asins * 4)
+        self.assertEqual(len(self.server.requests), 3)
+
+    def testTraced(self):
+        # a trace function refreshes the locals dict of the traced frames
+        def trace(frame, event, arg):
+            return trace
+        previous = sys.gettrace()
+        sys.settrace(trace)
+        try:
+            items = ecs.ItemLookupMany(self.asins[:12], projection=['ASIN', 'Title'])
+        finally:
+            sys.settrace(previous)
+        self.assertEqual([x.ASIN for x in items], self.asins[:12])
+        self.assertEqual(sorted(self.server.requests[0][2].keys()),
+            ['AWSAccessKeyId', 'ItemId', 'Operation', 'Service', 'Signature', 'Timestamp', 'Version'])
+
+
+if __name__ == "__main__" :
+    unittest.main()
@@ -0,0 +1,185 @@
+import unittest
+import sys, os, tempfile
+
+# quick-n-dirty for debug only
+sys.path.append('..')
+import ecs, taxonomy
+from tests.standin import StandInServer, fixture, fixtureResponder
+
+def test_suite():
+    from unittest import defaultTestLoader as loader
+    return loader.loadTestsFromName("tests.browsenodes")
+
+class TreeResponder:
+    """BrowseNodeLookup responses of the nodes in `tree`, BrowseNodeId =>
+    (name, children), the other ids are unknown"""
+
+    def __init__(self, tree):
+        self.tree = tree
+
+    def ancestors(self, node):
+        for parent, (name, children) in self.tree.items():
+            if node in children:
+                return '<Ancestors><BrowseNode><BrowseNodeId>%s</BrowseNodeId><Name>%s</Name>%s</BrowseNode></Ancestors>' % (
+                    parent, name, self.ancestors(parent))
+        return ''
+
+    def node(self, node):
+        name, children = self.tree[node]
+        if children:
+            children = '<Children>%s</Children>' % ''.join(['<BrowseNode><BrowseNodeId>%s</BrowseNodeId><Name>%s</Name></BrowseNode>'
+                % (x, self.tree.get(x, ('Unknown', []))[0]) for x in children])
+        else:
+            children = ''
+        return '<BrowseNode><BrowseNodeId>%s</BrowseNodeId><Name>%s</Name>%s%s</BrowseNode>' % (
+            node, name, children, self.ancestors(node))
+
+    def __call__(self, path, arguments):
+        ids = arguments['BrowseNodeId'].split(',')
+        errors = ''.join(['<Error><Code>AWS.InvalidParameterValue</Code><Message>%s is not a valid value for BrowseNodeId.</Message></Error>' % x
+            for x in ids if not self.tree.has_key(x)])
+        if errors:
+            errors = '<Errors>%s</Errors>' % errors
+        nodes = ''.join([self.node(x) for x in ids if self.tree.has_key(x)])
+        return 200, ('<?xml version="1.0" encoding="UTF-8"?><BrowseNodeLookupResponse xmlns="http://webservices.amazon.com/AWSECommerceService/2009-06-01">'
+            '<BrowseNodes><Request><IsValid>True</IsValid>%s</Request>%s</BrowseNodes></BrowseNodeLookupResponse>' % (errors, nodes))
+
+
+class TaxonomyTest(unittest.TestCase):
+
+    def setUp(self):
+        ecs.setLicenseKey('00000000000000000000')
+        ecs.setSecretAccessKey('1234567890')
+        # Books > Subjects > (Arts, Science: 12 nodes each with 2 leaves)
+        self.tree = {'1': ('Books', ['2']), '2': ('Subjects', ['10', '20'])}
+        for top, name in (('10', 'Arts'), ('20', 'Science')):
+            children = ['%s%02d' % (top, i) for i in range(12)]
+            self.tree[top] = (name, children)
+            for child in children:
+                self.tree[child] = ('Node %s' % child, [child + 'a', child + 'b'])
+                self.tree[child + 'a'] = ('Leaf %sa' % child, [])
+                self.tree[child + 'b'] = ('Leaf %sb' % child, [])
+        self.server = StandInServer(TreeResponder(self.tree))
+        self.pool = ecs.ConnectionPool(maxsize=4, addresses={'ecs.amazonaws.com': self.server.address()})
+        ecs.setConnectionPool(self.pool)
+        fd, self.path = tempfile.mkstemp()
+        os.close(fd)
+        os.remove(self.path)
+
+    def tearDown(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.pool.clear()
+        ecs.setConnectionPool(None)
+        self.server.stop()
+
+    def lookups(self):
+        return sum([len(x[2]['BrowseNodeId'].split(',')) for x in self.server.requests])
+
+    def testCrawl(self):
+        books = taxonomy.Taxonomy(self.path)
+        changed = books.crawl(['1'], workers=3)
+        self.assertEqual(len(books), len(self.tree))
+        self.assertEqual(sorted(changed), sorted(self.tree.keys()))
+        self.assertEqual(changed[:4], ['1', '2', '10', '20'])
+        # each node is looked up once, up to 10 per request
+        self.assertEqual(self.lookups(), len(self.tree))
+        self.assertEqual(max([len(x[2]['BrowseNodeId'].split(',')) for x in self.server.requests]), 10)
+        requests = len(self.server.requests)
+
+        books = taxonomy.Taxonomy(self.path)
+        self.assertEqual(books.roots(), ['1'])
+        self.assertEqual(books.children('20'), self.tree['20'][1])
+        self.assertEqual(books.ancestors('2003a'), ['2003', '20', '2', '1'])
+        self.assertEqual(books.pathTo('2003a', ' > '), 'Books > Subjects > Science > Node 2003 > Leaf 2003a')
+        self.assertEqual(books.descendants('1003'), ['1003a', '1003b'])
+        self.assertEqual(len(books.descendants('10')), 36)
+        self.assertEqual(len(books.descendants('1')), len(self.tree) - 1)
+        self.assert_(books.isAncestor('2', '1011b'))
+        self.assert_(not books.isAncestor('10', '2000'))
+        self.assert_(not books.isAncestor('10', '10'))
+        self.assertEqual(len(self.server.requests), requests)
+
+    def testAncestors(self):
+        self.server.respond = fixtureResponder
+        programming = taxonomy.Taxonomy()
+        programming.crawl(['3952'], maxDepth=0)
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual(programming.pathTo('285856'), ['Books', 'Subjects', 'Computers & Internet', 'Programming', 'Python'])
+        self.assertEqual(programming.roots(), ['283155'])
+        self.assertEqual(programming.descendants('5'), ['3952', '285856', '3608', '3609'])
+        self.assertEqual(programming.nodes['285856'][3], None)
+
+    def testRecrawl(self):
+        books = taxonomy.Taxonomy(self.path)
+        books.crawl(['1'], workers=2)
+        requests = self.lookups()
+
+        # unchanged: only the root is looked up
+        self.assertEqual(taxonomy.Taxonomy(self.path).crawl(['1']), [])
+        self.assertEqual(self.lookups() - requests, 1)
+        requests = self.lookups()
+
+        # Node 1005 is renamed, 1007 loses a leaf, 2000 moves to Arts
+        self.tree['1005'] = ('Node 1005 bis', self.tree['1005'][1])
+        self.tree['1007'] = (self.tree['1007'][0], ['1007a'])
+        del self.tree['1007b']
+        self.tree['10'] = (self.tree['10'][0], self.tree['10'][1] + ['2000'])
+        self.tree['20'] = (self.tree['20'][0], self.tree['20'][1][1:])
+        books = taxonomy.Taxonomy(self.path)
+        for node in ('2', '10', '20'):
+            books.nodes[node] = books.nodes[node][:3] + (books.nodes[node][3] - 7200,) + books.nodes[node][4:]
+        changed = books.crawl(['1'], workers=2, maxAge=3600)
+        self.assertEqual(sorted(changed), ['10', '1005', '1007', '1007b', '20'])
+        self.assertEqual(books.pathTo('1005'), ['Books', 'Subjects', 'Arts', 'Node 1005 bis'])
+        self.assertEqual(books.descendants('1007'), ['1007a'])
+        self.assertEqual(books.ancestors('2000b'), ['2000', '10', '2', '1'])
+        self.assertEqual(books.children('20'), self.tree['20'][1])
+        self.assert_('1007b' not in books)
+        self.assertEqual(len(books), len(self.tree))
+        # 1 and the stale 2, 10 and 20, the children of 10 and 20 which
+        # changed, and the children of 1005 and 1007 which changed
+        self.assertEqual(self.lookups() - requests, 1 + 3 + 24 + 3)
+        requests = self.lookups()
+
+        # the stale nodes are looked up again
+        self.assertEqual(books.crawl(['1'], maxAge=0), [])
+        self.assertEqual(self.lookups() - requests, len(self.tree))
+
+    def testRemoved(self):
+        books = taxonomy.Taxonomy()
+        self.assertEqual(books.crawl(['XXXX']), [])
+        self.assertEqual(len(books), 0)
+        books.crawl(['1'])
+        del self.tree['20']
+        changed = books.crawl(['1'], maxAge=0)
+        self.assertEqual(len(changed), 38)
+        self.assertEqual(changed[:2], ['2', '20'])
+        self.assertEqual(books.children('2'), ['10'])
+        self.assertEqual(len(books), 39)
+
+    def testTransientError(self):
+        books = taxonomy.Taxonomy(self.path)
+        books.crawl(['1'])
+        responder = self.server.respond
+        def failing(path, arguments):
+            if arguments['BrowseNodeId'] == '1':
+                return responder(path, arguments)
+            return 200, ('<?xml version="1.0" encoding="UTF-8"?><BrowseNodeLookupResponse xmlns="http://webservices.amazon.com/AWSECommerceService/2009-06-01">'
+                '<BrowseNodes><Request><IsValid>True</IsValid><Errors><Error><Code>AWS.InternalError</Code>'
+                '<Message>We encountered an internal error. Please try again.</Message></Error></Errors></Request></BrowseNodes></BrowseNodeLookupResponse>')
+        self.server.respond = failing
+        self.assertRaises(ecs.InternalError, books.crawl, ['1'], maxAge=0)
+        self.assertEqual(len(books), len(self.tree))
+        self.assertEqual(len(taxonomy.Taxonomy(self.path)), len(self.tree))
+        self.assertEqual(len(books.descendants('1')), len(self.tree) - 1)
+
+        # the nodes are dropped once unknown only
+        self.server.respond = responder
+        del self.tree['2']
+        self.assertEqual(len(books.crawl(['1'], maxAge=0)), len(self.tree) + 1)
+        self.assertEqual(len(books), 1)
+
+
+if __name__ == "__main__" :
+    unittest.main()
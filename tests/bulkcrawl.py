@@ -0,0 +1,82 @@
+import unittest
+import sys, os, re, tempfile
+
+# quick-n-dirty for debug only
+sys.path.append('..')
+import ecs, bulk
+from tests.standin import StandInServer, fixture
+
+def test_suite():
+    from unittest import defaultTestLoader as loader
+    return loader.loadTestsFromName("tests.bulkcrawl")
+
+def searchResponder(path, arguments):
+    """3 pages of 3 items, the same ASINs for every search"""
+    page = int(arguments.get('ItemPage', 1))
+    body = fixture('ItemSearch.xml')
+    asins = re.findall(r'<Item><ASIN>(.*?)</ASIN>', body)
+    for i, asin in enumerate(asins):
+        body = body.replace(asin, 'P%dI%d' % (page, i))
+    return 200, body
+
+class CrawlTest(unittest.TestCase):
+
+    specs = [{'SearchIndex': 'Books', 'BrowseNode': '3952'},
+        {'SearchIndex': 'Books', 'BrowseNode': '285856'}]
+
+    def setUp(self):
+        ecs.setLicenseKey('00000000000000000000')
+        ecs.setSecretAccessKey('1234567890')
+        self.server = StandInServer(searchResponder)
+        self.pool = ecs.ConnectionPool(addresses={'ecs.amazonaws.com': self.server.address()})
+        ecs.setConnectionPool(self.pool)
+        fd, self.checkpoint = tempfile.mkstemp()
+        os.close(fd)
+        os.remove(self.checkpoint)
+
+    def tearDown(self):
+        if os.path.exists(self.checkpoint):
+            os.remove(self.checkpoint)
+        self.pool.clear()
+        ecs.setConnectionPool(None)
+        self.server.stop()
+
+    def asins(self, items):
+        return sorted([x.ASIN for x in items])
+
+    def testProcesses(self):
+        items = list(bulk.crawl(self.specs, processes=2))
+        self.assertEqual(len(items), 9)
+        self.assertEqual(self.asins(items), ['P%dI%d' % (p, i) for p in (1, 2, 3) for i in range(3)])
+        self.assertEqual(len(self.server.requests), 6)
+        self.assert_(items[0].Title)
+        self.assert_(isinstance(items[0].CustomerReviews, ecs.listIterator))
+
+    def testInline(self):
+        items = list(bulk.crawl(self.specs, processes=0))
+        self.assertEqual(len(items), 9)
+        self.assertEqual(len(self.server.requests), 6)
+
+    def testMaxPages(self):
+        items = list(bulk.crawl(self.specs, processes=0, maxPages=1))
+        self.assertEqual(self.asins(items), ['P1I0', 'P1I1', 'P1I2'])
+        self.assertEqual(len(self.server.requests), 2)
+
+    def testResume(self):
+        crawl = bulk.crawl(self.specs, processes=0, checkpoint=self.checkpoint, every=1, window=1)
+        first = [crawl.next() for i in range(4)]
+        crawl.close()
+        requests = len(self.server.requests)
+        rest = list(bulk.crawl(self.specs, processes=0, checkpoint=self.checkpoint))
+        self.assertEqual(sorted(set(self.asins(first + rest))), ['P%dI%d' % (p, i) for p in (1, 2, 3) for i in range(3)])
+        self.assert_(len(self.server.requests) - requests < 6)
+        again = list(bulk.crawl(self.specs, processes=0, checkpoint=self.checkpoint))
+        self.assertEqual(again, [])
+
+    def testError(self):
+        self.server.respond = lambda path, arguments: (200, fixture('Error.xml'))
+        self.assertRaises(ecs.InvalidParameterValue, list, bulk.crawl(self.specs, processes=2))
+
+
+if __name__ == "__main__" :
+    unittest.main()
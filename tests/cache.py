@@ -0,0 +1,123 @@
+import unittest
+import sys, shutil, tempfile
+
+# quick-n-dirty for debug only
+sys.path.append('..')
+import ecs
+from tests.standin import StandInServer, fixtureResponder
+
+def test_suite():
+    from unittest import defaultTestLoader as loader
+    return loader.loadTestsFromName("tests.cache")
+
+class CanonicalRequestTest(unittest.TestCase):
+
+    def testTimestampAndSignature(self):
+        key1, arguments = ecs.canonicalRequest('http://ecs.amazonaws.com/onca/xml?ItemId=1&Operation=ItemLookup&Timestamp=2009-01-01T12%3A00%3A00Z&Signature=abc')
+        key2, arguments = ecs.canonicalRequest('http://ecs.amazonaws.com/onca/xml?ItemId=1&Operation=ItemLookup&Timestamp=2009-01-01T12%3A00%3A01Z&Signature=def')
+        self.assertEqual(key1, key2)
+        self.assertEqual(key1, 'ecs.amazonaws.com/onca/xml?ItemId=1&Operation=ItemLookup')
+        self.assertEqual(arguments, {'ItemId': '1', 'Operation': 'ItemLookup'})
+
+    def testTTL(self):
+        cache = ecs.MemoryCache()
+        self.assertEqual(cache.ttl({'Operation': 'Help'}), 24 * 3600)
+        self.assertEqual(cache.ttl({'Operation': 'ItemLookup', 'ResponseGroup': 'Small,Offers'}), 300)
+        self.assertEqual(cache.ttl({'Operation': 'CartGet'}), 0)
+
+class CacheTest(unittest.TestCase):
+
+    def setUp(self):
+        ecs.setLicenseKey('00000000000000000000')
+        ecs.setSecretAccessKey('1234567890')
+        self.server = StandInServer()
+        self.pool = ecs.ConnectionPool(addresses={'ecs.amazonaws.com': self.server.address()})
+        ecs.setConnectionPool(self.pool)
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        ecs.setCache(None)
+        self.pool.clear()
+        ecs.setConnectionPool(None)
+        self.server.stop()
+        shutil.rmtree(self.directory)
+
+    def testMemoryCache(self):
+        cache = ecs.MemoryCache()
+        ecs.setCache(cache)
+        for i in range(3):
+            self.assertEqual(ecs.ItemLookup('0596009259')[0].Title, 'Programming Python')
+        ecs.ItemLookup('0596009259', ResponseGroup='Small')
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertEqual(cache.stats(), {'hits': 2, 'misses': 2, 'stores': 2, 'evictions': 0})
+
+    def testEviction(self):
+        ecs.setCache(ecs.MemoryCache(capacity=1))
+        for group in ('Small', 'Medium', 'Small'):
+            ecs.XMLItemLookup('0596009259', ResponseGroup=group)
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(ecs.getCache().evictions, 2)
+
+    def testLeastRecentlyUsed(self):
+        cache = ecs.MemoryCache(capacity=2)
+        cache.store('a', 1, 'A')
+        cache.store('b', 1, 'B')
+        self.assertEqual(cache.load('a'), (1, 'A'))
+        cache.store('c', 1, 'C')
+        self.assertEqual(cache.load('b'), None)
+        cache.store('a', 2, 'AA')
+        cache.store('d', 1, 'D')
+        self.assertEqual([cache.load(x) for x in 'acd'], [(2, 'AA'), None, (1, 'D')])
+        cache.remove('a')
+        self.assertEqual(cache.load('a'), None)
+        self.assertEqual(cache.evictions, 2)
+
+    def testExpiry(self):
+        ecs.setCache(ecs.MemoryCache(ttls={'ItemLookup': -1}))
+        ecs.XMLItemLookup('0596009259')
+        ecs.XMLItemLookup('0596009259')
+        self.assertEqual(len(self.server.requests), 2)
+
+    def testCart(self):
+        ecs.setCache(ecs.MemoryCache())
+        book = ecs.Bag()
+        book.ASIN = '0596009259'
+        ecs.CartCreate([book], [1])
+        ecs.CartCreate([book], [1])
+        self.assertEqual(len(self.server.requests), 2)
+
+    def testError(self):
+        ecs.setCache(ecs.MemoryCache())
+        self.server.respond = lambda path, arguments: fixtureResponder(path, {'Operation': 'Error'})
+        self.assertRaises(ecs.InvalidParameterValue, ecs.ItemLookup, 'XXXXXXXXXX')
+        self.assertRaises(ecs.InvalidParameterValue, ecs.ItemLookup, 'XXXXXXXXXX')
+        self.assertEqual(len(self.server.requests), 2)
+
+    def testServerError(self):
+        cache = ecs.MemoryCache()
+        ecs.setCache(cache)
+        self.server.respond = lambda path, arguments: (502, '<html><body>Bad Gateway</body></html>')
+        url = ecs.buildRequest({'Operation': 'ItemLookup', 'ItemId': '0596009259'})
+        for i in range(2):
+            self.assertEqual(ecs.fetch(url), '<html><body>Bad Gateway</body></html>')
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertEqual(cache.stats(), {'hits': 0, 'misses': 2, 'stores': 0, 'evictions': 0})
+
+    def testDiskCache(self):
+        ecs.setCache(ecs.DiskCache(self.directory))
+        ecs.XMLItemLookup('0596009259')
+        ecs.setCache(ecs.DiskCache(self.directory))
+        self.assertEqual(ecs.ItemLookup('0596009259')[0].Title, 'Programming Python')
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual(ecs.getCache().hits, 1)
+
+    def testDiskPurge(self):
+        cache = ecs.DiskCache(self.directory, ttls={'ItemLookup': -1})
+        ecs.setCache(cache)
+        ecs.XMLItemLookup('0596009259')
+        cache.purge()
+        self.assertEqual(cache.evictions, 1)
+
+
+if __name__ == "__main__" :
+    unittest.main()
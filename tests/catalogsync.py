@@ -0,0 +1,151 @@
+import unittest
+import sys, os, tempfile, cPickle
+
+# quick-n-dirty for debug only
+sys.path.append('..')
+import ecs, sync
+from tests.standin import StandInServer
+
+def test_suite():
+    from unittest import defaultTestLoader as loader
+    return loader.loadTestsFromName("tests.catalogsync")
+
+class CatalogResponder:
+    """ItemLookup responses of the sales ranks in `ranks`, the other ids
+    are unknown"""
+
+    def __init__(self, ranks):
+        self.ranks = ranks
+
+    def __call__(self, path, arguments):
+        ids = arguments['ItemId'].split(',')
+        errors = ''.join(['<Error><Code>AWS.InvalidParameterValue</Code><Message>%s is not a valid value for ItemId.</Message></Error>' % x
+            for x in ids if not self.ranks.has_key(x)])
+        if errors:
+            errors = '<Errors>%s</Errors>' % errors
+        items = ''.join(['<Item><ASIN>%s</ASIN><SalesRank>%d</SalesRank><ItemAttributes><Title>Title of %s</Title></ItemAttributes>'
+            '<OfferSummary><LowestNewPrice><Amount>1000</Amount></LowestNewPrice><TotalNew>3</TotalNew></OfferSummary></Item>'
+            % (x, self.ranks[x], x) for x in ids if self.ranks.has_key(x)])
+        return 200, ('<?xml version="1.0" encoding="UTF-8"?><ItemLookupResponse xmlns="http://webservices.amazon.com/AWSECommerceService/2009-06-01">'
+            '<Items><Request><IsValid>True</IsValid>%s</Request>%s</Items></ItemLookupResponse>' % (errors, items))
+
+
+class SyncTest(unittest.TestCase):
+
+    def setUp(self):
+        ecs.setLicenseKey('00000000000000000000')
+        ecs.setSecretAccessKey('1234567890')
+        self.asins = ['B%09d' % i for i in range(25)]
+        self.ranks = dict([(x, 100 + i) for i, x in enumerate(self.asins)])
+        self.server = StandInServer(CatalogResponder(self.ranks))
+        self.pool = ecs.ConnectionPool(addresses={'ecs.amazonaws.com': self.server.address()})
+        ecs.setConnectionPool(self.pool)
+        fd, self.path = tempfile.mkstemp()
+        os.close(fd)
+        os.remove(self.path)
+
+    def tearDown(self):
+        for path in (self.path, self.path + '.log'):
+            if os.path.exists(path):
+                os.remove(path)
+        self.pool.clear()
+        ecs.setConnectionPool(None)
+        self.server.stop()
+
+    def expire(self, catalog):
+        """Return the catalog reloaded with all its ASINs due"""
+        for entry in catalog.entries.values():
+            entry[0] = 0
+        catalog.compact()
+        return sync.Catalog(self.path)
+
+    def testSync(self):
+        catalog = sync.Catalog(self.path)
+        catalog.add(self.asins + ['XXXXXXXXXX'])
+        changes = dict(sync.sync(catalog, batch=20))
+        self.assertEqual(len(changes), 26)
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(self.server.requests[0][2]['ResponseGroup'], 'Medium')
+        item = changes['B000000003']
+        self.assert_(isinstance(item, ecs.Record))
+        self.assertEqual((item.ASIN, item.SalesRank, item.OfferSummary_LowestNewPrice_Amount, item.ListPrice_Amount),
+            ('B000000003', '103', '1000', None))
+        self.assert_(isinstance(changes['XXXXXXXXXX'], ecs.InvalidParameterValue))
+
+        # nothing is due yet
+        self.assertEqual(list(sync.sync(catalog)), [])
+        self.assertEqual(len(self.server.requests), 3)
+
+        self.ranks['B000000003'] = 5
+        self.ranks['B000000020'] = 6
+        catalog = self.expire(catalog)
+        changes = list(sync.sync(catalog))
+        self.assertEqual(sorted([(asin, item.SalesRank) for asin, item in changes]),
+            [('B000000003', '5'), ('B000000020', '6')])
+        self.assertEqual(len(self.server.requests), 6)
+        self.assertEqual(catalog.entries['B000000003'][1], 3600)
+        self.assertEqual(catalog.entries['B000000004'][1], 7200)
+        self.assertEqual(catalog.entries['XXXXXXXXXX'][1], 7200)
+
+    def testSchedule(self):
+        catalog = sync.Catalog(minInterval=10, maxInterval=40)
+        catalog.add(['A', 'B'], now=100)
+        catalog.add(['C', 'A'], now=50)
+        self.assertEqual(catalog.nextDue(), 50)
+        self.assertEqual(catalog.due(now=100, limit=2), ['C', 'A'])
+        self.assertEqual(catalog.due(now=100), ['B'])
+        self.assertEqual(catalog.due(now=105), [])
+        self.assertEqual(catalog.nextDue(), 110)
+        for now in (110, 120, 140, 180):
+            self.assertEqual(sorted(catalog.due(now=now)), ['A', 'B', 'C'])
+            self.assertEqual(catalog.update('A', 'same', now), now == 110)
+            self.assertEqual(catalog.update('B', 'b%d' % now, now), True)
+        self.assertEqual(catalog.entries['A'][:3], [220, 40, 180])
+        self.assertEqual(catalog.entries['B'][:3], [190, 10, 180])
+        catalog.remove(['C'])
+        self.assertEqual(catalog.due(now=1000), ['B', 'A'])
+
+    def testJournal(self):
+        catalog = sync.Catalog(self.path)
+        catalog.add(['A', 'B', 'C'], now=100)
+        catalog.save()
+        self.assert_(not os.path.exists(self.path))
+        catalog.update('A', 'a', now=110)
+        catalog.remove(['C'])
+        catalog.save()
+        size = os.path.getsize(self.path + '.log')
+        # nothing changed, nothing written
+        catalog.save()
+        self.assertEqual(os.path.getsize(self.path + '.log'), size)
+        self.assertEqual(sync.Catalog(self.path).entries, {'A': [3710, 3600, 110, 'a'], 'B': [100, 3600, None, None]})
+
+        # a change partly written is dropped
+        f = open(self.path + '.log', 'ab')
+        f.write('\x80\x02]q')
+        f.close()
+        catalog = sync.Catalog(self.path)
+        self.assertEqual(sorted(catalog.entries.keys()), ['A', 'B'])
+        self.assertEqual(os.path.getsize(self.path + '.log'), size)
+        catalog.update('B', 'b', now=120)
+        catalog.save()
+        self.assertEqual(sync.Catalog(self.path).entries['B'], [3720, 3600, 120, 'b'])
+
+        # the journal is folded into a snapshot once larger than the catalog
+        catalog.add(['D%04d' % i for i in range(1200)], now=100)
+        catalog.save()
+        self.assert_(os.path.exists(self.path))
+        self.assertEqual(os.path.getsize(self.path + '.log'), len(cPickle.dumps(1, 2)))
+        catalog.update('D0000', 'd', now=130)
+        catalog.save()
+        catalog = sync.Catalog(self.path)
+        self.assertEqual(len(catalog), 1202)
+        self.assertEqual(catalog.entries['D0000'], [3730, 3600, 130, 'd'])
+
+    def testLookupMany(self):
+        self.assertRaises(ecs.BadOption, ecs.ItemLookupMany, self.asins, projection=['SalesRank'])
+        items = ecs.ItemLookupMany(self.asins[:3], projection=['ASIN', 'Title'])
+        self.assertEqual([x.Title for x in items], ['Title of B000000000', 'Title of B000000001', 'Title of B000000002'])
+
+
+if __name__ == "__main__" :
+    unittest.main()
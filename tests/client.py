@@ -0,0 +1,107 @@
+import unittest
+import sys, threading, pickle
+
+# quick-n-dirty for debug only
+sys.path.append('..')
+import ecs
+from tests.standin import StandInServer
+
+def test_suite():
+    from unittest import defaultTestLoader as loader
+    return loader.loadTestsFromName("tests.client")
+
+class ClientTest(unittest.TestCase):
+
+    def setUp(self):
+        ecs.setLicenseKey('00000000000000000000')
+        ecs.setSecretAccessKey('1234567890')
+        self.server = StandInServer()
+        address = self.server.address()
+        self.addresses = {'ecs.amazonaws.com': address, 'ecs.amazonaws.co.uk': address}
+        self.pool = ecs.ConnectionPool(addresses=self.addresses)
+        ecs.setConnectionPool(self.pool)
+
+    def tearDown(self):
+        self.pool.clear()
+        ecs.setConnectionPool(None)
+        self.server.stop()
+
+    def client(self, key, locale='us', **kwargs):
+        return ecs.ECSClient(key, 'secret' + key, locale,
+            pool=ecs.ConnectionPool(addresses=self.addresses), **kwargs)
+
+    def keys(self):
+        return [(host, arguments['AWSAccessKeyId']) for host, path, arguments in self.server.requests]
+
+    def testThreads(self):
+        us, uk = self.client('US000000000000000000'), self.client('UK000000000000000000', 'uk')
+        failures = []
+        def lookup(client):
+            try:
+                for i in range(5):
+                    self.assertEqual(client.ItemLookup('0596009259')[0].ASIN, '0596009259')
+            except Exception, e:
+                failures.append(e)
+        threads = [threading.Thread(target=lookup, args=(x,)) for x in (us, uk, us, uk)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(failures, [])
+        keys = self.keys()
+        self.assertEqual(len(keys), 20)
+        self.assertEqual(keys.count(('ecs.amazonaws.com', 'US000000000000000000')), 10)
+        self.assertEqual(keys.count(('ecs.amazonaws.co.uk', 'UK000000000000000000')), 10)
+        self.assertEqual(ecs.getLocale(), 'us')
+        self.assertEqual(ecs.getLicenseKey(), '00000000000000000000')
+
+    def testDefaultClient(self):
+        self.assert_(ecs.getClient() is ecs.getClient(True))
+        ecs.setLocale('uk')
+        try:
+            self.assertEqual(ecs.LOCALE, 'uk')
+            self.assertEqual(ecs.getClient().getLocale(), 'uk')
+        finally:
+            ecs.setLocale('us')
+        ecs.setLocale(None)
+        try:
+            ecs.ItemLookup('0596009259')
+        finally:
+            ecs.setLocale('us')
+        client = self.client('US000000000000000000')
+        self.assert_(ecs.withClient(client, ecs.getClient) is client)
+        self.assertEqual(client.call(ecs.getLicenseKey), 'US000000000000000000')
+        ecs.ItemLookup('0596009259')
+        self.assertEqual(self.keys(), [('ecs.amazonaws.com', '00000000000000000000')] * 2)
+
+    def testSettings(self):
+        client = self.client('US000000000000000000', options={'AssociateTag': 'tag-20'}, cache=ecs.MemoryCache())
+        self.assertRaises(ecs.BadLocale, ecs.ECSClient, locale='xx')
+        self.assertRaises(ecs.BadOption, client.setOptions, {'foo': 3})
+        self.assertEqual(client.getOptions(), {'AssociateTag': 'tag-20'})
+        self.assertEqual(ecs.getOptions(), {})
+        for i in range(3):
+            client.ItemLookup('0596009259')
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual(self.server.requests[0][2]['AssociateTag'], 'tag-20')
+
+    def testPagedIterator(self):
+        books = self.client('US000000000000000000').ItemSearch('python', SearchIndex='Books')
+        self.assertEqual(books[10].ASIN, '0596009259')
+        self.assertEqual(self.keys(), [('ecs.amazonaws.com', 'US000000000000000000')] * 2)
+
+    def testOperations(self):
+        client = self.client('US000000000000000000')
+        self.assertEqual(client.XMLItemLookup.__name__, 'XMLItemLookup')
+        for name in ('Bag', 'AWSException', 'query', 'Unknown'):
+            self.assertRaises(AttributeError, getattr, client, name)
+
+    def testPickle(self):
+        client = pickle.loads(pickle.dumps(self.client('UK000000000000000000', 'uk')))
+        self.assertEqual(client.getLicenseKey(), 'UK000000000000000000')
+        self.assertEqual(client.getLocale(), 'uk')
+        self.assert_(pickle.loads(pickle.dumps(ecs.getClient())) is ecs.getClient(True))
+
+
+if __name__ == "__main__" :
+    unittest.main()
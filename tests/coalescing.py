@@ -0,0 +1,128 @@
+import unittest
+import sys, threading, time
+
+# quick-n-dirty for debug only
+sys.path.append('..')
+import ecs, aio
+from tests.standin import StandInServer, fixture, fixtureResponder
+
+def test_suite():
+    from unittest import defaultTestLoader as loader
+    return loader.loadTestsFromName("tests.coalescing")
+
+def slowResponder(path, arguments):
+    time.sleep(0.3)
+    if arguments.get('ItemId', '').startswith('X'):
+        return 200, fixture('Error.xml')
+    return fixtureResponder(path, arguments)
+
+class CoalescingTest(unittest.TestCase):
+
+    def setUp(self):
+        ecs.setLicenseKey('00000000000000000000')
+        ecs.setSecretAccessKey('1234567890')
+        self.server = StandInServer(slowResponder)
+        self.pool = ecs.ConnectionPool(maxsize=8, addresses={'ecs.amazonaws.com': self.server.address()})
+        ecs.setConnectionPool(self.pool)
+        self.recorder = ecs.MetricsRecorder()
+        ecs.setMetrics(self.recorder)
+        ecs.setCoalescing()
+
+    def tearDown(self):
+        ecs.setCoalescing(False)
+        ecs.setMetrics(None)
+        ecs.setParser('minidom')
+        self.pool.clear()
+        ecs.setConnectionPool(None)
+        self.server.stop()
+
+    def lookup(self, asins):
+        """Look the `asins` up at the same time, return the list of
+        the items or exceptions"""
+        results = [None] * len(asins)
+        def run(i):
+            try:
+                results[i] = ecs.ItemLookup(asins[i])[0]
+            except Exception, e:
+                results[i] = e
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(len(asins))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def testThreads(self):
+        items = self.lookup(['0596009259'] * 8)
+        self.assertEqual([x.ASIN for x in items], ['0596009259'] * 8)
+        self.assertEqual(len(set([id(x) for x in items])), 8)
+        self.assertEqual(len(self.server.requests), 1)
+        # one query, and one fetch
+        self.assertEqual(ecs.getCoalescing().stats(), {'calls': 2, 'shared': 7})
+        self.assertEqual(self.recorder.counters[('ItemLookup', 'requests')], 1)
+        self.assertEqual(self.recorder.stats()[('ItemLookup', 'parse')]['count'], 1)
+
+        # the requests done are not shared
+        self.lookup(['0596009259'] * 2)
+        self.assertEqual(len(self.server.requests), 2)
+
+    def testExpat(self):
+        ecs.setParser('expat')
+        items = self.lookup(['0596009259'] * 4)
+        self.assertEqual([x.ASIN for x in items], ['0596009259'] * 4)
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual(self.recorder.counters[('ItemLookup', 'coalesced')], 3)
+
+    def testDistinct(self):
+        self.lookup(['0596009259', '0596009260', '0596009259'])
+        self.assertEqual(len(self.server.requests), 2)
+        ecs.setCoalescing(False)
+        self.lookup(['0596009259'] * 3)
+        self.assertEqual(len(self.server.requests), 5)
+
+    def testError(self):
+        errors = self.lookup(['XXXXXXXXXX'] * 4)
+        for e in errors:
+            self.assert_(isinstance(e, ecs.InvalidParameterValue))
+        self.assertEqual(len(self.server.requests), 1)
+
+    def testMutations(self):
+        book = ecs.Bag()
+        book.ASIN = '0596009259'
+        def create(i):
+            ecs.XMLCartCreate([book], [1])
+        threads = [threading.Thread(target=create, args=(i,)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(self.server.requests), 4)
+        self.assertEqual(ecs.getCoalescing().stats(), {'calls': 0, 'shared': 0})
+
+        url = ecs.buildRequest({'Operation': 'CartCreate', 'Item.1.ASIN': '0596009259', 'Item.1.Quantity': '1'})
+        self.assertEqual(ecs.coalescingKey(url), None)
+        loop = aio.Loop(addresses={'ecs.amazonaws.com': self.server.address()}, timeout=5)
+        aio.setLoop(loop)
+        try:
+            futures = [loop.request(url) for i in range(2)]
+            self.assertNotEqual(futures[0], futures[1])
+            for future in futures:
+                self.assertEqual(future.result(5)[0], 200)
+            self.assertEqual(len(self.server.requests), 6)
+        finally:
+            aio.setLoop(None)
+
+    def testAio(self):
+        loop = aio.Loop(addresses={'ecs.amazonaws.com': self.server.address()}, timeout=5)
+        aio.setLoop(loop)
+        try:
+            futures = [aio.ItemLookup('0596009259') for i in range(5)]
+            for future in futures:
+                self.assertEqual(future.result(5)[0].ASIN, '0596009259')
+            self.assertEqual(len(self.server.requests), 1)
+        finally:
+            aio.setLoop(None)
+
+
+if __name__ == "__main__" :
+    unittest.main()
@@ -0,0 +1,121 @@
+import unittest
+import sys, re, csv, StringIO
+
+# quick-n-dirty for debug only
+sys.path.append('..')
+import ecs, export
+from tests.standin import StandInServer, fixture
+
+def test_suite():
+    from unittest import defaultTestLoader as loader
+    return loader.loadTestsFromName("tests.columnar")
+
+def searchResponder(path, arguments):
+    """Pages of 10 items, the odd ones without SalesRank"""
+    page = int(arguments.get('ItemPage', 1))
+    body = fixture('ItemSearch.xml')
+    first, last = body.index('<Item>'), body.rindex('</Item>') + len('</Item>')
+    items = re.findall(r'<Item>.*?</Item>', body[first:last], re.S)
+    page_items = []
+    for i in range(10):
+        item = re.sub(r'<ASIN>.*?</ASIN>', '<ASIN>P%dI%d</ASIN>' % (page, i), items[i % len(items)], 1)
+        if i % 2:
+            item = re.sub(r'<SalesRank>.*?</SalesRank>', '', item)
+        page_items.append(item)
+    return 200, body[:first] + ''.join(page_items) + body[last:]
+
+PATHS = ['ASIN', 'SalesRank', 'OfferSummary.LowestNewPrice.Amount', 'EditorialReviews.Source',
+    'Unknown.Amount']
+
+class ExportTest(unittest.TestCase):
+
+    def setUp(self):
+        ecs.setLicenseKey('00000000000000000000')
+        ecs.setSecretAccessKey('1234567890')
+        self.server = StandInServer(searchResponder)
+        self.pool = ecs.ConnectionPool(addresses={'ecs.amazonaws.com': self.server.address()})
+        ecs.setConnectionPool(self.pool)
+
+    def tearDown(self):
+        self.pool.clear()
+        ecs.setConnectionPool(None)
+        self.server.stop()
+
+    def search(self, **kwargs):
+        return ecs.ItemSearch('python', SearchIndex='Books', ResponseGroup='Large', **kwargs)
+
+    def pages(self):
+        return [int(arguments.get('ItemPage', 1)) for host, path, arguments in self.server.requests]
+
+    def check(self, columns):
+        self.assertEqual(len(columns), 25)
+        self.assertEqual(columns.fields, ('ASIN', 'SalesRank', 'OfferSummary_LowestNewPrice_Amount',
+            'EditorialReviews_Source', 'Unknown_Amount'))
+        self.assertEqual(columns.types, {'ASIN': 'text', 'SalesRank': 'int',
+            'OfferSummary_LowestNewPrice_Amount': 'int', 'EditorialReviews_Source': 'text',
+            'Unknown_Amount': 'int'})
+        self.assertEqual(columns.values['ASIN'][:2], ['P1I0', 'P1I1'])
+        self.assertEqual(columns.values['ASIN'][24], 'P3I4')
+        self.assertEqual(columns.values['SalesRank'][:4], [1607, 0, 9021, 0])
+        self.assertEqual(columns.mask['SalesRank'][:4], [False, True, False, True])
+        self.assertEqual(columns.values['OfferSummary_LowestNewPrice_Amount'][:3], [3299, 2399, 2650])
+        self.assertEqual(columns.values['EditorialReviews_Source'][0], ['Amazon.com', 'Book Description'])
+        self.assertEqual(columns.mask['Unknown_Amount'], [True] * 25)
+
+    def testColumns(self):
+        self.check(export.columns(self.search(), PATHS))
+        self.assertEqual(self.pages(), [1, 2, 3])
+
+    def testProjected(self):
+        self.check(export.columns(self.search(projection=PATHS), PATHS))
+
+    def testBatches(self):
+        batches = export.batches(self.search(), PATHS, 10)
+        batch = batches.next()
+        self.assertEqual(len(batch), 10)
+        # the next pages are fetched as the items are read
+        self.assertEqual(self.pages(), [1])
+        self.assertEqual([len(x) for x in batches], [10, 5])
+        self.assertEqual(self.pages(), [1, 2, 3])
+
+    def testTypes(self):
+        columns = export.columns(self.search()[0:2], ['ASIN', 'SalesRank'], {'ASIN': 'int', 'SalesRank': 'float'})
+        self.assertEqual(columns.mask['ASIN'], [True, True])
+        self.assertEqual(columns.values['SalesRank'], [1607.0, 0.0])
+        self.assertRaises(ecs.BadOption, export.Columns, ['ASIN'], {'ASIN': 'long'})
+        self.assertEqual(export.convert('bool', ['1', 'False']), [True, False])
+        self.assertRaises(ValueError, export.convert, 'bool', 'yes')
+
+    def testCSV(self):
+        f = StringIO.StringIO()
+        self.assertEqual(export.writeCSV(self.search(), PATHS, f), 25)
+        rows = list(csv.reader(StringIO.StringIO(f.getvalue())))
+        self.assertEqual(len(rows), 26)
+        self.assertEqual(rows[0], PATHS)
+        self.assertEqual(rows[1], ['P1I0', '1607', '3299', 'Amazon.com|Book Description', ''])
+        self.assertEqual(rows[2][:2], ['P1I1', ''])
+
+    def testColumnsFile(self):
+        f = StringIO.StringIO()
+        self.assertEqual(export.writeColumns(self.search(), PATHS, f, 10), 25)
+        batches = list(export.readColumns(StringIO.StringIO(f.getvalue())))
+        self.assertEqual([len(x) for x in batches], [10, 10, 5])
+        self.assertEqual(batches[1].values['ASIN'][0], 'P2I0')
+        self.assertEqual(batches[2].mask['SalesRank'], [False, True, False, True, False])
+
+    def testArray(self):
+        columns = export.columns(self.search()[0:3], PATHS)
+        if export.numpy is None:
+            self.assertRaises(ecs.BadOption, export.array, columns)
+            return
+        rc = export.array(columns)
+        self.assertEqual(rc.dtype.names, columns.fields)
+        self.assertEqual(str(rc.dtype['ASIN']), '<U4')
+        self.assertEqual(str(rc.dtype['SalesRank']), 'int64')
+        self.assertEqual(str(rc.dtype['EditorialReviews_Source']), 'object')
+        self.assertEqual(rc['SalesRank'].tolist(), [1607, None, 9021])
+        self.assertEqual(rc['SalesRank'].sum(), 10628)
+
+
+if __name__ == "__main__" :
+    unittest.main()
@@ -0,0 +1,108 @@
+import unittest
+import pickle
+import sys
+
+# quick-n-dirty for debug only
+sys.path.append('..')
+import ecs
+from tests.standin import StandInServer
+from tests.parser import flatten
+
+def test_suite():
+    from unittest import defaultTestLoader as loader
+    return loader.loadTestsFromName("tests.compact")
+
+class CompactTest(unittest.TestCase):
+
+    def setUp(self):
+        ecs.setLicenseKey('00000000000000000000')
+        ecs.setSecretAccessKey('1234567890')
+        self.server = StandInServer()
+        self.pool = ecs.ConnectionPool(addresses={'ecs.amazonaws.com': self.server.address()})
+        ecs.setConnectionPool(self.pool)
+        self.compact = ecs.compact
+
+    def tearDown(self):
+        ecs.compact = self.compact
+        ecs.setCompact(False)
+        ecs.setLazy(False)
+        ecs.setParser('minidom')
+        self.pool.clear()
+        ecs.setConnectionPool(None)
+        self.server.stop()
+
+    def search(self):
+        return ecs.ItemSearch('python', SearchIndex='Books', ResponseGroup='Large')
+
+    def testSameContent(self):
+        for parser in ('minidom', 'expat'):
+            ecs.setParser(parser)
+            books = self.search()
+            books[20]
+            bags = flatten(books)
+            ecs.setCompact()
+            books = self.search()
+            books[20]
+            ecs.setCompact(False)
+            self.assertEqual(bags, flatten(books))
+
+    def testRecords(self):
+        ecs.setCompact()
+        for parser in ('minidom', 'expat'):
+            ecs.setParser(parser)
+            books = self.search()
+            book, other = books[0], books[1]
+            self.assert_(isinstance(book, ecs.Record))
+            self.assert_(isinstance(book.OfferSummary, ecs.Record))
+            self.assertEqual(book.OfferSummary.LowestNewPrice.Amount, '3299')
+            self.assert_(hasattr(book, 'ASIN'))
+            self.failIf(hasattr(book, 'NoSuchAttribute'))
+            self.assertEqual(vars(book)['ASIN'], book.ASIN)
+            self.assert_(repr(book).startswith('<Bag instance: {'))
+            self.assertRaises(AttributeError, setattr, book, 'Note', 'x')
+            book.ASIN = 'X'
+            self.assertEqual(book.ASIN, 'X')
+            self.assert_(type(book.OfferSummary) is type(other.OfferSummary))
+            self.assert_(book.OfferSummary.LowestNewPrice.CurrencyCode is
+                other.OfferSummary.LowestNewPrice.CurrencyCode)
+
+    def testPickle(self):
+        ecs.setCompact()
+        book = self.search()[0]
+        copy = pickle.loads(pickle.dumps(book, 2))
+        self.assertEqual(flatten(copy), flatten(book))
+
+    def compacted(self):
+        """Record the bags compacted"""
+        bags = []
+        def compact(value):
+            if value.__class__ is ecs.Bag:
+                bags.append(value)
+            return self.compact(value)
+        ecs.compact = compact
+        return bags
+
+    def testCompactedOnce(self):
+        # the items are the grandparents of the pivoted ItemAttributes
+        ecs.setCompact()
+        bags = self.compacted()
+        books = self.search()
+        books[0]
+        self.assertEqual(len(bags), len(dict([(id(x), x) for x in bags])))
+
+        # the bags of the lazy loads are not kept
+        ecs.setLazy()
+        book = self.search()[0]
+        del bags[:]
+        self.assertEqual(book.ASIN, '0596009259')
+        self.assertEqual(bags, [])
+
+    def testBagKept(self):
+        bag = ecs.Bag()
+        setattr(bag, 'not valid', 1)
+        self.assert_(ecs.compact(bag) is bag)
+        self.assertEqual(ecs.compact(12), 12)
+
+
+if __name__ == "__main__" :
+    unittest.main()
@@ -0,0 +1,79 @@
+import unittest
+import sys, time, threading
+
+# quick-n-dirty for debug only
+sys.path.append('..')
+import ecs
+from tests.standin import StandInServer, fixture, fixtureResponder
+
+def test_suite():
+    from unittest import defaultTestLoader as loader
+    return loader.loadTestsFromName("tests.fanout")
+
+class SlowResponder:
+    """Answer after 1 second, or as soon as the test is over"""
+
+    def __init__(self):
+        self.over = threading.Event()
+
+    def __call__(self, path, arguments):
+        self.over.wait(1)
+        return fixtureResponder(path, arguments)
+
+class FanOutTest(unittest.TestCase):
+
+    def setUp(self):
+        ecs.setLicenseKey('00000000000000000000')
+        ecs.setSecretAccessKey('1234567890')
+        self.server = StandInServer()
+        self.slow = StandInServer(SlowResponder())
+        self.failing = StandInServer(lambda path, arguments: (200, fixture('Error.xml')))
+        addresses = {}
+        for host in ('com', 'co.uk', 'de', 'jp', 'fr'):
+            addresses['ecs.amazonaws.' + host] = self.server.address()
+        addresses['ecs.amazonaws.ca'] = self.slow.address()
+        self.pool = ecs.ConnectionPool(addresses=addresses)
+        ecs.setConnectionPool(self.pool)
+
+    def tearDown(self):
+        self.slow.respond.over.set()
+        self.pool.clear()
+        ecs.setConnectionPool(None)
+        for server in (self.server, self.slow, self.failing):
+            server.stop()
+
+    def testAllLocales(self):
+        start = time.time()
+        rc = ecs.fanOut(None, 0.3, ecs.ItemLookup, '0596009259')
+        self.assert_(time.time() - start < 0.9)
+        self.assertEqual(sorted(rc.keys()), ['ca', 'de', 'fr', 'jp', 'uk', 'us'])
+        for locale in ('de', 'fr', 'jp', 'uk', 'us'):
+            self.assertEqual(rc[locale][0].ASIN, '0596009259')
+        self.assert_(isinstance(rc['ca'], ecs.LocaleTimeout))
+        hosts = sorted([x[0] for x in self.server.requests])
+        self.assertEqual(hosts, ['ecs.amazonaws.co.uk', 'ecs.amazonaws.com', 'ecs.amazonaws.de',
+            'ecs.amazonaws.fr', 'ecs.amazonaws.jp'])
+        self.assertEqual(ecs.getLocale(), 'us')
+
+    def testTimeouts(self):
+        rc = ecs.fanOut(['us', 'ca'], {'us': 0.3}, ecs.ItemLookup, '0596009259')
+        self.assertEqual(rc['us'][0].ASIN, '0596009259')
+        self.assertEqual(rc['ca'][0].ASIN, '0596009259')
+
+    def testFailure(self):
+        self.pool.addresses['ecs.amazonaws.de'] = self.failing.address()
+        rc = ecs.fanOut(['us', 'de'], None, ecs.ItemLookup, '0596009259')
+        self.assertEqual(rc['us'][0].ASIN, '0596009259')
+        self.assert_(isinstance(rc['de'], ecs.InvalidParameterValue))
+
+    def testPagedIterator(self):
+        rc = ecs.fanOut(['uk'], None, ecs.ItemSearch, 'python', SearchIndex='Books')
+        self.assertEqual(rc['uk'][10].ASIN, '0596009259')
+        self.assertEqual([x[0] for x in self.server.requests], ['ecs.amazonaws.co.uk'] * 2)
+
+    def testBadLocale(self):
+        self.assertRaises(ecs.BadLocale, ecs.fanOut, ['us', 'xx'], None, ecs.ItemLookup, '0596009259')
+
+
+if __name__ == "__main__" :
+    unittest.main()
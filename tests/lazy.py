@@ -0,0 +1,86 @@
+import unittest
+import sys, pickle
+
+# quick-n-dirty for debug only
+sys.path.append('..')
+import ecs
+from tests.standin import StandInServer
+from tests.parser import flatten
+
+def test_suite():
+    from unittest import defaultTestLoader as loader
+    return loader.loadTestsFromName("tests.lazy")
+
+class LazyTest(unittest.TestCase):
+
+    def setUp(self):
+        ecs.setLicenseKey('00000000000000000000')
+        ecs.setSecretAccessKey('1234567890')
+        self.server = StandInServer()
+        self.pool = ecs.ConnectionPool(addresses={'ecs.amazonaws.com': self.server.address()})
+        ecs.setConnectionPool(self.pool)
+
+    def tearDown(self):
+        ecs.setLazy(False)
+        ecs.setCompact(False)
+        self.pool.clear()
+        ecs.setConnectionPool(None)
+        self.server.stop()
+
+    def search(self):
+        return ecs.ItemSearch('python', SearchIndex='Books', ResponseGroup='Large')
+
+    def testAttributes(self):
+        ecs.setLazy()
+        book = self.search()[0]
+        self.assert_(isinstance(book, ecs.LazyBag))
+        self.assertEqual(book._LazyBag__values, {})
+        self.assertEqual(book.Title, 'Programming Python')
+        self.assertEqual(sorted(book._LazyBag__values.keys()), ['Title'])
+        self.assert_(isinstance(book.OfferSummary, ecs.LazyBag))
+        self.assert_(book.OfferSummary is book.OfferSummary)
+        self.assertEqual(book.OfferSummary.LowestNewPrice.Amount, '3299')
+        self.assertEqual(book.BrowseNodes[0].Ancestors[0].Name, 'Programming')
+        self.assertEqual(len(book.CustomerReviews), 68)
+        self.assertRaises(AttributeError, getattr, book, 'Unknown')
+        self.failIf(hasattr(book, 'Unknown'))
+
+    def testEager(self):
+        eager = flatten(self.search())
+        ecs.setLazy()
+        self.assertEqual(flatten(self.search()), eager)
+        book = self.search()[0]
+        book.Title
+        self.assertEqual(flatten(book), eager[2][1][1][0])
+        self.assertEqual(book._LazyBag__element, None)
+
+    def testSetAttribute(self):
+        ecs.setLazy()
+        book = self.search()[0]
+        book.Title = 'Python'
+        book.Note = 'read'
+        self.assertEqual((book.Title, book.Note), ('Python', 'read'))
+        self.assertEqual(vars(book)['Title'], 'Python')
+        del book.Note
+        self.failIf(hasattr(book, 'Note'))
+        self.assertRaises(AttributeError, delattr, book, 'Note')
+
+    def testPickle(self):
+        ecs.setLazy()
+        book = ecs.ItemLookup('0596009259')[0]
+        copy = pickle.loads(pickle.dumps(book))
+        self.assert_(isinstance(copy, ecs.Bag))
+        self.assertEqual(flatten(copy), flatten(book))
+
+    def testCompact(self):
+        ecs.setCompact()
+        eager = flatten(self.search())
+        ecs.setLazy()
+        book = self.search()[0]
+        self.assert_(isinstance(book, ecs.LazyBag))
+        self.assert_(isinstance(book.CustomerReviews[0], ecs.LazyBag))
+        self.assertEqual(flatten(book), eager[2][1][1][0])
+
+
+if __name__ == "__main__" :
+    unittest.main()
@@ -0,0 +1,121 @@
+import unittest
+import sys, StringIO
+
+# quick-n-dirty for debug only
+sys.path.append('..')
+import ecs
+from tests.standin import StandInServer, fixture
+from tests.retry import FlakyResponder
+
+def test_suite():
+    from unittest import defaultTestLoader as loader
+    return loader.loadTestsFromName("tests.metrics")
+
+class ListSink(ecs.MetricsSink):
+
+    def __init__(self):
+        self.timings = []
+        self.counts = []
+
+    def timing(self, operation, phase, seconds):
+        self.timings.append((operation, phase))
+
+    def count(self, operation, name, value=1):
+        self.counts.append((operation, name, value))
+
+
+class MetricsTest(unittest.TestCase):
+
+    def setUp(self):
+        ecs.setLicenseKey('00000000000000000000')
+        ecs.setSecretAccessKey('1234567890')
+        self.server = StandInServer()
+        self.pool = ecs.ConnectionPool(addresses={'ecs.amazonaws.com': self.server.address()})
+        ecs.setConnectionPool(self.pool)
+        self.recorder = ecs.MetricsRecorder()
+        ecs.setMetrics(self.recorder)
+
+    def tearDown(self):
+        ecs.setMetrics(None)
+        ecs.setParser('minidom')
+        ecs.setCache(None)
+        ecs.setRetry(None)
+        self.pool.clear()
+        ecs.setConnectionPool(None)
+        self.server.stop()
+
+    def testPhases(self):
+        books = ecs.ItemSearch('python', SearchIndex='Books')
+        self.assertEqual(books[10].ASIN, '0596009259')
+        self.assertEqual(books.fetches, 2)
+        stats = self.recorder.stats()
+        self.assertEqual(sorted(stats.keys()), [('ItemSearch', 'build'), ('ItemSearch', 'network'),
+            ('ItemSearch', 'parse'), ('ItemSearch', 'unmarshal')])
+        for entry in stats.values():
+            self.assertEqual(entry['count'], 2)
+            self.assert_(0 <= entry['p50'] <= entry['p90'] <= entry['p99'])
+        self.assertEqual(self.recorder.counters, {('ItemSearch', 'requests'): 2,
+            ('ItemSearch', 'bytes'): 2 * len(fixture('ItemSearch.xml')), ('ItemSearch', 'pages'): 1})
+
+    def testExpat(self):
+        ecs.setParser('expat')
+        sink = ListSink()
+        ecs.setMetrics(sink)
+        ecs.ItemLookup('0596009259')
+        self.assertEqual(sink.timings, [('ItemLookup', 'build'), ('ItemLookup', 'network'),
+            ('ItemLookup', 'unmarshal')])
+        self.assertEqual(sink.counts, [('ItemLookup', 'requests', 1),
+            ('ItemLookup', 'bytes', len(fixture('ItemLookup.xml')))])
+
+    def testCache(self):
+        ecs.setCache(ecs.MemoryCache())
+        for i in range(3):
+            ecs.ItemLookup('0596009259')
+        counters = self.recorder.counters
+        self.assertEqual(counters[('ItemLookup', 'cache.misses')], 1)
+        self.assertEqual(counters[('ItemLookup', 'cache.hits')], 2)
+        self.assertEqual(counters[('ItemLookup', 'requests')], 1)
+        self.assertEqual(self.recorder.stats()[('ItemLookup', 'unmarshal')]['count'], 3)
+
+    def testRetry(self):
+        self.server.respond = FlakyResponder(2)
+        ecs.setRetry({'lookup': ecs.RetryPolicy(tries=3, delay=0.01)})
+        ecs.ItemLookup('0596009259')
+        self.assertEqual(self.recorder.counters[('ItemLookup', 'retries')], 2)
+        self.failIf(self.recorder.counters.has_key(('ItemLookup', 'failures')))
+
+    def testDisabled(self):
+        ecs.setMetrics(None)
+        books = ecs.ItemSearch('python', SearchIndex='Books')
+        self.assertEqual(books[20].ASIN, '0596009259')
+        self.assertEqual(books.fetches, 2)
+        self.assertEqual(self.recorder.stats(), {})
+
+    def testPercentiles(self):
+        recorder = ecs.MetricsRecorder()
+        for i in range(100, 0, -1):
+            recorder.timing('ItemSearch', 'network', i / 1000.0)
+        recorder.timing('ItemSearch', 'build', 0.001)
+        recorder.count('ItemSearch', 'bytes', 2048)
+        network = recorder.stats((50, 90, 99, 100))[('ItemSearch', 'network')]
+        self.assertAlmostEqual(network.pop('mean'), 0.0505)
+        self.assertEqual(network, {'count': 100, 'p50': 0.05, 'p90': 0.09, 'p99': 0.099, 'p100': 0.1})
+        f = StringIO.StringIO()
+        recorder.report(f)
+        lines = f.getvalue().splitlines()
+        self.assertEqual(lines[0].split(), ['operation', 'phase', 'count', 'mean', 'p50', 'p90', 'p99'])
+        self.assertEqual(lines[1].split(), ['ItemSearch', 'build', '1', '1.000', '1.000', '1.000', '1.000'])
+        self.assertEqual(lines[2].split(), ['ItemSearch', 'network', '100', '50.500', '50.000', '90.000', '99.000'])
+        self.assertEqual(lines[3].split(), ['ItemSearch', 'bytes', '2048'])
+        recorder.reset()
+        self.assertEqual((recorder.stats(), recorder.counters), ({}, {}))
+
+    def testSamples(self):
+        recorder = ecs.MetricsRecorder(samples=10)
+        for i in range(1000):
+            recorder.timing('ItemSearch', 'network', 1.0)
+        self.assertEqual(recorder.stats()[('ItemSearch', 'network')]['count'], 1000)
+
+
+if __name__ == "__main__" :
+    unittest.main()
@@ -0,0 +1,108 @@
+import unittest
+import sys, time, gc
+
+# quick-n-dirty for debug only
+sys.path.append('..')
+import ecs
+from tests.standin import StandInServer, fixtureResponder
+
+def test_suite():
+    from unittest import defaultTestLoader as loader
+    return loader.loadTestsFromName("tests.pagediterator")
+
+class PagedIteratorTest(unittest.TestCase):
+
+    def setUp(self):
+        ecs.setLicenseKey('00000000000000000000')
+        ecs.setSecretAccessKey('1234567890')
+        self.server = StandInServer()
+        self.pool = ecs.ConnectionPool(addresses={'ecs.amazonaws.com': self.server.address()})
+        ecs.setConnectionPool(self.pool)
+
+    def tearDown(self):
+        self.pool.clear()
+        ecs.setConnectionPool(None)
+        self.server.stop()
+
+    def pages(self):
+        return [int(arguments.get('ItemPage', 1)) for host, path, arguments in self.server.requests]
+
+    def testCache(self):
+        books = ecs.ItemSearch('python', SearchIndex='Books')
+        for i in (0, 20, 1, 21, 2):
+            self.assertNotEqual(books[i], None)
+        self.assertEqual(self.pages(), [1, 3])
+
+    def testEviction(self):
+        books = ecs.ItemSearch('python', SearchIndex='Books')
+        books.cache(1)
+        for i in (0, 20, 1):
+            self.assertNotEqual(books[i], None)
+        self.assertEqual(self.pages(), [1, 3, 1])
+
+    def testNegativeIndex(self):
+        books = ecs.ItemSearch('python', SearchIndex='Books')
+        self.assertEqual(books[-5].ASIN, books[20].ASIN)
+        self.assertRaises(IndexError, books.__getitem__, -26)
+        self.assertRaises(IndexError, books.__getitem__, 25)
+
+    def testSlice(self):
+        # the fixture has 3 items per page, index the first 3 of each page
+        books = ecs.ItemSearch('python', SearchIndex='Books')
+        books.cache(1)
+        self.assertEqual([b.ASIN for b in books[20:23]], [b.ASIN for b in books[0:3]])
+        self.assertEqual(len(books[::10]), 3)
+        self.assertEqual(self.pages(), [1, 3, 1, 2, 3])
+        self.assertEqual(books[-5:-4][0].ASIN, books[20].ASIN)
+
+    def testPrefetch(self):
+        books = ecs.ItemSearch('python', SearchIndex='Books')
+        books.prefetch(2)
+        time.sleep(0.2)
+        # page 1 is the current page, pages 2 and 3 are read ahead
+        self.assertEqual(sorted(self.pages()), [1, 2, 3])
+        self.assertEqual(books[10].ASIN, '0596009259')
+        time.sleep(0.2)
+        self.assertEqual(sorted(self.pages()), [1, 2, 3])
+        # the window is bounded by the last page
+        self.assertEqual(books[20].ASIN, '0596009259')
+        self.assertEqual(sorted(self.pages()), [1, 2, 3])
+
+    def testPrefetchError(self):
+        books = ecs.ItemSearch('python', SearchIndex='Books')
+        self.server.respond = lambda path, arguments: fixtureResponder(path, {'Operation': 'Error'})
+        books.prefetch(1)
+        self.assertRaises(ecs.InvalidParameterValue, books.__getitem__, 10)
+
+    def testCancel(self):
+        def slow(path, arguments):
+            time.sleep(0.2)
+            return fixtureResponder(path, arguments)
+        books = ecs.ItemSearch('python', SearchIndex='Books')
+        self.server.respond = slow
+        books.prefetch(1)
+        prefetcher = books._pagedIterator__prefetcher
+        del books
+        gc.collect()
+        self.assert_(prefetcher.cancelled.isSet())
+
+    def testForgotten(self):
+        def slow(path, arguments):
+            time.sleep(0.2)
+            return fixtureResponder(path, arguments)
+        self.server.respond = slow
+        owner = PagedIteratorTest('testForgotten')
+        prefetcher = ecs.pagePrefetcher(owner, ecs.XMLItemSearch, {'Keywords': 'python', 'SearchIndex': 'Books'},
+            'Items', 'ItemPage', ecs.getPlugins('ItemSearch'), 2)
+        prefetcher.schedule(1, 10)
+        time.sleep(0.1)
+        # pages 1 and 2 are requested, 3 and 4 wait for a thread
+        prefetcher.schedule(3, 10)
+        prefetcher.schedule(5, 10)
+        self.assertEqual(len(prefetcher.get(5)), 3)
+        self.assertEqual(len(prefetcher.get(6)), 3)
+        self.assertEqual(sorted(self.pages()), [1, 2, 5, 6])
+
+
+if __name__ == "__main__" :
+    unittest.main()
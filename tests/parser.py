@@ -0,0 +1,110 @@
+import unittest
+import sys
+
+# quick-n-dirty for debug only
+sys.path.append('..')
+import ecs
+from tests.standin import StandInServer, fixtureResponder
+
+def test_suite():
+    from unittest import defaultTestLoader as loader
+    return loader.loadTestsFromName("tests.parser")
+
+def flatten(o):
+    """Plain python structure of an unmarshalled object"""
+    if isinstance(o, ecs.pagedIterator):
+        return ('paged', len(o), flatten(o._pagedIterator__pages))
+    if isinstance(o, ecs.listIterator):
+        return ('list', [flatten(x) for x in o], flatten(vars(o)))
+    if isinstance(o, list):
+        return [flatten(x) for x in o]
+    if isinstance(o, dict):
+        return dict([(k, flatten(v)) for k, v in o.items()])
+    if isinstance(o, (ecs.Bag, ecs.Record, ecs.LazyBag)):
+        return ('bag', flatten(vars(o)))
+    return o
+
+class ParserTest(unittest.TestCase):
+
+    def setUp(self):
+        ecs.setLicenseKey('00000000000000000000')
+        ecs.setSecretAccessKey('1234567890')
+        self.server = StandInServer()
+        self.pool = ecs.ConnectionPool(addresses={'ecs.amazonaws.com': self.server.address()})
+        ecs.setConnectionPool(self.pool)
+
+    def tearDown(self):
+        ecs.setParser('minidom')
+        self.pool.clear()
+        ecs.setConnectionPool(None)
+        self.server.stop()
+
+    def both(self, operation, *args, **kwargs):
+        ecs.setParser('minidom')
+        dom = flatten(operation(*args, **kwargs))
+        ecs.setParser('expat')
+        stream = flatten(operation(*args, **kwargs))
+        return dom, stream
+
+    def testBadParser(self):
+        self.assertRaises(ecs.BadOption, ecs.setParser, 'sax')
+
+    def testItemSearch(self):
+        dom, stream = self.both(ecs.ItemSearch, 'python', SearchIndex='Books', ResponseGroup='Large')
+        self.assertEqual(dom[1], 25)
+        self.assertEqual(dom, stream)
+
+    def testItemLookup(self):
+        dom, stream = self.both(ecs.ItemLookup, '0596009259')
+        self.assertEqual(dom, stream)
+
+    def testBrowseNodeLookup(self):
+        dom, stream = self.both(ecs.BrowseNodeLookup, '3952')
+        self.assertEqual(dom, stream)
+
+    def testCart(self):
+        book = ecs.Bag()
+        book.ASIN = '0596009259'
+        dom, stream = self.both(ecs.CartCreate, [book], [1])
+        self.assertEqual(dom, stream)
+
+    def testStreamItems(self):
+        ecs.setParser('expat')
+        books = ecs.ItemSearch('python', SearchIndex='Books', ResponseGroup='Large')
+        book = books[0]
+        self.assertEqual(book.Title, 'Programming Python')
+        self.assertEqual(book.OfferSummary.LowestNewPrice.Amount, '3299')
+        self.assertEqual(len(book.EditorialReviews), 2)
+        self.assertEqual(book.BrowseNodes[0].Ancestors[0].Name, 'Programming')
+        self.assertEqual(len(book.CustomerReviews), 68)
+        self.assertEqual(book.Offers[0].Merchant.MerchantId, 'ATVPDKIKX0DER')
+
+    def testStreamPaging(self):
+        ecs.setParser('expat')
+        books = ecs.ItemSearch('python', SearchIndex='Books', ResponseGroup='Large')
+        self.assertEqual(books[10].ASIN, '0596009259')
+        self.assertEqual(self.server.requests[-1][2]['ItemPage'], '2')
+
+    def testDispatch(self):
+        body = ('<R><Items><Item><A>1</A><A>2</A><A>3</A><Request>x</Request>'
+            '<ItemAttributes><Title>T</Title></ItemAttributes></Item></Items></R>')
+        plugins = {'isBypassed': ('Request',), 'isPivoted': ('ItemAttributes',),
+            'isCollective': ('Items',), 'isCollected': ('Item',), 'isPaged': {}}
+        element = ecs.minidom.parseString(body).getElementsByTagName('Items').item(0)
+        dom = ecs.unmarshal(None, {}, element, plugins, ecs.listIterator())
+        stream = ecs.streamUnmarshal(None, {}, body, 'Items', plugins, ecs.listIterator())
+        for items in (dom, stream):
+            self.assertEqual(items[0].A, ['1', '2', '3'])
+            self.assertEqual(items[0].Title, 'T')
+            self.failIf(hasattr(items[0], 'Request'))
+            self.failIf(hasattr(items[0], 'ItemAttributes'))
+
+    def testError(self):
+        self.server.respond = lambda path, arguments: (200, fixtureResponder(path, {'Operation': 'Error'})[1])
+        for parser in ('minidom', 'expat'):
+            ecs.setParser(parser)
+            self.assertRaises(ecs.InvalidParameterValue, ecs.ItemLookup, 'XXXXXXXXXX')
+
+
+if __name__ == "__main__" :
+    unittest.main()
@@ -0,0 +1,113 @@
+import unittest
+import sys, time, socket, httplib
+
+# quick-n-dirty for debug only
+sys.path.append('..')
+import ecs
+from tests.standin import StandInServer, fixtureResponder
+
+def test_suite():
+    from unittest import defaultTestLoader as loader
+    return loader.loadTestsFromName("tests.pool")
+
+class ConnectionPoolTest(unittest.TestCase):
+
+    def setUp(self):
+        ecs.setLicenseKey('00000000000000000000')
+        ecs.setSecretAccessKey('1234567890')
+        self.server = StandInServer()
+        self.pool = ecs.ConnectionPool(addresses={'ecs.amazonaws.com': self.server.address()})
+        ecs.setConnectionPool(self.pool)
+
+    def tearDown(self):
+        self.pool.clear()
+        ecs.setConnectionPool(None)
+        self.server.stop()
+
+    def testKeepAlive(self):
+        for i in range(3):
+            books = ecs.ItemLookup('0596009259')
+            self.assertEqual(books[0].Title, 'Programming Python')
+        self.assertEqual(self.server.connections, 1)
+        self.assertEqual(len(self.server.requests), 3)
+
+    def testHostHeader(self):
+        ecs.XMLItemLookup('0596009259')
+        host, path, arguments = self.server.requests[0]
+        self.assertEqual(host, 'ecs.amazonaws.com')
+        self.assertEqual(path, '/onca/xml')
+        self.assertEqual(arguments['ItemId'], '0596009259')
+
+    def testIdleTimeout(self):
+        self.pool.idle = 0
+        ecs.XMLItemLookup('0596009259')
+        ecs.XMLItemLookup('0596009259')
+        self.assertEqual(self.server.connections, 2)
+
+    def testServerClosedConnection(self):
+        ecs.XMLItemLookup('0596009259')
+        # close the idle connection behind the pool's back
+        self.server.drop()
+        time.sleep(0.1)
+        ecs.XMLItemLookup('0596009259')
+        self.assertEqual(self.server.connections, 2)
+
+    def dropping(self, calls):
+        """A responder closing the connection without a response on the
+        `calls`th request"""
+        count = [0]
+        def respond(path, arguments):
+            count[0] += 1
+            if count[0] == calls:
+                raise socket.error('dropped')
+            return fixtureResponder(path, arguments)
+        return respond
+
+    def testDroppedBeforeResponse(self):
+        self.server.respond = self.dropping(2)
+        ecs.XMLItemLookup('0596009259')
+        ecs.XMLItemLookup('0596009259')
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(self.server.connections, 2)
+
+    def testMutationNotResent(self):
+        self.server.respond = self.dropping(2)
+        url = ecs.buildRequest({'Operation': 'CartCreate', 'Item.1.ASIN': '0596009259', 'Item.1.Quantity': '1'})
+        self.assertEqual(self.pool.urlopen(url)[0], 200)
+        self.assertRaises(Exception, self.pool.urlopen, url)
+        self.assertEqual(len(self.server.requests), 2)
+
+    def testCartMutationNotResent(self):
+        book = ecs.Bag()
+        book.ASIN = '0596009259'
+        self.server.respond = self.dropping(2)
+        ecs.XMLItemLookup('0596009259')
+        self.assertRaises(httplib.BadStatusLine, ecs.XMLCartCreate, [book], [1])
+        self.assertEqual(len(self.server.requests), 2)
+        # unless the caller says the mutation can be sent again
+        self.server.respond = self.dropping(2)
+        ecs.XMLItemLookup('0596009259')
+        ecs.idempotent(ecs.XMLCartCreate, [book], [1])
+        self.assertEqual(len(self.server.requests), 5)
+
+    def testTimeoutNotResent(self):
+        def slow(path, arguments):
+            if len(self.server.requests) == 2:
+                time.sleep(1)
+            return fixtureResponder(path, arguments)
+        self.server.respond = slow
+        self.pool.timeout = 0.5
+        ecs.XMLItemLookup('0596009259')
+        self.assertRaises(socket.timeout, ecs.XMLItemLookup, '0596009259')
+        time.sleep(0.2)
+        self.assertEqual(len(self.server.requests), 2)
+
+    def testMaxSize(self):
+        self.pool.maxsize = 0
+        ecs.XMLItemLookup('0596009259')
+        ecs.XMLItemLookup('0596009259')
+        self.assertEqual(self.server.connections, 2)
+
+
+if __name__ == "__main__" :
+    unittest.main()
@@ -0,0 +1,83 @@
+import unittest
+import sys
+
+# quick-n-dirty for debug only
+sys.path.append('..')
+import ecs
+from tests.standin import StandInServer, fixture
+
+def test_suite():
+    from unittest import defaultTestLoader as loader
+    return loader.loadTestsFromName("tests.projection")
+
+PATHS = ['ASIN', 'Title', 'SalesRank', 'OfferSummary.LowestNewPrice.Amount', 'EditorialReviews.Source',
+    'CustomerReviews.Rating', 'Offers.OfferListing.Price.Amount', 'BrowseNodes.Name',
+    'OfferSummary.LowestNewPrice', 'Unknown.Path']
+
+class ProjectionTest(unittest.TestCase):
+
+    def setUp(self):
+        ecs.setLicenseKey('00000000000000000000')
+        ecs.setSecretAccessKey('1234567890')
+        self.server = StandInServer()
+        self.pool = ecs.ConnectionPool(addresses={'ecs.amazonaws.com': self.server.address()})
+        ecs.setConnectionPool(self.pool)
+
+    def tearDown(self):
+        ecs.setParser('minidom')
+        ecs.setLazy(False)
+        self.pool.clear()
+        ecs.setConnectionPool(None)
+        self.server.stop()
+
+    def check(self, book):
+        self.assert_(isinstance(book, ecs.Record))
+        self.assertEqual(book.__slots__, ('ASIN', 'Title', 'SalesRank', 'OfferSummary_LowestNewPrice_Amount',
+            'EditorialReviews_Source', 'CustomerReviews_Rating', 'Offers_OfferListing_Price_Amount',
+            'BrowseNodes_Name', 'OfferSummary_LowestNewPrice', 'Unknown_Path'))
+        self.assertEqual(book.ASIN, '0596009259')
+        self.assertEqual(book.Title, 'Programming Python')
+        self.assertEqual(book.SalesRank, '1607')
+        self.assertEqual(book.OfferSummary_LowestNewPrice_Amount, '3299')
+        self.assertEqual(book.EditorialReviews_Source, ['Amazon.com', 'Book Description'])
+        self.assertEqual(book.CustomerReviews_Rating, ['5', '4', '3'])
+        self.assertEqual(book.Offers_OfferListing_Price_Amount, '3299')
+        self.assertEqual(book.BrowseNodes_Name, ['Python', 'Object-Oriented Design'])
+        self.assertEqual(vars(book.OfferSummary_LowestNewPrice),
+            {'Amount': '3299', 'CurrencyCode': 'USD', 'FormattedPrice': '$32.99'})
+        self.assertEqual(book.Unknown_Path, None)
+
+    def testItemSearch(self):
+        for parser in ('minidom', 'expat'):
+            ecs.setParser(parser)
+            books = ecs.ItemSearch('python', SearchIndex='Books', ResponseGroup='Large', projection=PATHS)
+            self.assertEqual(len(books), 25)
+            self.check(books[0])
+            self.check(books[10])
+        self.failIf(self.server.requests[0][2].has_key('projection'))
+
+    def testItemLookup(self):
+        # the Large items of the ItemSearch response
+        self.server.respond = lambda path, arguments: (200, fixture('ItemSearch.xml'))
+        for parser in ('minidom', 'expat'):
+            ecs.setParser(parser)
+            self.check(ecs.ItemLookup('0596009259', ResponseGroup='Large', projection=PATHS)[0])
+        ecs.setLazy()
+        self.check(ecs.ItemLookup('0596009259', ResponseGroup='Large', projection=PATHS)[0])
+
+    def testUnmarshal(self):
+        item = ecs.minidom.parseString(fixture('ItemSearch.xml')).getElementsByTagName('Item').item(0)
+        plugins = ecs.getPlugins('ItemLookup')
+        self.check(ecs.unmarshal(ecs.XMLItemLookup, {}, item, plugins, projection=PATHS))
+        self.check(ecs.streamUnmarshal(ecs.XMLItemLookup, {}, fixture('ItemSearch.xml'), 'Item',
+            ecs.getPlugins('ItemLookup', PATHS)))
+        self.failIf(plugins.has_key('projection'))
+        self.assert_(ecs.getPlugins('ItemLookup', PATHS) is ecs.getPlugins('ItemLookup', PATHS))
+
+    def testBadPath(self):
+        self.assertRaises(ecs.BadOption, ecs.Projection, ['Offer-Summary'])
+        self.assertRaises(ecs.BadOption, ecs.Projection, ['ASIN', ''])
+
+
+if __name__ == "__main__" :
+    unittest.main()
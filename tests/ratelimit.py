@@ -0,0 +1,124 @@
+import unittest
+import sys, os, time, threading, tempfile
+
+# quick-n-dirty for debug only
+sys.path.append('..')
+import ecs, aio
+from tests.standin import StandInServer
+
+def test_suite():
+    from unittest import defaultTestLoader as loader
+    return loader.loadTestsFromName("tests.ratelimit")
+
+def url(operation='ItemLookup', key='00000000000000000000', host='ecs.amazonaws.com'):
+    return 'http://%s/onca/xml?AWSAccessKeyId=%s&Operation=%s' % (host, key, operation)
+
+class RateLimiterTest(unittest.TestCase):
+
+    def testBurst(self):
+        limiter = ecs.RateLimiter(20, 2)
+        start = time.time()
+        for i in range(6):
+            limiter.acquire(url())
+        elapsed = time.time() - start
+        self.assert_(0.18 < elapsed < 0.5, elapsed)
+        stats = limiter.stats()
+        self.assertEqual(stats['requests'], 6)
+        self.assertEqual(stats['delayed'], 4)
+        self.assert_(stats['maxDelay'] > 0.03)
+        self.assertEqual(stats['priorities'][1]['requests'], 6)
+
+    def testBudgets(self):
+        limiter = ecs.RateLimiter(1, 1, budgets={'other': (1, 3), 'ecs.amazonaws.co.uk': (1, 2)})
+        self.assertEqual(limiter.reserve(url()), 0)
+        self.assert_(limiter.reserve(url()) > 0.9)
+        for i in range(3):
+            self.assertEqual(limiter.reserve(url(key='other')), 0)
+        for i in range(2):
+            self.assertEqual(limiter.reserve(url(host='ecs.amazonaws.co.uk')), 0)
+        self.assertEqual(limiter.budget('other', 'ecs.amazonaws.co.uk'), (1, 3))
+
+    def testReserve(self):
+        limiter = ecs.RateLimiter(10, 1)
+        delays = [limiter.reserve(url()) for i in range(4)]
+        self.assertEqual(delays[0], 0)
+        for a, b in zip(delays, delays[1:]):
+            self.assert_(0.05 < b - a <= 0.1 + 1e-6, b - a)
+
+    def testPriorities(self):
+        limiter = ecs.RateLimiter(5, 1)
+        limiter.acquire(url())
+        order = []
+        def request(operation):
+            limiter.acquire(url(operation))
+            order.append(operation)
+        search = threading.Thread(target=request, args=('ItemSearch',))
+        search.start()
+        time.sleep(0.05)
+        cart = threading.Thread(target=request, args=('CartAdd',))
+        cart.start()
+        search.join()
+        cart.join()
+        self.assertEqual(order, ['CartAdd', 'ItemSearch'])
+
+    def testSharedFile(self):
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            one = ecs.RateLimiter(10, 2, path=path)
+            other = ecs.RateLimiter(10, 2, path=path)
+            self.assertEqual(one.reserve(url()), 0)
+            self.assertEqual(other.reserve(url()), 0)
+            self.assert_(one.reserve(url()) > 0.05)
+        finally:
+            os.remove(path)
+
+
+class LimitedQueryTest(unittest.TestCase):
+
+    def setUp(self):
+        ecs.setLicenseKey('00000000000000000000')
+        ecs.setSecretAccessKey('1234567890')
+        self.server = StandInServer()
+        self.pool = ecs.ConnectionPool(addresses={'ecs.amazonaws.com': self.server.address()})
+        ecs.setConnectionPool(self.pool)
+        self.limiter = ecs.RateLimiter(20, 1)
+        ecs.setRateLimiter(self.limiter)
+
+    def tearDown(self):
+        ecs.setRateLimiter(None)
+        self.pool.clear()
+        ecs.setConnectionPool(None)
+        self.server.stop()
+
+    def testQuery(self):
+        start = time.time()
+        for i in range(3):
+            ecs.ItemLookup('0596009259')
+        self.assert_(time.time() - start > 0.09)
+        self.assertEqual(self.limiter.requests, 3)
+
+    def testCacheHits(self):
+        ecs.setCache(ecs.MemoryCache())
+        try:
+            for i in range(3):
+                ecs.ItemLookup('0596009259')
+        finally:
+            ecs.setCache(None)
+        self.assertEqual(self.limiter.requests, 1)
+
+    def testLoop(self):
+        loop = aio.Loop(addresses={'ecs.amazonaws.com': self.server.address()})
+        try:
+            start = time.time()
+            futures = [loop.call(ecs.ItemLookup, '0596009259') for i in range(3)]
+            for future in futures:
+                self.assertEqual(future.result(5)[0].ASIN, '0596009259')
+            self.assert_(time.time() - start > 0.09)
+            self.assertEqual(self.limiter.requests, 3)
+        finally:
+            loop.stop()
+
+
+if __name__ == "__main__" :
+    unittest.main()
@@ -0,0 +1,70 @@
+import unittest
+import sys, StringIO, cStringIO
+
+# quick-n-dirty for debug only
+sys.path.append('..')
+import ecs
+from tests.standin import StandInServer, fixture
+
+def test_suite():
+    from unittest import defaultTestLoader as loader
+    return loader.loadTestsFromName("tests.rawbody")
+
+class RawBodyTest(unittest.TestCase):
+
+    def setUp(self):
+        ecs.setLicenseKey('00000000000000000000')
+        ecs.setSecretAccessKey('1234567890')
+        self.server = StandInServer()
+        self.pool = ecs.ConnectionPool(addresses={'ecs.amazonaws.com': self.server.address()})
+        ecs.setConnectionPool(self.pool)
+
+    def tearDown(self):
+        ecs.setMetrics(None)
+        ecs.setCache(None)
+        self.pool.clear()
+        ecs.setConnectionPool(None)
+        self.server.stop()
+
+    def testBody(self):
+        recorder = ecs.MetricsRecorder()
+        ecs.setMetrics(recorder)
+        body = ecs.rawBody(ecs.XMLItemSearch, {'Keywords': 'python', 'SearchIndex': 'Books'})
+        self.assertEqual(body, fixture('ItemSearch.xml'))
+        self.assertEqual(sorted(recorder.stats().keys()), [('ItemSearch', 'build'), ('ItemSearch', 'network')])
+        self.assertEqual(self.server.requests[0][2]['Operation'], 'ItemSearch')
+
+    def testSink(self):
+        for sink in (StringIO.StringIO(), cStringIO.StringIO()):
+            self.assertEqual(ecs.rawBody(ecs.XMLItemLookup, {'ItemId': '0596009259'}, sink, chunkSize=100),
+                len(fixture('ItemLookup.xml')))
+            self.assertEqual(sink.getvalue(), fixture('ItemLookup.xml'))
+
+    def testError(self):
+        self.server.respond = lambda path, arguments: (200, fixture('Error.xml'))
+        self.assertRaises(ecs.InvalidParameterValue, ecs.rawBody, ecs.XMLItemLookup, {'ItemId': 'XXXXXXXXXX'})
+        errors = []
+        body = ecs.rawBody(ecs.XMLItemLookup, {'ItemId': 'XXXXXXXXXX'}, errors=errors)
+        self.assertEqual(body, fixture('Error.xml'))
+        self.assertEqual(len(errors), 1)
+        self.assert_(isinstance(errors[0], ecs.InvalidParameterValue))
+        self.assert_(str(errors[0]).startswith('XXXXXXXXXX is not a valid value for ItemId.'))
+
+    def testServerError(self):
+        self.server.respond = lambda path, arguments: (503, '<html><body>Service Unavailable</body></html>')
+        self.assertRaises(ecs.AWSException, ecs.rawBody, ecs.XMLItemLookup, {'ItemId': '0596009259'})
+        sink = StringIO.StringIO()
+        self.assertRaises(ecs.AWSException, ecs.rawBody, ecs.XMLItemLookup, {'ItemId': '0596009259'}, sink, [])
+        self.assertEqual(sink.getvalue(), '')
+        self.server.respond = lambda path, arguments: (400, fixture('Error.xml'))
+        self.assertRaises(ecs.InvalidParameterValue, ecs.rawBody, ecs.XMLItemLookup, {'ItemId': 'XXXXXXXXXX'}, None, [])
+
+    def testCache(self):
+        ecs.setCache(ecs.MemoryCache())
+        for i in range(2):
+            self.assertEqual(ecs.rawBody(ecs.XMLItemLookup, {'ItemId': '0596009259'}), fixture('ItemLookup.xml'))
+        self.assertEqual(len(self.server.requests), 1)
+
+
+if __name__ == "__main__" :
+    unittest.main()
@@ -0,0 +1,126 @@
+import unittest
+import sys, socket
+
+# quick-n-dirty for debug only
+sys.path.append('..')
+import ecs
+from tests.standin import StandInServer, fixture, fixtureResponder
+
+def test_suite():
+    from unittest import defaultTestLoader as loader
+    return loader.loadTestsFromName("tests.retry")
+
+INTERNAL_ERROR = fixture('Error.xml').replace('AWS.InvalidParameterValue', 'AWS.InternalError')
+
+class FlakyResponder:
+    """Fail the first `failures` requests of each operation"""
+
+    def __init__(self, failures, failure=(503, 'Service Unavailable')):
+        self.failures = failures
+        self.failure = failure
+        self.calls = {}
+
+    def __call__(self, path, arguments):
+        key = (arguments['Operation'], arguments.get('ItemPage'))
+        self.calls[key] = self.calls.get(key, 0) + 1
+        if self.calls[key] <= self.failures:
+            if self.failure is None:
+                raise socket.error('connection reset')
+            return self.failure
+        return fixtureResponder(path, arguments)
+
+
+class RetryPolicyTest(unittest.TestCase):
+
+    def testBackoff(self):
+        policy = ecs.RetryPolicy(delay=1, factor=2, maxDelay=5, jitter=0)
+        self.assertEqual([policy.backoff(n) for n in range(1, 6)], [1, 2, 4, 5, 5])
+        policy.jitter = 0.5
+        for n in range(100):
+            self.assert_(0.5 <= policy.backoff(1) <= 1)
+
+    def testGiveUp(self):
+        policy = ecs.RetryPolicy(tries=3, delay=1, jitter=0, maxElapsed=10)
+        self.assertEqual(policy.retry(1, 0), 1)
+        self.assertEqual(policy.retry(2, 1), 2)
+        self.assertEqual(policy.retry(3, 3), None)
+        self.assertEqual(policy.retry(1, 9.5), None)
+        self.assertEqual(policy.stats(), {'retries': 2, 'failures': 2})
+
+    def testBudget(self):
+        budget = ecs.RetryBudget(ratio=0.5, maximum=2)
+        policy = ecs.RetryPolicy(delay=0, budget=budget)
+        self.assertEqual(policy.retry(1, 0), 0)
+        self.assertEqual(policy.retry(1, 0), 0)
+        self.assertEqual(policy.retry(1, 0), None)
+        budget.deposit()
+        budget.deposit()
+        self.assertEqual(policy.retry(1, 0), 0)
+
+
+class RetryTest(unittest.TestCase):
+
+    def setUp(self):
+        ecs.setLicenseKey('00000000000000000000')
+        ecs.setSecretAccessKey('1234567890')
+        self.server = StandInServer()
+        self.pool = ecs.ConnectionPool(addresses={'ecs.amazonaws.com': self.server.address()})
+        ecs.setConnectionPool(self.pool)
+        self.policy = ecs.RetryPolicy(tries=3, delay=0.01)
+        ecs.setRetry({'lookup': self.policy, 'search': self.policy, 'cart': self.policy})
+
+    def tearDown(self):
+        ecs.setRetry(None)
+        self.pool.clear()
+        ecs.setConnectionPool(None)
+        self.server.stop()
+
+    def testServiceUnavailable(self):
+        self.server.respond = FlakyResponder(2)
+        self.assertEqual(ecs.ItemLookup('0596009259')[0].ASIN, '0596009259')
+        self.assertEqual(self.policy.retries, 2)
+
+    def testInternalError(self):
+        self.server.respond = FlakyResponder(1, (200, INTERNAL_ERROR))
+        self.assertEqual(ecs.ItemLookup('0596009259')[0].ASIN, '0596009259')
+        for parser in ('minidom', 'expat'):
+            ecs.setParser(parser)
+            self.server.respond = FlakyResponder(3, (200, INTERNAL_ERROR))
+            self.assertRaises(ecs.InternalError, ecs.ItemLookup, '0596009259')
+        ecs.setParser('minidom')
+
+    def testSocketError(self):
+        self.server.respond = FlakyResponder(1, None)
+        self.assertEqual(ecs.ItemLookup('0596009259')[0].ASIN, '0596009259')
+        self.server.respond = FlakyResponder(100, None)
+        self.assertRaises((socket.error, ecs.httplib.HTTPException), ecs.ItemLookup, '0596009259')
+
+    def testNotRetried(self):
+        self.server.respond = lambda path, arguments: (200, fixture('Error.xml'))
+        self.assertRaises(ecs.InvalidParameterValue, ecs.ItemLookup, 'XXXXXXXXXX')
+        self.assertEqual(self.policy.retries, 0)
+        ecs.setRetry(None)
+        self.server.respond = FlakyResponder(1)
+        self.assertRaises(Exception, ecs.ItemLookup, '0596009259')
+        self.assertEqual(self.server.respond.calls[('ItemLookup', None)], 1)
+
+    def testCartMutation(self):
+        book = ecs.Bag()
+        book.ASIN = '0596009259'
+        self.server.respond = FlakyResponder(1)
+        self.assertRaises(Exception, ecs.CartCreate, [book], [1])
+        self.assertEqual(self.policy.retries, 0)
+        self.server.respond = FlakyResponder(1)
+        cart = ecs.idempotent(ecs.CartCreate, [book], [1])
+        self.assertEqual(cart.CartId, '102-3232917-9873064')
+        self.assertEqual(self.policy.retries, 1)
+
+    def testPagedIterator(self):
+        books = ecs.ItemSearch('python', SearchIndex='Books', ResponseGroup='Large')
+        self.server.respond = FlakyResponder(2)
+        self.assertEqual(books[10].ASIN, '0596009259')
+        self.assertEqual(self.server.respond.calls[('ItemSearch', '2')], 3)
+
+
+if __name__ == "__main__" :
+    unittest.main()
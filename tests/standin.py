@@ -0,0 +1,94 @@
+"""
+A local stand-in for the ECS web service.
+
+`StandInServer` answers HTTP/1.1 keep-alive requests in a background
+thread, so the tests can exercise `ecs.query` without hitting Amazon.
+"""
+
+import os, sys, threading, urlparse, cgi, socket
+import BaseHTTPServer, SocketServer
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+def fixture(name):
+    """Return the content of tests/fixtures/`name`"""
+    f = open(os.path.join(FIXTURES, name), 'rb')
+    try:
+        return f.read()
+    finally:
+        f.close()
+
+def fixtureResponder(path, arguments):
+    """Serve tests/fixtures/<Operation>.xml"""
+    return 200, fixture(arguments['Operation'] + '.xml')
+
+
+class StandInHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+        # the response is written in pieces, which would otherwise wait
+        # for the delayed ACK of the client
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.server.connections += 1
+        self.server.sockets.append(self.connection)
+
+    def do_GET(self):
+        path, qs = urlparse.urlparse(self.path)[2], urlparse.urlparse(self.path)[4]
+        arguments = dict([(k, v[0]) for k, v in cgi.parse_qs(qs).items()])
+        self.server.requests.append((self.headers.get('Host'), path, arguments))
+        status, body = self.server.respond(path, arguments)
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/xml;charset=UTF-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StandInServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """
+    A threaded HTTP server on 127.0.0.1.
+
+    - `respond`: callable, (path, arguments) => (status, body)
+    - `connections`: the number of TCP connections accepted
+    - `requests`: the list of (Host header, path, arguments) received
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, respond=fixtureResponder):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0), StandInHandler)
+        self.respond = respond
+        self.connections = 0
+        self.requests = []
+        self.sockets = []
+        self.thread = threading.Thread(target=self.serve_forever, args=(0.05,))
+        self.thread.setDaemon(True)
+        self.thread.start()
+
+    def address(self):
+        return self.server_address
+
+    def drop(self):
+        """Close every accepted connection from the server side"""
+        for sock in self.sockets:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+        self.sockets = []
+
+    def handle_error(self, request, client_address):
+        # the connections broken by the tests on purpose are not news
+        if not isinstance(sys.exc_info()[1], socket.error):
+            BaseHTTPServer.HTTPServer.handle_error(self, request, client_address)
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        # no handler thread is left waiting for a request at exit
+        self.drop()